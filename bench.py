@@ -0,0 +1,410 @@
+"""
+Micro-benchmarks del bot del Impostor.
+
+Uso:
+    python bench.py              # todos
+    python bench.py conexiones   # solo uno
+
+No necesitan Telegram: trabajan sobre una base de datos temporal y llaman
+directamente a los helpers de bot.py.
+"""
+
+import asyncio
+import os
+import random
+import sys
+import sqlite3
+import tempfile
+import time
+from contextlib import nullcontext
+
+os.environ.setdefault("ANTHROPIC_API_KEY", "")
+
+import bot
+
+GRUPOS              = 1000
+JUGADORES_POR_GRUPO = 6
+
+
+def _db_sintetica() -> str:
+    """Crea una base nueva con GRUPOS partidas en juego y sus jugadores."""
+    path = os.path.join(tempfile.mkdtemp(prefix="bench_impostor_"), "impostor.db")
+    bot.DB_PATH = path
+    bot._partidas.clear()
+    bot._roles_nuevos.clear()
+    bot._roles_sucios.clear()
+    bot.init_db()
+    conn = sqlite3.connect(path)
+    with conn:
+        for g in range(GRUPOS):
+            chat_key = f"-100{g}"
+            ids = [g * 100 + i for i in range(JUGADORES_POR_GRUPO)]
+            conn.execute(
+                "INSERT INTO partidas (chat_key, chat_id, estado, categoria, palabra, impostor_ids, vivos, ronda, creador_id) "
+                "VALUES (?,?,?,?,?,?,?,?,?)",
+                (chat_key, -100 - g, "jugando", "🐾 Animales", "León", str(ids[0]),
+                 ",".join(map(str, ids)), 1, ids[0])
+            )
+            conn.execute("INSERT INTO config (chat_key, idioma) VALUES (?,?)", (chat_key, "es" if g % 2 else "en"))
+            for uid in ids:
+                conn.execute("INSERT INTO jugadores (chat_key, user_id, username) VALUES (?,?,?)", (chat_key, uid, f"J{uid}"))
+                conn.execute("INSERT INTO partida_jugadores (chat_key, user_id, username) VALUES (?,?,?)", (chat_key, uid, f"J{uid}"))
+                conn.execute("INSERT INTO partida_estado_jugador (chat_key, user_id, rol, vivo) VALUES (?,?,?,1)",
+                             (chat_key, uid, bot.ROL_IMPOSTOR if uid == ids[0] else bot.ROL_INOCENTE))
+    conn.close()
+    return path
+
+
+def _callback_sintetico(chat_key: str, agrupar: bool):
+    """Aproxima el acceso a DB de un callback de juego típico (btn_categoria / fin de partida)."""
+    partida = bot.get_partida(chat_key)
+    for _ in range(3):
+        bot.get_idioma(chat_key)          # t() consulta el idioma en cada texto
+    jugadores = bot.get_jugadores_activos(chat_key)
+    bot.get_vivos(chat_key)
+    categorias = bot.CATEGORIAS["es"]
+    bot.elegir_palabra(chat_key, "🐾 Animales", categorias["🐾 Animales"])
+    with (bot.transaccion() if agrupar else nullcontext()):
+        for j in jugadores:
+            bot.set_vivo(chat_key, j[0], True)
+        for j in jugadores:
+            if str(j[0]) in partida[5].split(","):
+                bot.sumar_vez_impostor(chat_key, j[0])
+            else:
+                bot.sumar_vez_inocente(chat_key, j[0])
+
+
+def _medir_callbacks(agrupar: bool, repeticiones: int = 3) -> float:
+    inicio = time.perf_counter()
+    n = 0
+    for _ in range(repeticiones):
+        for g in range(GRUPOS):
+            _callback_sintetico(f"-100{g}", agrupar)
+            n += 1
+    return n / (time.perf_counter() - inicio)
+
+
+def bench_conexiones():
+    """Callbacks/segundo: una conexión nueva por helper (antes) vs pool persistente (ahora)."""
+    originales = (bot.get_conn, bot.get_conn_lectura)
+
+    _db_sintetica()
+    bot.get_conn = bot.get_conn_lectura = lambda: sqlite3.connect(bot.DB_PATH)
+    try:
+        antes = _medir_callbacks(agrupar=False)
+    finally:
+        bot.get_conn, bot.get_conn_lectura = originales
+
+    _db_sintetica()
+    ahora = _medir_callbacks(agrupar=True)
+    bot.cerrar_db()
+
+    print(f"[conexiones] {GRUPOS} grupos")
+    print(f"  conexión por llamada : {antes:8.0f} callbacks/s")
+    print(f"  pool + WAL + batch   : {ahora:8.0f} callbacks/s  (x{ahora / antes:.1f})")
+
+
+# ── Latencia con partidas concurrentes ──
+PARTIDAS_CONCURRENTES = 50
+INTERVALO_MEDIO_MS    = 400     # cada partida genera un callback cada ~400 ms
+DURACION_SEGUNDOS     = 5
+
+
+async def _callback_async(chat_key: str, modo: str):
+    """Mismo acceso a DB que _callback_sintetico, en versión handler."""
+    if modo == "db":
+        llamar = bot.db
+    else:
+        async def llamar(fn, *args):
+            return fn(*args)
+    partida = await llamar(bot.get_partida, chat_key)
+    for _ in range(3):
+        bot.get_idioma(chat_key)
+    jugadores = await llamar(bot.get_jugadores_activos, chat_key)
+    await llamar(bot.get_vivos, chat_key)
+    await llamar(bot.elegir_palabra, chat_key, "🐾 Animales", bot.CATEGORIAS["es"]["🐾 Animales"])
+    for j in jugadores:
+        await llamar(bot.set_vivo, chat_key, j[0], True)
+    impostores = partida[5].split(",")
+    if modo == "db":
+        await llamar(bot.sumar_contadores, chat_key, {
+            j[0]: {"veces_impostor" if str(j[0]) in impostores else "veces_inocente": 1}
+            for j in jugadores
+        })
+    else:
+        for j in jugadores:
+            if str(j[0]) in impostores:
+                bot.sumar_vez_impostor(chat_key, j[0])
+            else:
+                bot.sumar_vez_inocente(chat_key, j[0])
+
+
+async def _simular_partidas(modo: str) -> list:
+    latencias = []
+    fin = time.perf_counter() + DURACION_SEGUNDOS
+
+    async def partida(g):
+        chat_key = f"-100{g}"
+        llegada = time.perf_counter()
+        while llegada < fin:
+            llegada += random.expovariate(1000 / INTERVALO_MEDIO_MS)
+            await asyncio.sleep(max(0, llegada - time.perf_counter()))
+            # La latencia cuenta desde que "llegó" el update, no desde que el loop lo atendió
+            await _callback_async(chat_key, modo)
+            latencias.append(time.perf_counter() - llegada)
+
+    await asyncio.gather(*(partida(g) for g in range(PARTIDAS_CONCURRENTES)))
+    return latencias
+
+
+def _percentil(valores: list, p: float) -> float:
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p))]
+
+
+def bench_latencia():
+    """p50/p99 de latencia de callback con PARTIDAS_CONCURRENTES partidas a la vez."""
+    originales = (bot.get_conn, bot.get_conn_lectura)
+    resultados = []
+
+    _db_sintetica()
+    bot.get_conn = bot.get_conn_lectura = lambda: sqlite3.connect(bot.DB_PATH)
+    try:
+        resultados.append(("conexión por llamada, en el loop", asyncio.run(_simular_partidas("loop"))))
+    finally:
+        bot.get_conn, bot.get_conn_lectura = originales
+
+    _db_sintetica()
+    resultados.append(("pool, en el loop", asyncio.run(_simular_partidas("loop"))))
+    _db_sintetica()
+    resultados.append(("pool + await db()", asyncio.run(_simular_partidas("db"))))
+    bot.cerrar_db()
+
+    print(f"[latencia] {PARTIDAS_CONCURRENTES} partidas concurrentes, {DURACION_SEGUNDOS}s")
+    for nombre, lat in resultados:
+        print(f"  {nombre:<34}: p50 {_percentil(lat, .5) * 1000:7.1f} ms   "
+              f"p99 {_percentil(lat, .99) * 1000:7.1f} ms   ({len(lat)} callbacks)")
+
+
+# ── Plantillas de texto ──
+def _esc_antiguo(text):
+    chars = r"\_*[]()~`>#+-=|{}.!"
+    return "".join(f"\\{c}" if c in chars else c for c in str(text))
+
+
+def _ns_por_llamada(fn, n: int) -> float:
+    mejor = float("inf")
+    for _ in range(5):
+        inicio = time.perf_counter()
+        for _ in range(n):
+            fn()
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor / n * 1e9
+
+
+def bench_plantillas(n: int = 50_000):
+    """Mensajes más frecuentes: t().format() + esc por carácter vs tf() + esc con translate."""
+    _db_sintetica()
+    chat_key = "-1000"
+    for nombre in ("Pedro Pérez", "María_José (la.mejor)!"):
+        _bench_plantillas_nombre(chat_key, nombre, n)
+    bot.cerrar_db()
+
+
+def _bench_plantillas_nombre(chat_key: str, nombre: str, n: int):
+    detalle  = "\n".join(f"  • {_esc_antiguo('Jugador ' + str(i))} → {_esc_antiguo(nombre)}" for i in range(6))
+    casos = {
+        "turno": (
+            lambda: bot.t(chat_key, "turno").format(nombre=_esc_antiguo(nombre), uid=123456),
+            lambda: bot.tf(chat_key, "turno", nombre=bot.esc_link(nombre), uid=123456),
+        ),
+        "voto_confirmado": (
+            lambda: bot.t(chat_key, "voto_confirmado").format(nombre=_esc_antiguo(nombre), faltantes=""),
+            lambda: bot.tf(chat_key, "voto_confirmado", nombre=bot.esc(nombre), faltantes=""),
+        ),
+        "resultado_votacion": (
+            lambda: bot.t(chat_key, "resultado_votacion").format(
+                nombre=_esc_antiguo(nombre), etiqueta="x", detalle=detalle),
+            lambda: bot.tf(chat_key, "resultado_votacion",
+                           nombre=bot.esc(nombre), etiqueta="x", detalle=detalle),
+        ),
+    }
+    print(f"[plantillas] nombre={nombre!r}")
+    for clave, (antes, ahora) in casos.items():
+        assert antes() == ahora()
+        t_antes, t_ahora = _ns_por_llamada(antes, n), _ns_por_llamada(ahora, n)
+        print(f"  {clave:<20}: {t_antes:6.0f} ns → {t_ahora:6.0f} ns  (x{t_antes / t_ahora:.1f})")
+
+
+# ── Render de nombres ──
+def _draw_text_smart_antiguo(draw, pos, text, size, fill):
+    """draw_text_smart antes de los runs: búsqueda de fuente y textbbox por carácter."""
+    UNIFONT_NATIVE = 16
+    x, y = pos
+    unifont_set = {bot._FONT_UNIFONT, bot._FONT_UNIFONT_SYS}
+    vectorial_paths = [p for p in bot._RENDER_FONT_PRIORITY
+                       if p and p not in unifont_set and p not in bot._BAD_FONTS
+                       and os.path.exists(p) and os.path.getsize(p) > 10_000]
+    for char in text:
+        if char == " ":
+            x += size // 3
+            continue
+        cp = ord(char)
+        drawn = False
+        for path in vectorial_paths:
+            if cp in bot._font_cmaps.get(path, set()):
+                f = bot._load(path, size)
+                if f:
+                    draw.text((x, y), char, font=f, fill=fill)
+                    bb = draw.textbbox((0, 0), char, font=f)
+                    x += max(bb[2] - bb[0], 4)
+                    drawn = True
+                    break
+        if drawn:
+            continue
+        for uni_path in bot._UNIFONT_PATHS:
+            if cp in bot._font_cmaps.get(uni_path, set()):
+                f = bot._load(uni_path, UNIFONT_NATIVE)
+                if f:
+                    draw.text((x, y + (size - UNIFONT_NATIVE) // 2), char, font=f, fill=fill)
+                    bb = draw.textbbox((0, 0), char, font=f)
+                    x += int(max(bb[2] - bb[0], 4) * size / UNIFONT_NATIVE * 0.75)
+                    drawn = True
+                    break
+        if not drawn:
+            x += size // 2
+    return x
+
+
+def bench_marcador(filas: int = 60, repeticiones: int = 20):
+    """Tiempo de _dibujar_marcador con un marcador de `filas` jugadores."""
+    _db_sintetica()
+    nombres = ["Pedro", "María José", "Ωmega", "Кирилл", "𝓩𝓮𝓷𝓲𝓽𝓱", "민준", "ᚱᚢᚾᛖ", "Zoë_99"]
+    jugadores = [(i, f"{nombres[i % len(nombres)]}{i}", 50 - i, i % 7) for i in range(filas)]
+    bot.draw_text_smart(bot.ImageDraw.Draw(bot.Image.new("RGB", (10, 10))), (0, 0), "x", 22, 0)  # cmaps
+
+    original = bot.draw_text_smart
+    lienzo = bot.ImageDraw.Draw(bot.Image.new("RGB", (300, 40 * filas)))
+    limpios = [bot.limpiar_nombre_tabla(j[1])[:14] for j in jugadores]
+    tiempos = {}
+    for nombre, fn in (("char a char", _draw_text_smart_antiguo), ("runs + cache", original)):
+        def solo_nombres():
+            for i, n in enumerate(limpios):
+                fn(lienzo, (10, i * 40), n, 22, (255, 255, 255))
+        bot.draw_text_smart = fn
+        try:
+            bot._dibujar_marcador("es", jugadores)
+            inicio = time.perf_counter()
+            for _ in range(repeticiones):
+                bot._dibujar_marcador("es", jugadores)
+            imagen_ms = (time.perf_counter() - inicio) / repeticiones * 1000
+            inicio = time.perf_counter()
+            for _ in range(repeticiones):
+                solo_nombres()
+            nombres_ms = (time.perf_counter() - inicio) / repeticiones * 1000
+            tiempos[nombre] = (nombres_ms, imagen_ms)
+        finally:
+            bot.draw_text_smart = original
+    bot.cerrar_db()
+
+    print(f"[marcador] {filas} filas")
+    for nombre, (nombres_ms, imagen_ms) in tiempos.items():
+        print(f"  {nombre:<14}: nombres {nombres_ms:6.1f} ms   imagen completa {imagen_ms:6.1f} ms")
+
+
+def bench_render(comandos: int = 24, filas: int = 40):
+    """Máxima pausa del event loop mientras se atiende una ráfaga de /score:
+    render en el loop (antes) vs en el pool de procesos."""
+    _db_sintetica()
+    jugadores = [(i, f"Jugador {i}", 50 - i, i % 7) for i in range(filas)]
+
+    async def rafaga(render):
+        pausa_max, fin = 0.0, False
+
+        async def latido():
+            nonlocal pausa_max
+            while not fin:
+                antes = time.perf_counter()
+                await asyncio.sleep(0.001)
+                pausa_max = max(pausa_max, time.perf_counter() - antes - 0.001)
+
+        tarea = asyncio.create_task(latido())
+        inicio = time.perf_counter()
+        await asyncio.gather(*(render() for _ in range(comandos)))
+        total = time.perf_counter() - inicio
+        fin = True
+        await tarea
+        return pausa_max * 1000, total * 1000
+
+    async def en_loop():
+        bot._dibujar_marcador("es", jugadores)
+
+    async def en_pool():
+        await bot.render_marcador("-1000", jugadores)
+
+    async def main():
+        await bot.render_marcador("-1000", jugadores)   # arrancar workers
+        return {"en el loop": await rafaga(en_loop), "pool": await rafaga(en_pool)}
+
+    bot.RENDER_MAX_EN_COLA = comandos
+    bot._fuentes_listas = True      # sin _post_init: fuentes ya en disco
+    resultados = asyncio.run(main())
+    bot.cerrar_render()
+    bot.cerrar_db()
+
+    print(f"[render] {comandos} /score simultáneos, {filas} filas, {bot.RENDER_WORKERS} workers")
+    for nombre, (pausa, total) in resultados.items():
+        print(f"  {nombre:<11}: pausa máx. del loop {pausa:7.1f} ms   total {total:7.1f} ms")
+
+
+def _lecturas_sql(chat_key: str):
+    """get_partida + get_vivos + get_jugadores_activos tal como eran antes del registro."""
+    with bot.get_conn_lectura() as conn:
+        conn.execute("SELECT * FROM partidas WHERE chat_key=?", (chat_key,)).fetchone()
+    with bot.get_conn_lectura() as conn:
+        row = conn.execute("SELECT vivos FROM partidas WHERE chat_key=?", (chat_key,)).fetchone()
+    [int(i) for i in row[0].split(",")]
+    with bot.get_conn_lectura() as conn:
+        conn.execute("SELECT user_id, username FROM partida_jugadores WHERE chat_key=?", (chat_key,)).fetchall()
+
+
+def bench_estado(n: int = 20_000):
+    """Lecturas de estado por callback (btn_voto y compañía): SQL vs EstadoPartida."""
+    _db_sintetica()
+    claves = [f"-100{g}" for g in range(GRUPOS)]
+
+    def sql():
+        for chat_key in claves:
+            _lecturas_sql(chat_key)
+
+    def registro():
+        for chat_key in claves:
+            bot.get_partida(chat_key)
+            bot.get_vivos(chat_key)
+            bot.get_jugadores_activos(chat_key)
+
+    registro()   # primera carga desde la DB
+    veces = max(1, n // GRUPOS)
+    antes = _ns_por_llamada(sql, veces) / GRUPOS
+    ahora = _ns_por_llamada(registro, veces) / GRUPOS
+    bot.cerrar_db()
+
+    print(f"[estado] lecturas de partida por callback, {GRUPOS} grupos")
+    print(f"  SQL (3 consultas)  : {antes / 1000:7.1f} µs")
+    print(f"  EstadoPartida      : {ahora / 1000:7.1f} µs  (x{antes / ahora:.0f})")
+
+
+BENCHMARKS = {
+    "conexiones": bench_conexiones,
+    "latencia":   bench_latencia,
+    "plantillas": bench_plantillas,
+    "marcador":   bench_marcador,
+    "render":     bench_render,
+    "estado":     bench_estado,
+}
+
+
+if __name__ == "__main__":
+    elegidos = sys.argv[1:] or list(BENCHMARKS)
+    for nombre in elegidos:
+        BENCHMARKS[nombre]()
@@ -5,13 +5,27 @@ Soporte de idiomas: Español / English
 """
 
 import asyncio
+import functools
+import hashlib
+import heapq
+import itertools
 import logging
+import multiprocessing
+import queue
 import random
 import sqlite3
+import string as _string
+import threading
+import time
 import anthropic
 import io
+import json
 import os
 import urllib.request
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
 from PIL import Image, ImageDraw, ImageFont
 from datetime import datetime
 
@@ -191,9 +205,18 @@ def _font_renders_ok(path: str, size: int = 22) -> bool:
     except Exception:
         return False
 
+# Índice codepoint → fuente, armado una vez en _ensure_cmaps.
+# Los valores son posiciones en _INDICE_FUENTES: (path, es_unifont).
+_INDICE_FUENTES: list = []
+_cp_a_fuente: dict = {}
+# Cache: (path, size, run) → ancho medido del run
+_run_width_cache: dict = {}
+_RUN_WIDTH_CACHE_MAX = 20_000
+
 def _ensure_cmaps():
-    """Pre-carga y valida los cmaps de todas las fuentes disponibles."""
-    global _UNIFONT_PATHS, _BAD_FONTS
+    """Pre-carga y valida los cmaps de todas las fuentes disponibles y arma el
+    índice codepoint → fuente respetando _RENDER_FONT_PRIORITY."""
+    global _UNIFONT_PATHS, _BAD_FONTS, _INDICE_FUENTES, _cp_a_fuente
     _log = logging.getLogger(__name__)
     for p in _RENDER_FONT_PRIORITY:
         if p and os.path.exists(p) and os.path.getsize(p) > 10_000:
@@ -207,13 +230,55 @@ def _ensure_cmaps():
                       if p and os.path.exists(p) and os.path.getsize(p) > 10_000
                       and p not in _BAD_FONTS]
 
+    # Vectoriales primero (en su orden de prioridad) y Unifont al final
+    unifont_set = {_FONT_UNIFONT, _FONT_UNIFONT_SYS}
+    vectoriales = [p for p in dict.fromkeys(_RENDER_FONT_PRIORITY)
+                   if p and p not in unifont_set and p in _font_cmaps and p not in _BAD_FONTS]
+    _INDICE_FUENTES = [(p, False) for p in vectoriales] + [(p, True) for p in _UNIFONT_PATHS]
+    # Se recorre de menor a mayor prioridad: la fuente preferida pisa a las demás
+    indice = {}
+    for i in range(len(_INDICE_FUENTES) - 1, -1, -1):
+        indice.update(dict.fromkeys(_font_cmaps.get(_INDICE_FUENTES[i][0], ()), i))
+    _cp_a_fuente = indice
+    _run_width_cache.clear()
+
 _cmaps_ready = False    # flag para ensure solo una vez por arranque
 
+def _segmentar_runs(text: str) -> list:
+    """Parte el texto en runs de caracteres consecutivos que usan la misma fuente.
+    Retorna [(indice_fuente | None, run)]; los espacios van como run propio con
+    índice None y los caracteres sin fuente como run de un carácter con -1."""
+    runs = []
+    actual, inicio = object(), 0
+    for i, char in enumerate(text):
+        if char == " ":
+            idx = None
+        else:
+            idx = _cp_a_fuente.get(ord(char), -1)
+        if idx != actual or idx == -1:
+            if i > inicio:
+                runs.append((actual, text[inicio:i]))
+            actual, inicio = idx, i
+    if text:
+        runs.append((actual, text[inicio:]))
+    return runs
+
+def _ancho_run(draw, path: str, size: int, run: str, f) -> int:
+    key = (path, size, run)
+    w = _run_width_cache.get(key)
+    if w is None:
+        if len(_run_width_cache) >= _RUN_WIDTH_CACHE_MAX:
+            _run_width_cache.clear()
+        w = max(int(draw.textlength(run, font=f)), 4 * len(run))
+        _run_width_cache[key] = w
+    return w
+
 def draw_text_smart(draw, pos, text: str, size: int, fill):
-    """Dibuja texto char a char eligiendo la mejor fuente disponible.
+    """Dibuja texto eligiendo la mejor fuente disponible para cada carácter.
 
     Estrategia:
-    1. Recorre _RENDER_FONT_PRIORITY buscando la primera fuente que tenga el glifo.
+    1. Parte el texto en runs que comparten fuente (índice precalculado por
+       codepoint según _RENDER_FONT_PRIORITY) y dibuja cada run de una vez.
     2. Unifont (bitmap) siempre se renderiza a 16px nativo y se centra verticalmente.
     3. Si ninguna fuente tiene el glifo, se avanza el cursor sin dibujar.
     """
@@ -225,57 +290,50 @@ def draw_text_smart(draw, pos, text: str, size: int, fill):
     UNIFONT_NATIVE = 16  # Unifont es bitmap OTF, solo legible a su tamaño nativo
     x, y = pos
 
-    # Separar paths de Unifont del resto para tratarlos diferente
-    unifont_set = {_FONT_UNIFONT, _FONT_UNIFONT_SYS}
-    vectorial_paths = [p for p in _RENDER_FONT_PRIORITY
-                       if p and p not in unifont_set and p not in _BAD_FONTS
-                       and os.path.exists(p) and os.path.getsize(p) > 10_000]
-
-    for char in text:
-        if char == " ":
-            x += size // 3
-            continue
-        cp = ord(char)
-        drawn = False
-
-        # 1. Intentar fuentes vectoriales primero (calidad completa al tamaño pedido)
-        for path in vectorial_paths:
-            cmap = _font_cmaps.get(path, set())
-            if cp in cmap:
-                f = _load(path, size)
-                if f:
-                    draw.text((x, y), char, font=f, fill=fill)
-                    bb = draw.textbbox((0, 0), char, font=f)
-                    x += max(bb[2] - bb[0], 4)
-                    drawn = True
-                    break
-
-
-        if drawn:
+    for idx, run in _segmentar_runs(text):
+        if idx is None:
+            x += (size // 3) * len(run)
             continue
-
-        # 2. Fallback: Unifont a 16px nativo
-        for uni_path in _UNIFONT_PATHS:
-            cmap = _font_cmaps.get(uni_path, set())
-            if cp in cmap:
-                f = _load(uni_path, UNIFONT_NATIVE)
-                if f:
-                    y_adj = y + (size - UNIFONT_NATIVE) // 2
-                    draw.text((x, y_adj), char, font=f, fill=fill)
-                    bb = draw.textbbox((0, 0), char, font=f)
-                    char_w = max(bb[2] - bb[0], 4)
-                    x += int(char_w * size / UNIFONT_NATIVE * 0.75)
-                    drawn = True
-                    break
-
-        if not drawn:
+        if idx == -1:
             # Glifo no disponible en ninguna fuente → avanzar cursor
             x += size // 2
+            continue
+        path, es_unifont = _INDICE_FUENTES[idx]
+        f = _load(path, UNIFONT_NATIVE if es_unifont else size)
+        if not f:
+            x += (size // 2) * len(run)
+            continue
+        if es_unifont:
+            y_adj = y + (size - UNIFONT_NATIVE) // 2
+            draw.text((x, y_adj), run, font=f, fill=fill)
+            run_w = _ancho_run(draw, path, UNIFONT_NATIVE, run, f)
+            x += int(run_w * size / UNIFONT_NATIVE * 0.75)
+        else:
+            draw.text((x, y), run, font=f, fill=fill)
+            x += _ancho_run(draw, path, size, run, f)
 
     return x
 
+FUENTES_TIMEOUT_DESCARGA = 20     # segundos por conexión/lectura de cada URL
+
+def _descargar_fuente(url: str, dest: str, timeout: float = FUENTES_TIMEOUT_DESCARGA):
+    """Descarga a un .part y renombra: un worker nunca ve una fuente a medias."""
+    tmp = dest + ".part"
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as resp, open(tmp, "wb") as f:
+            while True:
+                bloque = resp.read(1 << 16)
+                if not bloque:
+                    break
+                f.write(bloque)
+        os.replace(tmp, dest)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
 def _init_fonts():
-    """Descarga fuentes necesarias y loguea el estado del sistema de fuentes."""
+    """Descarga fuentes necesarias y loguea el estado del sistema de fuentes.
+    Corre en segundo plano (ver _preparar_fuentes): no bloquea el arranque."""
     _log = logging.getLogger(__name__)
     _log.info(f"[FONTS] Directorio de fuentes: {_FONT_DIR}")
 
@@ -312,7 +370,7 @@ def _init_fonts():
         for url in urls:
             try:
                 _log.info(f"[FONTS] Descargando: {url}")
-                urllib.request.urlretrieve(url, dest)
+                _descargar_fuente(url, dest)
                 size = os.path.getsize(dest)
                 if size > 50_000:
                     _log.info(f"[FONTS] ✅ Descargado: {dest} ({size//1024}KB)")
@@ -329,18 +387,14 @@ def _init_fonts():
         exists = p and os.path.exists(p)
         size_kb = os.path.getsize(p)//1024 if exists else 0
         _log.info(f"[FONTS] {'✅' if exists else '❌'} {os.path.basename(p) if p else '?'} ({size_kb}KB)")
+    # Los cmaps se cargan en los workers de render (_init_worker_render), que
+    # son los únicos que dibujan; el proceso principal no los necesita.
 
-    # Pre-calentar cmap de las fuentes disponibles
-    for p in _RENDER_FONT_PRIORITY:
-        if p and os.path.exists(p) and os.path.getsize(p) > 10_000:
-            cmap = _get_font_cmap(p)
-            _log.info(f"[FONTS] cmap {os.path.basename(p)}: {len(cmap)} codepoints")
-
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.error import Conflict
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyParameters
+from telegram.error import BadRequest, Conflict, Forbidden, RetryAfter
 from telegram.ext import (
-    Application, CommandHandler, CallbackQueryHandler,
-    ContextTypes, MessageHandler, filters
+    Application, BaseRateLimiter, CallbackContext, CommandHandler, CallbackQueryHandler,
+    ContextTypes, MessageHandler, TypeHandler, filters
 )
 
 TOKEN = os.environ.get("BOT_TOKEN")
@@ -514,6 +568,8 @@ TEXTOS = {
         "desc_error_voto":          "Votaron incorrectamente por *{nombre}*\\.",
         "sin_estadisticas":         "📊 No hay estadísticas aún\\. ¡Juega primero\\!",
         "marcador":                 "🏆 *Marcador del grupo:*\n\n{tabla}",
+        "marcador_pagina":          "📄 Página {pagina}/{paginas} · `/score {siguiente}`",
+        "marcador_posicion":        "\n🎯 Tu posición: *\\#{posicion}* de {total}",
         "col_jugador":              "Jugador",
         "solo_admin_reset":         "⚠️ Solo los administradores del grupo pueden resetear los puntajes.",
         "reset_ok":                 "🔄 *Puntajes reseteados\\.*\n\nTodas las victorias y derrotas vuelven a cero\\. ¡A empezar de nuevo\\! 🎮",
@@ -534,6 +590,7 @@ TEXTOS = {
         "rivalidad_titulo":        "⚔️ *Rivalidad*\n\n",
         "rivalidad_uso":           "⚠️ Uso: `/rivalidad @usuario1 @usuario2`",
         "rivalidad_sin_datos":     "📊 No hay votos registrados entre estos jugadores aún\\.",
+        "rivales_tabla":           "⚔️ *Rivales de {nombre}*\n\n🎯 Más votó a:\n{votados}\n\n🎯 Más lo votaron:\n{votantes}",
         "pistas_fallback":          "1. Piensa en sus características principales\n2. Recuerda dónde o cómo se usa",
         "prompt_pistas":            (
             "Genera exactamente 2 pistas para describir '{palabra}' (categoría: {categoria}) "
@@ -721,6 +778,8 @@ TEXTOS = {
         "desc_error_voto":          "They incorrectly voted for *{nombre}*\\.",
         "sin_estadisticas":         "📊 No stats yet\\. Play first\\!",
         "marcador":                 "🏆 *Group scoreboard:*\n\n{tabla}",
+        "marcador_pagina":          "📄 Page {pagina}/{paginas} · `/score {siguiente}`",
+        "marcador_posicion":        "\n🎯 Your rank: *\\#{posicion}* of {total}",
         "col_jugador":              "Player",
         "solo_admin_reset":         "⚠️ Only group admins can reset scores.",
         "reset_ok":                 "🔄 *Scores reset\\.*\n\nAll wins and losses back to zero\\. Let's start fresh\\! 🎮",
@@ -740,6 +799,7 @@ TEXTOS = {
         ),
         "rivalidad_uso":           "⚠️ Usage: `/rivalidad @user1 @user2`",
         "rivalidad_sin_datos":     "📊 No votes recorded between these players yet\\.",
+        "rivales_tabla":           "⚔️ *{nombre}'s rivals*\n\n🎯 Voted most for:\n{votados}\n\n🎯 Most voted by:\n{votantes}",
         "rivalidad_titulo":        "⚔️ *Rivalry*\n\n",
         "pistas_fallback":          "1. Think about its main characteristics\n2. Remember where or how it's used",
         "prompt_pistas":            (
@@ -1328,7 +1388,13 @@ CATEGORIAS = {
     }
 }
 
-ANTHROPIC_CLIENT = anthropic.Anthropic(api_key=os.environ.get("ANTHROPIC_API_KEY"))
+ANTHROPIC_CLIENT = anthropic.AsyncAnthropic(api_key=os.environ.get("ANTHROPIC_API_KEY"))
+
+PISTAS_MAX_CONCURRENTES = 4    # llamadas simultáneas al LLM como máximo
+PISTAS_TIMEOUT_SEGUNDOS = 8    # pasado este tiempo se usan las pistas de fallback
+_pistas_semaforo = asyncio.Semaphore(PISTAS_MAX_CONCURRENTES)
+# (palabra, categoria, idioma) → tarea en curso, para no pedir dos veces la misma palabra
+_pistas_en_curso: dict = {}
 
 # ══════════════════════════════════════════════════════════════
 # HELPERS DE IDIOMA
@@ -1342,15 +1408,18 @@ def normalizar(texto: str) -> str:
     texto = texto.replace(" ", "")  # ignorar espacios accidentales
     return texto
 
+_ESC_CHARS = frozenset(r"\_*[]()~`>#+-=|{}.!")
+_ESC_TABLA = str.maketrans({c: "\\" + c for c in _ESC_CHARS})
+
 def esc(text):
-    chars = r"\_*[]()~`>#+-=|{}.!"
-    return "".join(f"\\{c}" if c in chars else c for c in str(text))
+    text = str(text)
+    # La mayoría de nombres no tiene caracteres especiales: se devuelven tal cual
+    return text if _ESC_CHARS.isdisjoint(text) else text.translate(_ESC_TABLA)
 
 def esc_link(text):
     """Escape para texto dentro de [texto](url) en MarkdownV2."""
     # Dentro de [texto](url) hay que escapar todos los chars especiales de MarkdownV2
-    chars = r"\_*[]()~`>#+-=|{}.!"
-    return "".join(f"\\{c}" if c in chars else c for c in str(text))
+    return esc(text)
 
 def nombre(user):
     return user.first_name or user.username or str(user.id)
@@ -1386,6 +1455,46 @@ def t(chat_key: str, key: str) -> str:
     lang = get_idioma(chat_key)
     return TEXTOS[lang][key]
 
+def tf(chat_key: str, key: str, **campos) -> str:
+    """Igual que t(chat_key, key).format(**campos), con la plantilla ya compilada."""
+    return _PLANTILLAS[get_idioma(chat_key)][key](**campos)
+
+
+# ── Plantillas compiladas ──
+# Cada texto con campos {x} se parsea una sola vez en pares (literal, campo);
+# al usarlo solo se concatenan, sin volver a parsear la plantilla.
+def _compilar_plantilla(tpl: str):
+    try:
+        trozos = list(_string.Formatter().parse(tpl))
+    except ValueError:
+        return tpl.format       # no es una plantilla válida: mismo error que antes, al usarla
+    partes = []
+    for literal, campo, spec, conv in trozos:
+        if campo is not None and (spec or conv or not campo.isidentifier()):
+            return tpl.format   # formato poco común: se deja a str.format
+        partes.append((literal, campo))
+    if all(campo is None for _, campo in partes):
+        texto = tpl.format()
+        return lambda **_: texto
+    partes = tuple(partes)
+
+    def armar(**campos):
+        trozos = []
+        for literal, campo in partes:
+            trozos.append(literal)
+            if campo is not None:
+                trozos.append(format(campos[campo]))
+        return "".join(trozos)
+    return armar
+
+def _compilar_textos(textos: dict) -> dict:
+    return {
+        lang: {key: _compilar_plantilla(tpl) for key, tpl in por_idioma.items() if isinstance(tpl, str)}
+        for lang, por_idioma in textos.items()
+    }
+
+_PLANTILLAS = _compilar_textos(TEXTOS)
+
 def cats(chat_key: str) -> dict:
     """Devuelve las categorías en el idioma del grupo, incluyendo Personalizado si hay palabras."""
     lang = get_idioma(chat_key)
@@ -1408,7 +1517,7 @@ def elegir_palabra(chat_key: str, categoria: str, palabras: list) -> str:
 
     excluir_n = min(len(palabras) // 2, 10)
 
-    with get_conn() as conn:
+    with get_conn_lectura() as conn:
         recientes = conn.execute(
             """SELECT palabra FROM historial
                WHERE chat_key=? AND categoria=?
@@ -1425,19 +1534,107 @@ def elegir_palabra(chat_key: str, categoria: str, palabras: list) -> str:
     return random.choice(candidatas)
 
 
-def generar_pistas(palabra: str, categoria: str, chat_key: str) -> str:
-    lang = get_idioma(chat_key)
+async def _pedir_pistas_llm(palabra: str, categoria: str, lang: str):
+    """Pide las pistas al LLM sin bloquear el event loop.
+    Respeta el límite de concurrencia y el timeout; retorna None si falla.
+    """
     prompt = TEXTOS[lang]["prompt_pistas"].format(palabra=palabra, categoria=categoria)
-    fallback = TEXTOS[lang]["pistas_fallback"]
-    try:
-        response = ANTHROPIC_CLIENT.messages.create(
-            model="claude-haiku-4-5-20251001",
-            max_tokens=200,
-            messages=[{"role": "user", "content": prompt}]
-        )
+
+    async def _llamada():
+        async with _pistas_semaforo:
+            response = await ANTHROPIC_CLIENT.messages.create(
+                model="claude-haiku-4-5-20251001",
+                max_tokens=200,
+                messages=[{"role": "user", "content": prompt}]
+            )
         return response.content[0].text.strip()
-    except Exception:
-        return fallback
+
+    try:
+        return await asyncio.wait_for(_llamada(), timeout=PISTAS_TIMEOUT_SEGUNDOS)
+    except Exception as e:
+        logger.warning(f"[PISTAS] Sin respuesta del LLM para {palabra!r} ({lang}): {type(e).__name__}")
+        return None
+
+
+async def _generar_y_cachear_pistas(palabra: str, categoria: str, lang: str):
+    """Genera las pistas con el LLM y las guarda en cache. Retorna None si falla."""
+    pistas = await _pedir_pistas_llm(palabra, categoria, lang)
+    if pistas:
+        await db(set_pistas_cache, palabra, categoria, lang, pistas)
+    return pistas
+
+
+async def _pistas_compartidas(palabra: str, categoria: str, lang: str):
+    """Si otra partida (o el precalentado) ya está pidiendo la misma palabra,
+    espera esa misma llamada en vez de lanzar otra."""
+    clave = (palabra, categoria, lang)
+    tarea = _pistas_en_curso.get(clave)
+    if tarea is None:
+        tarea = asyncio.ensure_future(_generar_y_cachear_pistas(palabra, categoria, lang))
+        _pistas_en_curso[clave] = tarea
+        tarea.add_done_callback(lambda _t: _pistas_en_curso.pop(clave, None))
+    return await asyncio.shield(tarea)
+
+
+async def generar_pistas(palabra: str, categoria: str, chat_key: str) -> str:
+    """Pistas para los inocentes: cache en SQLite → LLM → texto de fallback."""
+    lang = get_idioma(chat_key)
+    cacheadas = await db(get_pistas_cache, palabra, categoria, lang)
+    if cacheadas:
+        return cacheadas
+    pistas = await _pistas_compartidas(palabra, categoria, lang)
+    return pistas or TEXTOS[lang]["pistas_fallback"]
+
+
+# ── Precalentado de pistas ──
+PISTAS_WARMUP_POR_MINUTO = int(os.environ.get("PISTAS_WARMUP_POR_MINUTO", "20"))
+PISTAS_WARMUP_BACKOFF_MAX = 600   # segundos máximos de espera tras fallos seguidos
+
+
+def _pool_pistas() -> list:
+    """Todas las (palabra, categoria, idioma) que pueden salir en una partida:
+    las categorías fijas de cada idioma más las palabras personalizadas de cada grupo."""
+    pool = []
+    for lang, categorias in CATEGORIAS.items():
+        for categoria, palabras in categorias.items():
+            pool.extend((palabra, categoria, lang) for palabra in palabras)
+    with get_conn_lectura() as conn:
+        custom = conn.execute(
+            """SELECT DISTINCT pc.palabra, COALESCE(c.idioma, 'es')
+               FROM palabras_custom pc
+               LEFT JOIN config c ON c.chat_key = pc.chat_key"""
+        ).fetchall()
+    pool.extend(
+        (palabra, TEXTOS[lang]["cat_custom"], lang)
+        for palabra, lang in custom if lang in TEXTOS
+    )
+    return list(dict.fromkeys(pool))
+
+
+async def _precalentar_pistas():
+    """Genera en segundo plano las pistas que faltan en cache, respetando
+    PISTAS_WARMUP_POR_MINUTO. Ante fallos seguidos espera cada vez más."""
+    if not os.environ.get("ANTHROPIC_API_KEY"):
+        logger.info("[PISTAS] Sin ANTHROPIC_API_KEY, precalentado desactivado")
+        return
+    cacheadas  = await db(get_pistas_cacheadas)
+    pendientes = [x for x in await db(_pool_pistas) if x not in cacheadas]
+    logger.info(f"[PISTAS] Precalentando {len(pendientes)} palabras sin pistas")
+
+    intervalo = 60 / max(1, PISTAS_WARMUP_POR_MINUTO)
+    espera    = intervalo
+    generadas = 0
+    for palabra, categoria, lang in pendientes:
+        # Puede que una partida ya la haya generado mientras tanto
+        if await db(get_pistas_cache, palabra, categoria, lang):
+            continue
+        if await _pistas_compartidas(palabra, categoria, lang):
+            generadas += 1
+            espera = intervalo
+        else:
+            espera = min(espera * 2, PISTAS_WARMUP_BACKOFF_MAX)
+        await asyncio.sleep(espera)
+    logger.info(f"[PISTAS] Precalentado terminado: {generadas}/{len(pendientes)} generadas")
 
 
 # ══════════════════════════════════════════════════════════════
@@ -1445,206 +1642,607 @@ def generar_pistas(palabra: str, categoria: str, chat_key: str) -> str:
 # ══════════════════════════════════════════════════════════════
 DB_PATH = "/data/impostor.db"
 
+# ── Migraciones ──
+# Cada paso corre una sola vez y queda registrado en schema_version. Los pasos
+# son idempotentes (IF NOT EXISTS, columnas que se agregan solo si faltan)
+# porque las DBs anteriores a schema_version ya tienen aplicados algunos.
+# Cambios nuevos de esquema: agregar un paso al final de _MIGRACIONES.
+_ESQUEMA_BASE = """
+    CREATE TABLE IF NOT EXISTS partidas (
+        chat_key        TEXT PRIMARY KEY,
+        chat_id         INTEGER,
+        estado          TEXT DEFAULT 'esperando',
+        categoria       TEXT,
+        palabra         TEXT,
+        impostor_ids    TEXT,
+        vivos           TEXT,
+        ronda           INTEGER DEFAULT 1,
+        creador_id      INTEGER
+    );
+    CREATE TABLE IF NOT EXISTS jugadores (
+        id              INTEGER PRIMARY KEY AUTOINCREMENT,
+        chat_key        TEXT,
+        user_id         INTEGER,
+        username        TEXT,
+        victorias       INTEGER DEFAULT 0,
+        derrotas        INTEGER DEFAULT 0,
+        veces_impostor  INTEGER DEFAULT 0,
+        veces_inocente  INTEGER DEFAULT 0,
+        victorias_impostor INTEGER DEFAULT 0,
+        victorias_inocente INTEGER DEFAULT 0,
+        UNIQUE(chat_key, user_id)
+    );
+    CREATE TABLE IF NOT EXISTS partida_jugadores (
+        chat_key    TEXT,
+        user_id     INTEGER,
+        username    TEXT,
+        PRIMARY KEY (chat_key, user_id)
+    );
+    CREATE TABLE IF NOT EXISTS partida_estado_jugador (
+        chat_key    TEXT,
+        user_id     INTEGER,
+        rol         TEXT,
+        vivo        INTEGER DEFAULT 1,
+        PRIMARY KEY (chat_key, user_id)
+    );
+    CREATE INDEX IF NOT EXISTS idx_estado_jugador_user ON partida_estado_jugador(user_id, rol);
+    CREATE TABLE IF NOT EXISTS historial (
+        id          INTEGER PRIMARY KEY AUTOINCREMENT,
+        chat_key    TEXT,
+        ganador     TEXT,
+        palabra     TEXT,
+        categoria   TEXT,
+        fecha       TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE IF NOT EXISTS config (
+        chat_key    TEXT PRIMARY KEY,
+        idioma      TEXT DEFAULT 'es'
+    );
+    CREATE TABLE IF NOT EXISTS palabras_custom (
+        id          INTEGER PRIMARY KEY AUTOINCREMENT,
+        chat_key    TEXT,
+        palabra     TEXT,
+        UNIQUE(chat_key, palabra)
+    );
+    CREATE TABLE IF NOT EXISTS votos_historial (
+        id          INTEGER PRIMARY KEY AUTOINCREMENT,
+        chat_key    TEXT,
+        voter_id    INTEGER,
+        voted_id    INTEGER,
+        fecha       TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE IF NOT EXISTS programacion (
+        id              INTEGER PRIMARY KEY AUTOINCREMENT,
+        chat_key        TEXT,
+        chat_id         INTEGER,
+        thread_id       INTEGER,
+        hora_inicio     INTEGER,
+        puntos_victoria INTEGER DEFAULT 1,
+        tz_offset       INTEGER DEFAULT 0,
+        mensaje_id      INTEGER,
+        estado          TEXT DEFAULT 'pendiente'
+    );
+    CREATE TABLE IF NOT EXISTS gi_grupos (
+        chat_id     INTEGER PRIMARY KEY,
+        chat_title  TEXT,
+        chat_key    TEXT,
+        ultimo_msg  TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE IF NOT EXISTS gi_programacion (
+        id              INTEGER PRIMARY KEY AUTOINCREMENT,
+        idol_name       TEXT,
+        file_id         TEXT,
+        file_id_reveal  TEXT,
+        hint1           TEXT,
+        hint2           TEXT,
+        hint3           TEXT,
+        inicio_ts       INTEGER,
+        fin_ts          INTEGER,
+        tz_offset       INTEGER DEFAULT 0,
+        estado          TEXT DEFAULT 'pendiente'
+    );
+    CREATE TABLE IF NOT EXISTS gi_rondas (
+        id              INTEGER PRIMARY KEY AUTOINCREMENT,
+        prog_id         INTEGER,
+        chat_key        TEXT,
+        chat_id         INTEGER,
+        idol_name       TEXT,
+        file_id         TEXT,
+        file_id_reveal  TEXT,
+        hint1           TEXT,
+        hint2           TEXT,
+        hint3           TEXT,
+        inicio_ts       INTEGER,
+        fin_ts          INTEGER,
+        estado          TEXT DEFAULT 'activa',
+        pistas_dadas    INTEGER DEFAULT 0,
+        puntos_actuales INTEGER DEFAULT 5,
+        ganador_id      INTEGER,
+        ganador_nombre  TEXT,
+        mensaje_id      INTEGER
+    );
+    CREATE TABLE IF NOT EXISTS gi_participantes (
+        id          INTEGER PRIMARY KEY AUTOINCREMENT,
+        ronda_id    INTEGER,
+        chat_key    TEXT,
+        user_id     INTEGER,
+        username    TEXT,
+        vidas       INTEGER DEFAULT 5,
+        activo      INTEGER DEFAULT 1,
+        UNIQUE(ronda_id, user_id)
+    );
+    CREATE TABLE IF NOT EXISTS gi_marcador (
+        id          INTEGER PRIMARY KEY AUTOINCREMENT,
+        chat_key    TEXT,
+        user_id     INTEGER,
+        username    TEXT,
+        puntos      INTEGER DEFAULT 0,
+        victorias   INTEGER DEFAULT 0,
+        UNIQUE(chat_key, user_id)
+    );
+    CREATE TABLE IF NOT EXISTS pistas_cache (
+        palabra     TEXT,
+        categoria   TEXT,
+        idioma      TEXT,
+        pistas      TEXT,
+        fecha       TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (palabra, categoria, idioma)
+    );
+    CREATE TABLE IF NOT EXISTS partidas_snapshot (
+        chat_key    TEXT PRIMARY KEY,
+        datos       TEXT NOT NULL,
+        fecha       TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE IF NOT EXISTS temporizadores (
+        chat_key    TEXT,
+        accion      TEXT,
+        vence       REAL,
+        args        TEXT,
+        PRIMARY KEY (chat_key, accion)
+    );
+    CREATE TABLE IF NOT EXISTS imagenes_subidas (
+        hash        TEXT PRIMARY KEY,
+        file_id     TEXT NOT NULL,
+        bytes       INTEGER NOT NULL,
+        usos        INTEGER DEFAULT 0,
+        fecha       TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+"""
+
+def _columnas(conn, tabla: str) -> set:
+    return {fila[1] for fila in conn.execute(f"PRAGMA table_info({tabla})")}
+
+def _agregar_columna(conn, tabla: str, columna: str, definicion: str):
+    if columna not in _columnas(conn, tabla):
+        conn.execute(f"ALTER TABLE {tabla} ADD COLUMN {columna} {definicion}")
+
+def _mig_esquema_base(conn):
+    # Sentencia por sentencia: executescript haría COMMIT de la transacción del paso
+    for sql in _ESQUEMA_BASE.split(";"):
+        if sql.strip():
+            conn.execute(sql)
+
+def _mig_contadores_rol(conn):
+    for col in ("veces_impostor", "veces_inocente", "victorias_impostor", "victorias_inocente"):
+        _agregar_columna(conn, "jugadores", col, "INTEGER DEFAULT 0")
+
+def _mig_timezone(conn):
+    _agregar_columna(conn, "config", "timezone_offset", "INTEGER DEFAULT 0")
+
+def _mig_gi_activo(conn):
+    _agregar_columna(conn, "gi_grupos", "gi_activo", "INTEGER DEFAULT 1")
+    # Grupos existentes con gi_activo=NULL quedan como activos
+    conn.execute("UPDATE gi_grupos SET gi_activo=1 WHERE gi_activo IS NULL")
+
+def _mig_divisiones(conn):
+    _agregar_columna(conn, "gi_marcador", "division", "INTEGER DEFAULT 1")
+    _agregar_columna(conn, "gi_marcador", "temporada", "INTEGER DEFAULT 1")
+    _agregar_columna(conn, "gi_marcador", "victorias_temp", "INTEGER DEFAULT 0")
+    _agregar_columna(conn, "gi_rondas", "division", "INTEGER DEFAULT 1")
+    _agregar_columna(conn, "gi_programacion", "division", "INTEGER DEFAULT 1")
+    conn.execute("""CREATE TABLE IF NOT EXISTS gi_temporada (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        chat_key TEXT,
+        numero INTEGER DEFAULT 1,
+        estado TEXT DEFAULT 'activa',
+        UNIQUE(chat_key)
+    )""")
+    # Sanear NULL de registros anteriores a las columnas
+    conn.execute("UPDATE gi_marcador SET division=1 WHERE division IS NULL")
+    conn.execute("UPDATE gi_marcador SET temporada=1 WHERE temporada IS NULL")
+    conn.execute("UPDATE gi_marcador SET victorias_temp=0 WHERE victorias_temp IS NULL")
+
+def _mig_estado_jugador(conn):
+    """vivos/impostor_ids en texto → partida_estado_jugador. Las columnas
+    viejas se siguen escribiendo para quien todavía las lea."""
+    if conn.execute("SELECT 1 FROM partida_estado_jugador LIMIT 1").fetchone():
+        return
+    filas = []
+    for chat_key, impostor_ids, vivos in conn.execute(
+        "SELECT chat_key, impostor_ids, vivos FROM partidas WHERE impostor_ids IS NOT NULL"
+    ).fetchall():
+        impostores = {int(i) for i in impostor_ids.split(",") if i.strip()}
+        vivos_set  = {int(i) for i in (vivos or "").split(",") if i.strip()}
+        ids = [r[0] for r in conn.execute(
+            "SELECT user_id FROM partida_jugadores WHERE chat_key=? ORDER BY rowid", (chat_key,)
+        )]
+        ids += [i for i in sorted(impostores | vivos_set) if i not in ids]
+        filas += [(chat_key, uid, ROL_IMPOSTOR if uid in impostores else ROL_INOCENTE,
+                   int(uid in vivos_set)) for uid in ids]
+    conn.executemany(
+        "INSERT OR IGNORE INTO partida_estado_jugador (chat_key, user_id, rol, vivo) VALUES (?,?,?,?)",
+        filas
+    )
+
+def _mig_indices(conn):
+    for sql in _INDICES:
+        conn.execute(sql)
+
+def _mig_rivalidad(conn):
+    """Conteo de votos por par (votante, votado), mantenido al guardar votos;
+    se rellena una vez desde votos_historial."""
+    conn.execute("""CREATE TABLE IF NOT EXISTS rivalidad (
+        chat_key    TEXT,
+        voter_id    INTEGER,
+        voted_id    INTEGER,
+        veces       INTEGER DEFAULT 0,
+        PRIMARY KEY (chat_key, voter_id, voted_id)
+    ) WITHOUT ROWID""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_rivalidad_votante ON rivalidad(chat_key, voter_id, veces DESC)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_rivalidad_votado ON rivalidad(chat_key, voted_id, veces DESC)")
+    conn.execute("DELETE FROM rivalidad")
+    conn.execute(
+        "INSERT INTO rivalidad (chat_key, voter_id, voted_id, veces) "
+        "SELECT chat_key, voter_id, voted_id, COUNT(*) FROM votos_historial "
+        "GROUP BY chat_key, voter_id, voted_id"
+    )
+
+def _mig_balance(conn):
+    """victorias - derrotas materializado, para ordenar el marcador por índice."""
+    _agregar_columna(conn, "jugadores", "balance", "INTEGER DEFAULT 0")
+    conn.execute("UPDATE jugadores SET balance = victorias - derrotas")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_jugadores_ranking ON jugadores(chat_key, balance DESC, victorias DESC)")
+
+def _mig_salud_grupos(conn):
+    conn.execute("""CREATE TABLE IF NOT EXISTS gi_grupos_health (
+        chat_id         INTEGER PRIMARY KEY,
+        vivo            INTEGER,
+        titulo          TEXT,
+        link            TEXT,
+        puede_escribir  INTEGER,
+        fecha           REAL
+    )""")
+
+_MIGRACIONES = [
+    (1, "esquema base",                      _mig_esquema_base),
+    (2, "contadores por rol en jugadores",   _mig_contadores_rol),
+    (3, "config.timezone_offset",            _mig_timezone),
+    (4, "gi_grupos.gi_activo",               _mig_gi_activo),
+    (5, "divisiones y temporadas GI",        _mig_divisiones),
+    (6, "partida_estado_jugador",            _mig_estado_jugador),
+    (7, "índices de consultas calientes",    _mig_indices),
+    (8, "rivalidad agregada",                _mig_rivalidad),
+    (9, "balance materializado en jugadores", _mig_balance),
+    (10, "cache de salud de grupos",          _mig_salud_grupos),
+]
+
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.executescript("""
-        CREATE TABLE IF NOT EXISTS partidas (
-            chat_key        TEXT PRIMARY KEY,
-            chat_id         INTEGER,
-            estado          TEXT DEFAULT 'esperando',
-            categoria       TEXT,
-            palabra         TEXT,
-            impostor_ids    TEXT,
-            vivos           TEXT,
-            ronda           INTEGER DEFAULT 1,
-            creador_id      INTEGER
-        );
-        CREATE TABLE IF NOT EXISTS jugadores (
-            id              INTEGER PRIMARY KEY AUTOINCREMENT,
-            chat_key        TEXT,
-            user_id         INTEGER,
-            username        TEXT,
-            victorias       INTEGER DEFAULT 0,
-            derrotas        INTEGER DEFAULT 0,
-            veces_impostor  INTEGER DEFAULT 0,
-            veces_inocente  INTEGER DEFAULT 0,
-            victorias_impostor INTEGER DEFAULT 0,
-            victorias_inocente INTEGER DEFAULT 0,
-            UNIQUE(chat_key, user_id)
-        );
-        CREATE TABLE IF NOT EXISTS partida_jugadores (
-            chat_key    TEXT,
-            user_id     INTEGER,
-            username    TEXT,
-            PRIMARY KEY (chat_key, user_id)
-        );
-        CREATE TABLE IF NOT EXISTS historial (
-            id          INTEGER PRIMARY KEY AUTOINCREMENT,
-            chat_key    TEXT,
-            ganador     TEXT,
-            palabra     TEXT,
-            categoria   TEXT,
-            fecha       TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        );
-        CREATE TABLE IF NOT EXISTS config (
-            chat_key    TEXT PRIMARY KEY,
-            idioma      TEXT DEFAULT 'es'
-        );
-        CREATE TABLE IF NOT EXISTS palabras_custom (
-            id          INTEGER PRIMARY KEY AUTOINCREMENT,
-            chat_key    TEXT,
-            palabra     TEXT,
-            UNIQUE(chat_key, palabra)
-        );
-        CREATE TABLE IF NOT EXISTS votos_historial (
-            id          INTEGER PRIMARY KEY AUTOINCREMENT,
-            chat_key    TEXT,
-            voter_id    INTEGER,
-            voted_id    INTEGER,
+    """Aplica las migraciones pendientes; si el esquema está al día no hace
+    nada más que leer schema_version."""
+    inicio = time.perf_counter()
+    conn = sqlite3.connect(DB_PATH, isolation_level=None)
+    try:
+        conn.execute("""CREATE TABLE IF NOT EXISTS schema_version (
+            version     INTEGER PRIMARY KEY,
+            descripcion TEXT,
+            ms          REAL,
             fecha       TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        );
-        CREATE TABLE IF NOT EXISTS programacion (
-            id              INTEGER PRIMARY KEY AUTOINCREMENT,
-            chat_key        TEXT,
-            chat_id         INTEGER,
-            thread_id       INTEGER,
-            hora_inicio     INTEGER,
-            puntos_victoria INTEGER DEFAULT 1,
-            tz_offset       INTEGER DEFAULT 0,
-            mensaje_id      INTEGER,
-            estado          TEXT DEFAULT 'pendiente'
-        );
-        CREATE TABLE IF NOT EXISTS gi_grupos (
-            chat_id     INTEGER PRIMARY KEY,
-            chat_title  TEXT,
-            chat_key    TEXT,
-            ultimo_msg  TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        );
-        CREATE TABLE IF NOT EXISTS gi_programacion (
-            id              INTEGER PRIMARY KEY AUTOINCREMENT,
-            idol_name       TEXT,
-            file_id         TEXT,
-            file_id_reveal  TEXT,
-            hint1           TEXT,
-            hint2           TEXT,
-            hint3           TEXT,
-            inicio_ts       INTEGER,
-            fin_ts          INTEGER,
-            tz_offset       INTEGER DEFAULT 0,
-            estado          TEXT DEFAULT 'pendiente'
-        );
-        CREATE TABLE IF NOT EXISTS gi_rondas (
-            id              INTEGER PRIMARY KEY AUTOINCREMENT,
-            prog_id         INTEGER,
-            chat_key        TEXT,
-            chat_id         INTEGER,
-            idol_name       TEXT,
-            file_id         TEXT,
-            file_id_reveal  TEXT,
-            hint1           TEXT,
-            hint2           TEXT,
-            hint3           TEXT,
-            inicio_ts       INTEGER,
-            fin_ts          INTEGER,
-            estado          TEXT DEFAULT 'activa',
-            pistas_dadas    INTEGER DEFAULT 0,
-            puntos_actuales INTEGER DEFAULT 5,
-            ganador_id      INTEGER,
-            ganador_nombre  TEXT,
-            mensaje_id      INTEGER
-        );
-        CREATE TABLE IF NOT EXISTS gi_participantes (
-            id          INTEGER PRIMARY KEY AUTOINCREMENT,
-            ronda_id    INTEGER,
-            chat_key    TEXT,
-            user_id     INTEGER,
-            username    TEXT,
-            vidas       INTEGER DEFAULT 5,
-            activo      INTEGER DEFAULT 1,
-            UNIQUE(ronda_id, user_id)
-        );
-        CREATE TABLE IF NOT EXISTS gi_marcador (
-            id          INTEGER PRIMARY KEY AUTOINCREMENT,
-            chat_key    TEXT,
-            user_id     INTEGER,
-            username    TEXT,
-            puntos      INTEGER DEFAULT 0,
-            victorias   INTEGER DEFAULT 0,
-            UNIQUE(chat_key, user_id)
-        );
-    """)
-    conn.commit()
-    # Migración: agregar columnas nuevas si no existen (DBs antiguas)
-    for col, default in [("veces_impostor", 0), ("veces_inocente", 0), ("victorias_impostor", 0), ("victorias_inocente", 0)]:
+        )""")
+        actual = conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+        pendientes = [m for m in _MIGRACIONES if m[0] > actual]
+        if not pendientes:
+            logger.info(f"[DB] esquema al día (v{actual}) en {(time.perf_counter() - inicio) * 1000:.1f} ms")
+            return
+        for version, descripcion, paso in pendientes:
+            t0 = time.perf_counter()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                paso(conn)
+                ms = (time.perf_counter() - t0) * 1000
+                conn.execute("INSERT INTO schema_version (version, descripcion, ms) VALUES (?,?,?)",
+                             (version, descripcion, ms))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                logger.exception(f"[DB] migración v{version} ({descripcion}) falló")
+                raise
+            logger.info(f"[DB] migración v{version} ({descripcion}): {ms:.1f} ms")
+        logger.info(f"[DB] esquema v{actual} → v{pendientes[-1][0]} en {(time.perf_counter() - inicio) * 1000:.1f} ms")
+    finally:
+        conn.close()
+
+# ── Índices y auditoría de planes ──
+_INDICES = (
+    "CREATE INDEX IF NOT EXISTS idx_historial_categoria ON historial(chat_key, categoria, fecha)",
+    "CREATE INDEX IF NOT EXISTS idx_votos_par ON votos_historial(chat_key, voter_id, voted_id)",
+    "CREATE INDEX IF NOT EXISTS idx_gi_rondas_chat_key ON gi_rondas(chat_key, estado)",
+    "CREATE INDEX IF NOT EXISTS idx_gi_rondas_chat_id ON gi_rondas(chat_id, estado)",
+    "CREATE INDEX IF NOT EXISTS idx_gi_rondas_estado ON gi_rondas(estado)",
+    "CREATE INDEX IF NOT EXISTS idx_gi_marcador_puntos ON gi_marcador(chat_key, puntos DESC, victorias DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_gi_marcador_division ON gi_marcador(chat_key, division, puntos DESC, victorias DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_programacion_estado ON programacion(estado, chat_key)",
+    "CREATE INDEX IF NOT EXISTS idx_gi_programacion_estado ON gi_programacion(estado, inicio_ts)",
+)
+
+# Copias de las consultas de los caminos calientes, con parámetros de ejemplo.
+# Si se cambia una consulta en su helper, actualizarla también acá.
+# Consultas de rivalidad: las usan get_rivalidad / get_top_rivales y la
+# auditoría, así el plan que se revisa es el que corre.
+_SQL_RIVALIDAD = ("SELECT voter_id, veces FROM rivalidad WHERE chat_key=? "
+                  "AND ((voter_id=? AND voted_id=?) OR (voter_id=? AND voted_id=?))")
+_SQL_TOP_RIVALES = (
+    "SELECT r.{otro}, COALESCE(j.username, CAST(r.{otro} AS TEXT)), r.veces FROM rivalidad r "
+    "LEFT JOIN jugadores j ON j.chat_key = r.chat_key AND j.user_id = r.{otro} "
+    "WHERE r.chat_key=? AND r.{yo}=? ORDER BY r.veces DESC LIMIT ?"
+)
+_SQL_TOP_VOTADOS  = _SQL_TOP_RIVALES.format(yo="voter_id", otro="voted_id")
+_SQL_TOP_VOTANTES = _SQL_TOP_RIVALES.format(yo="voted_id", otro="voter_id")
+
+_CONSULTAS_CALIENTES = (
+    ("SELECT palabra FROM historial WHERE chat_key=? AND categoria=? ORDER BY fecha DESC LIMIT ?", ("k", "c", 10)),
+    (_SQL_RIVALIDAD,    ("k", 1, 2, 2, 1)),
+    (_SQL_TOP_VOTADOS,  ("k", 1, 3)),
+    (_SQL_TOP_VOTANTES, ("k", 1, 3)),
+    ("SELECT * FROM gi_rondas WHERE chat_key=? AND estado='activa' ORDER BY id DESC LIMIT 1", ("k",)),
+    ("SELECT * FROM gi_rondas WHERE chat_id=? AND estado='activa' ORDER BY id DESC LIMIT 1", (1,)),
+    ("SELECT id, chat_key, chat_id FROM gi_rondas WHERE estado='activa'", ()),
+    ("SELECT * FROM gi_participantes WHERE ronda_id=? AND user_id=?", (1, 1)),
+    ("SELECT user_id, username, puntos, victorias FROM gi_marcador WHERE chat_key=? ORDER BY puntos DESC, victorias DESC", ("k",)),
+    ("SELECT user_id, username, puntos, victorias, COALESCE(victorias_temp,0) FROM gi_marcador "
+     "WHERE chat_key=? AND division=? ORDER BY puntos DESC, victorias DESC", ("k", 1)),
+    ("SELECT division FROM gi_marcador WHERE chat_key=? AND user_id=?", ("k", 1)),
+    ("SELECT * FROM programacion WHERE estado='pendiente'", ()),
+    ("SELECT * FROM programacion WHERE chat_key=? AND estado='pendiente' ORDER BY id DESC LIMIT 1", ("k",)),
+    ("SELECT id, idol_name, inicio_ts, fin_ts, tz_offset FROM gi_programacion WHERE estado='pendiente' ORDER BY inicio_ts", ()),
+    ("SELECT user_id, username, victorias, derrotas FROM jugadores WHERE chat_key=? AND (victorias > 0 OR derrotas > 0) "
+     "ORDER BY balance DESC, victorias DESC LIMIT ? OFFSET ?", ("k", 15, 0)),
+    ("SELECT COUNT(*) FROM jugadores WHERE chat_key=? AND (victorias > 0 OR derrotas > 0) "
+     "AND (balance > ? OR (balance = ? AND victorias > ?))", ("k", 0, 0, 0)),
+    ("SELECT palabra FROM palabras_custom WHERE chat_key=? ORDER BY id", ("k",)),
+    ("SELECT user_id, rol, vivo FROM partida_estado_jugador WHERE chat_key=? ORDER BY rowid", ("k",)),
+)
+
+def auditar_consultas() -> list:
+    """Corre EXPLAIN QUERY PLAN sobre _CONSULTAS_CALIENTES y loguea las que
+    recorren una tabla entera. Retorna [(sql, detalle)] de esos scans."""
+    scans = []
+    with get_conn_lectura() as conn:
+        for sql, params in _CONSULTAS_CALIENTES:
+            try:
+                plan = conn.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+            except Exception as e:
+                logger.error(f"[DB] EXPLAIN falló para {sql!r}: {e}")
+                continue
+            for _, _, _, detalle in plan:
+                # "SCAN tabla" sin índice = recorrido completo
+                if detalle.startswith("SCAN ") and " USING " not in detalle:
+                    scans.append((sql, detalle))
+                    logger.warning(f"[DB] full scan ({detalle}): {sql}")
+    if not scans:
+        logger.info(f"[DB] plan de consultas OK ({len(_CONSULTAS_CALIENTES)} consultas calientes)")
+    return scans
+
+# ── Conexiones ──
+# Una sola conexión de escritura de larga vida (serializada con un RLock) y un
+# pequeño pool de conexiones de solo lectura. En WAL los lectores no bloquean
+# al escritor ni al revés.
+DB_LECTORES = 4
+
+
+class _PoolSQLite:
+    def __init__(self, path: str, lectores: int):
+        self.path      = path
+        self._lock     = threading.RLock()
+        self._escritor = None
+        self._libres   = queue.LifoQueue(maxsize=lectores)
+        self._local    = threading.local()
+
+    def _abrir(self, solo_lectura: bool = False):
+        conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=256)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        if solo_lectura:
+            conn.execute("PRAGMA query_only=ON")
+        else:
+            # Los checkpoints (el único fsync en WAL+NORMAL) los hace
+            # _checkpoint_wal_periodico desde el hilo de SQLite
+            conn.execute("PRAGMA wal_autocheckpoint=0")
+        return conn
+
+    @contextmanager
+    def escritura(self):
+        """Transacción sobre el escritor. Si ya hay una abierta en este hilo,
+        se une a ella y solo la más externa hace commit/rollback."""
+        with self._lock:
+            if self._escritor is None:
+                self._escritor = self._abrir()
+            conn = self._escritor
+            profundidad = getattr(self._local, "profundidad", 0)
+            self._local.profundidad = profundidad + 1
+            if profundidad == 0:
+                self._local.al_confirmar = []
+            try:
+                yield conn
+            except BaseException:
+                if profundidad == 0:
+                    conn.rollback()
+                    self._local.al_confirmar = []
+                raise
+            else:
+                if profundidad == 0:
+                    conn.commit()
+                    pendientes, self._local.al_confirmar = self._local.al_confirmar, []
+                    for fn in pendientes:
+                        fn()
+            finally:
+                self._local.profundidad = profundidad
+
+    def al_confirmar(self, fn):
+        """Ejecuta fn cuando se confirme la transacción abierta en este hilo
+        (o ya mismo si no hay ninguna). Si hay rollback, no se ejecuta."""
+        if getattr(self._local, "profundidad", 0):
+            self._local.al_confirmar.append(fn)
+        else:
+            fn()
+
+    @contextmanager
+    def lectura(self):
+        # Dentro de una transacción se lee con el escritor para ver lo no confirmado
+        if getattr(self._local, "profundidad", 0):
+            with self.escritura() as conn:
+                yield conn
+            return
         try:
-            conn.execute(f"ALTER TABLE jugadores ADD COLUMN {col} INTEGER DEFAULT {default}")
-            conn.commit()
-        except Exception:
-            pass  # Ya existe
-    try:
-        conn.execute("ALTER TABLE config ADD COLUMN timezone_offset INTEGER DEFAULT 0")
-        conn.commit()
-    except Exception:
-        pass
-    try:
-        conn.execute("ALTER TABLE gi_grupos ADD COLUMN gi_activo INTEGER DEFAULT 1")
-        conn.commit()
-    except Exception:
-        pass  # Ya existe
-    # Asegurar que grupos existentes con gi_activo=NULL queden como activos
-    try:
-        conn.execute("UPDATE gi_grupos SET gi_activo=1 WHERE gi_activo IS NULL")
-        conn.commit()
-    except Exception:
-        pass
-    # Migración divisiones
-    for sql in [
-        "ALTER TABLE gi_marcador ADD COLUMN division INTEGER DEFAULT 1",
-        "ALTER TABLE gi_marcador ADD COLUMN temporada INTEGER DEFAULT 1",
-        "ALTER TABLE gi_marcador ADD COLUMN victorias_temp INTEGER DEFAULT 0",
-        "ALTER TABLE gi_rondas ADD COLUMN division INTEGER DEFAULT 1",
-        "ALTER TABLE gi_programacion ADD COLUMN division INTEGER DEFAULT 1",
-        """CREATE TABLE IF NOT EXISTS gi_temporada (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            chat_key TEXT,
-            numero INTEGER DEFAULT 1,
-            estado TEXT DEFAULT 'activa',
-            UNIQUE(chat_key)
-        )""",
-    ]:
+            conn = self._libres.get_nowait()
+        except queue.Empty:
+            conn = self._abrir(solo_lectura=True)
         try:
-            conn.execute(sql)
-            conn.commit()
-        except Exception:
-            pass
-    # Sanear NULL en division/temporada de gi_marcador (registros anteriores a la migración)
-    try:
-        conn.execute("UPDATE gi_marcador SET division=1 WHERE division IS NULL")
-        conn.execute("UPDATE gi_marcador SET temporada=1 WHERE temporada IS NULL")
-        conn.execute("UPDATE gi_marcador SET victorias_temp=0 WHERE victorias_temp IS NULL")
-        conn.commit()
-    except Exception:
-        pass
-    conn.close()
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            try:
+                self._libres.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    def cerrar(self):
+        with self._lock:
+            if self._escritor is not None:
+                self._escritor.close()
+                self._escritor = None
+        while True:
+            try:
+                self._libres.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+_POOL = None
+
+def _pool() -> _PoolSQLite:
+    global _POOL
+    if _POOL is None or _POOL.path != DB_PATH:
+        _POOL = _PoolSQLite(DB_PATH, DB_LECTORES)
+    return _POOL
 
 def get_conn():
-    return sqlite3.connect(DB_PATH)
+    """Conexión de escritura. Hace commit al salir del bloque (o rollback si hay excepción)."""
+    return _pool().escritura()
 
-def get_idioma(chat_key: str) -> str:
+def get_conn_lectura():
+    """Conexión de solo lectura del pool, para helpers que únicamente consultan."""
+    return _pool().lectura()
+
+def transaccion():
+    """Agrupa varias llamadas a helpers en una sola transacción:
+
+        with transaccion():
+            sumar_victoria(chat_key, uid)
+            sumar_vez_impostor(chat_key, uid)
+
+    Los get_conn() anidados reutilizan la misma conexión y solo se confirma
+    al salir. No hacer await dentro del bloque.
+    """
+    return _pool().escritura()
+
+def cerrar_db():
+    if _POOL is not None:
+        _POOL.cerrar()
+
+
+# ── Acceso asíncrono ──
+# Los handlers no deben tocar SQLite en el event loop: un commit o un
+# checkpoint lento frenaría a todos los grupos a la vez. db() ejecuta el
+# helper síncrono en los hilos de SQLite y espera el resultado.
+_DB_EXECUTOR = ThreadPoolExecutor(max_workers=DB_LECTORES + 1, thread_name_prefix="sqlite")
+WAL_CHECKPOINT_SEGUNDOS = 30
+
+async def db(fn, *args, **kwargs):
+    """Corre fn en el executor de DB sin bloquear el event loop.
+    Uso: partida = await db(get_partida, chat_key)"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_DB_EXECUTOR, functools.partial(fn, *args, **kwargs))
+
+def _checkpoint_wal():
     with get_conn() as conn:
-        row = conn.execute("SELECT idioma FROM config WHERE chat_key=?", (chat_key,)).fetchone()
-    return row[0] if row else "es"
+        conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+async def _checkpoint_wal_periodico():
+    while True:
+        await asyncio.sleep(WAL_CHECKPOINT_SEGUNDOS)
+        try:
+            await db(_checkpoint_wal)
+        except Exception as e:
+            logger.warning(f"[DB] checkpoint WAL fallido: {e}")
+
+# ── Cache de configuración por chat ──
+# t() consulta el idioma en cada texto; la config cambia muy poco, así que se
+# guarda en memoria y los setters la actualizan al escribir (write-through).
+# El lock evita que una lectura lenta deje en cache un valor ya reemplazado.
+_config_cache: dict = {}      # chat_key → (idioma, timezone_offset)
+_gi_activo_cache: dict = {}   # chat_id → bool
+_cache_lock = threading.Lock()
+CACHE_STATS = {
+    "config":    {"hit": 0, "miss": 0},
+    "gi_activo": {"hit": 0, "miss": 0},
+}
+
+def _get_config(chat_key: str) -> tuple:
+    cfg = _config_cache.get(chat_key)
+    if cfg is not None:
+        CACHE_STATS["config"]["hit"] += 1
+        return cfg
+    with _cache_lock:
+        CACHE_STATS["config"]["miss"] += 1
+        with get_conn_lectura() as conn:
+            row = conn.execute(
+                "SELECT idioma, timezone_offset FROM config WHERE chat_key=?", (chat_key,)
+            ).fetchone()
+        cfg = (row[0] or "es", row[1] or 0) if row else ("es", 0)
+        _config_cache[chat_key] = cfg
+    return cfg
+
+def get_idioma(chat_key: str) -> str:
+    return _get_config(chat_key)[0]
 
 def set_idioma(chat_key: str, idioma: str):
-    with get_conn() as conn:
-        conn.execute(
-            "INSERT OR REPLACE INTO config (chat_key, idioma) VALUES (?,?)",
-            (chat_key, idioma)
-        )
+    with _cache_lock:
+        with get_conn() as conn:
+            conn.execute(
+                "INSERT INTO config (chat_key, idioma) VALUES (?,?) "
+                "ON CONFLICT(chat_key) DO UPDATE SET idioma=excluded.idioma",
+                (chat_key, idioma)
+            )
+        _config_cache.pop(chat_key, None)
+
+def get_timezone_offset(chat_key: str) -> int:
+    """Zona horaria por defecto del grupo (la última usada en /program)."""
+    return _get_config(chat_key)[1]
+
+def set_timezone_offset(chat_key: str, offset: int):
+    with _cache_lock:
+        with get_conn() as conn:
+            conn.execute(
+                "INSERT INTO config (chat_key, timezone_offset) VALUES (?,?) "
+                "ON CONFLICT(chat_key) DO UPDATE SET timezone_offset=excluded.timezone_offset",
+                (chat_key, offset)
+            )
+        _config_cache.pop(chat_key, None)
 
 def get_palabras_custom(chat_key: str) -> list:
-    with get_conn() as conn:
+    with get_conn_lectura() as conn:
         rows = conn.execute(
             "SELECT palabra FROM palabras_custom WHERE chat_key=? ORDER BY id",
             (chat_key,)
@@ -1672,32 +2270,379 @@ def remove_palabra_custom(chat_key: str, palabra: str) -> bool:
         ).rowcount
     return rows > 0
 
-def get_partida(chat_key):
+def get_pistas_cache(palabra: str, categoria: str, idioma: str):
+    with get_conn_lectura() as conn:
+        row = conn.execute(
+            "SELECT pistas FROM pistas_cache WHERE palabra=? AND categoria=? AND idioma=?",
+            (palabra, categoria, idioma)
+        ).fetchone()
+    return row[0] if row else None
+
+def set_pistas_cache(palabra: str, categoria: str, idioma: str, pistas: str):
     with get_conn() as conn:
-        return conn.execute("SELECT * FROM partidas WHERE chat_key=?", (chat_key,)).fetchone()
+        conn.execute(
+            "INSERT OR REPLACE INTO pistas_cache (palabra, categoria, idioma, pistas) VALUES (?,?,?,?)",
+            (palabra, categoria, idioma, pistas)
+        )
 
-def get_jugadores_activos(chat_key):
+def get_pistas_cacheadas() -> set:
+    with get_conn_lectura() as conn:
+        rows = conn.execute("SELECT palabra, categoria, idioma FROM pistas_cache").fetchall()
+    return set(rows)
+
+def get_imagen_subida(hash_png: str):
+    with get_conn_lectura() as conn:
+        row = conn.execute(
+            "SELECT file_id FROM imagenes_subidas WHERE hash=?", (hash_png,)
+        ).fetchone()
+    return row[0] if row else None
+
+def set_imagen_subida(hash_png: str, file_id: str, n_bytes: int):
     with get_conn() as conn:
-        return conn.execute(
-            "SELECT user_id, username FROM partida_jugadores WHERE chat_key=?", (chat_key,)
-        ).fetchall()
+        conn.execute(
+            """INSERT INTO imagenes_subidas (hash, file_id, bytes) VALUES (?,?,?)
+               ON CONFLICT(hash) DO UPDATE SET file_id=excluded.file_id""",
+            (hash_png, file_id, n_bytes)
+        )
+
+def sumar_uso_imagen(hash_png: str):
+    """Un envío por file_id: cuenta como `bytes` que no se volvieron a subir."""
+    with get_conn() as conn:
+        conn.execute("UPDATE imagenes_subidas SET usos = usos + 1 WHERE hash=?", (hash_png,))
 
-def get_marcador(chat_key):
+def borrar_imagen_subida(hash_png: str):
     with get_conn() as conn:
+        conn.execute("DELETE FROM imagenes_subidas WHERE hash=?", (hash_png,))
+
+def get_stats_imagenes_subidas():
+    """(imágenes distintas, bytes subidos, bytes ahorrados)."""
+    with get_conn_lectura() as conn:
         return conn.execute(
-            """SELECT j.user_id, j.username, j.victorias, j.derrotas
-               FROM jugadores j
-               INNER JOIN partida_jugadores pj ON j.chat_key = pj.chat_key AND j.user_id = pj.user_id
-               WHERE j.chat_key=? ORDER BY (j.victorias - j.derrotas) DESC, j.victorias DESC""",
-            (chat_key,)
+            "SELECT COUNT(*), COALESCE(SUM(bytes), 0), COALESCE(SUM(bytes * usos), 0) FROM imagenes_subidas"
+        ).fetchone()
+
+# ── Estado de partidas en memoria ──
+# Mientras el proceso corre, EstadoPartida es la única autoridad sobre una
+# partida: la fila de partidas, los jugadores activos y el estado de juego
+# (turno, votos, adivinanza…). Los cambios de la fila y de partida_jugadores
+# se marcan como sucios y se escriben a la DB en lotes cada
+# PARTIDAS_CHECKPOINT_SEGUNDOS y al apagar. Los helpers pueden correr en los
+# hilos de db(), por eso todo cambio va bajo _partidas_lock.
+# En el mismo checkpoint se guarda un snapshot del estado de juego de cada
+# partida activa que cambió (partidas_snapshot), y al arrancar se reanudan.
+# Las partidas sin juego activo (terminadas o de chats que solo consultaron)
+# se sacan de memoria tras PARTIDAS_DESALOJO_SEGUNDOS, ya escritas; el
+# checkpoint solo recorre las activas y las sucias, no todo _partidas.
+PARTIDAS_CHECKPOINT_SEGUNDOS = 2
+PARTIDAS_DESALOJO_SEGUNDOS   = 60
+_ESTADOS_ACTIVOS  = ("jugando", "adivinando", "iniciando", "esperando")
+_CAMPOS_SNAPSHOT  = ("turno", "votos", "revotacion", "adivinando", "votacion_sin_resultado",
+                     "multiplicador", "num_impostores", "imp_config")
+
+_COLUMNAS_PARTIDA = ("chat_key", "chat_id", "estado", "categoria", "palabra",
+                     "impostor_ids", "vivos", "ronda", "creador_id")
+
+# Rol y vida de cada jugador: en memoria un dict {user_id: [rol, vivo]} y en
+# la DB una fila por jugador en partida_estado_jugador. Las columnas de texto
+# impostor_ids/vivos de partidas quedan como copia legada (solo se escriben,
+# nunca se parsean).
+ROL_IMPOSTOR = "impostor"
+ROL_INOCENTE = "inocente"
+
+
+class EstadoPartida:
+    __slots__ = _COLUMNAS_PARTIDA + (
+        "jugadores",                 # [(user_id, username)] en orden de llegada
+        "roles",                     # {user_id: [rol, vivo]} mientras se juega
+        # Estado de juego que solo vive en memoria
+        "turno", "votos", "revotacion", "adivinando", "votacion_sin_resultado",
+        "multiplicador", "num_impostores", "imp_config",
+    )
+
+    def __init__(self, chat_key: str, fila=None, jugadores=(), roles=()):
+        for campo in self.__slots__:
+            setattr(self, campo, None)
+        if fila:
+            for campo, valor in zip(_COLUMNAS_PARTIDA, fila):
+                setattr(self, campo, valor)
+        self.chat_key  = chat_key
+        self.jugadores = [tuple(j) for j in jugadores]
+        if roles:
+            self.roles = {uid: [rol, vivo] for uid, rol, vivo in roles}
+
+    def fila(self) -> tuple:
+        """Misma forma que SELECT * FROM partidas."""
+        return tuple(getattr(self, campo) for campo in _COLUMNAS_PARTIDA)
+
+    def actualizar_legado(self):
+        """Regenera las columnas de texto impostor_ids/vivos desde roles."""
+        roles = self.roles or {}
+        self.impostor_ids = ",".join(str(u) for u, (rol, _) in roles.items() if rol == ROL_IMPOSTOR) or None
+        self.vivos        = ",".join(str(u) for u, (_, vivo) in roles.items() if vivo) or None
+
+    def sacar(self, campo: str, defecto=None):
+        """Como bot_data.pop: devuelve el valor y lo deja en None."""
+        valor = getattr(self, campo)
+        setattr(self, campo, None)
+        return defecto if valor is None else valor
+
+
+_partidas: dict = {}             # chat_key → EstadoPartida
+_partidas_sucias: set = set()
+_roles_sucios: set = set()       # (chat_key, user_id) con 'vivo' cambiado
+_roles_nuevos: set = set()       # chat_key cuyos roles se reescriben enteros
+_partidas_activas: set = set()        # chat_key con estado en _ESTADOS_ACTIVOS
+_partidas_desalojables: dict = {}     # chat_key sin juego activo → desde cuándo (monotonic)
+_partidas_lock = threading.RLock()
+
+def juego(chat_key: str) -> EstadoPartida:
+    """EstadoPartida de chat_key; la primera vez se carga desde la DB.
+    En los handlers la carga ya la hizo _precargar_partida en un hilo de db();
+    los helpers que modifican la partida lo llaman con _partidas_lock tomado."""
+    e = _partidas.get(chat_key)
+    if e is None:
+        with _partidas_lock:
+            e = _partidas.get(chat_key)
+            if e is None:
+                with get_conn_lectura() as conn:
+                    fila = conn.execute("SELECT * FROM partidas WHERE chat_key=?", (chat_key,)).fetchone()
+                    jugadores = conn.execute(
+                        "SELECT user_id, username FROM partida_jugadores WHERE chat_key=? ORDER BY rowid",
+                        (chat_key,)
+                    ).fetchall()
+                    roles = conn.execute(
+                        "SELECT user_id, rol, vivo FROM partida_estado_jugador WHERE chat_key=? ORDER BY rowid",
+                        (chat_key,)
+                    ).fetchall()
+                e = _partidas[chat_key] = EstadoPartida(chat_key, fila, jugadores, roles)
+                if e.estado in _ESTADOS_ACTIVOS:
+                    _partidas_activas.add(chat_key)
+                else:
+                    _partidas_desalojables[chat_key] = time.monotonic()
+    return e
+
+def desalojar_partidas() -> int:
+    """Saca de memoria las partidas sin juego activo que llevan
+    PARTIDAS_DESALOJO_SEGUNDOS así y no tienen nada pendiente de escribir.
+    Si se vuelven a pedir, juego() las recarga de la DB."""
+    limite = time.monotonic() - PARTIDAS_DESALOJO_SEGUNDOS
+    desalojadas = 0
+    with _partidas_lock:
+        vencidas = [ck for ck, desde in _partidas_desalojables.items() if desde <= limite]
+        for chat_key in vencidas:
+            del _partidas_desalojables[chat_key]
+            e = _partidas.get(chat_key)
+            if (e is None or e.estado in _ESTADOS_ACTIVOS or chat_key in _partidas_sucias
+                    or chat_key in _roles_nuevos or chat_key in _snapshots_guardados):
+                continue
+            del _partidas[chat_key]
+            desalojadas += 1
+    return desalojadas
+
+# ── Snapshots del estado de juego ──
+# JSON con etiquetas para no perder tipos: {"t": [...]} tupla, {"s": [...]}
+# set y {"d": [[k, v], ...]} dict (las claves son user_id enteros).
+def _a_json(valor):
+    if isinstance(valor, tuple):
+        return {"t": [_a_json(v) for v in valor]}
+    if isinstance(valor, (set, frozenset)):
+        return {"s": [_a_json(v) for v in valor]}
+    if isinstance(valor, list):
+        return [_a_json(v) for v in valor]
+    if isinstance(valor, dict):
+        return {"d": [[_a_json(k), _a_json(v)] for k, v in valor.items()]}
+    return valor
+
+def _de_json(valor):
+    if isinstance(valor, list):
+        return [_de_json(v) for v in valor]
+    if isinstance(valor, dict):
+        (tipo, datos), = valor.items()
+        if tipo == "t":
+            return tuple(_de_json(v) for v in datos)
+        if tipo == "s":
+            return {_de_json(v) for v in datos}
+        return {_de_json(k): _de_json(v) for k, v in datos}
+    return valor
+
+_snapshots_guardados: dict = {}   # chat_key → último JSON escrito
+
+def snapshots_cambiados() -> tuple:
+    """Serializa el estado de juego de las partidas activas y devuelve solo lo
+    que cambió desde el último checkpoint: (upserts [(chat_key, json)], borrados).
+    Corre en el event loop, que es quien modifica esos dicts. Solo mira las
+    partidas activas, las sucias y las que tienen snapshot guardado."""
+    upserts, borrados = [], []
+    with _partidas_lock:
+        for chat_key in _partidas_activas | _partidas_sucias | _snapshots_guardados.keys():
+            e = _partidas.get(chat_key)
+            if e is None:
+                continue
+            datos = None
+            if e.estado in _ESTADOS_ACTIVOS:
+                _partidas_activas.add(chat_key)
+                _partidas_desalojables.pop(chat_key, None)
+                campos = {c: getattr(e, c) for c in _CAMPOS_SNAPSHOT if getattr(e, c) is not None}
+                if campos:
+                    datos = json.dumps(_a_json(campos), separators=(",", ":"))
+            else:
+                _partidas_activas.discard(chat_key)
+                _partidas_desalojables.setdefault(chat_key, time.monotonic())
+            previo = _snapshots_guardados.get(chat_key)
+            if datos == previo:
+                continue
+            if datos is None:
+                borrados.append(chat_key)
+                del _snapshots_guardados[chat_key]
+            else:
+                upserts.append((chat_key, datos))
+                _snapshots_guardados[chat_key] = datos
+    return upserts, borrados
+
+def guardar_partidas_sucias(snapshots=(), snapshots_borrados=()) -> int:
+    """Escribe a la DB las partidas modificadas desde el último checkpoint,
+    junto con sus snapshots, en una transacción."""
+    with _partidas_lock:
+        sucias = [_partidas[k] for k in _partidas_sucias]
+        _partidas_sucias.clear()
+        filas     = [e.fila() for e in sucias if e.estado is not None]
+        jugadores = [(e.chat_key, list(e.jugadores)) for e in sucias]
+        roles_nuevos, roles_sucios = set(_roles_nuevos), set(_roles_sucios)
+        _roles_nuevos.clear()
+        _roles_sucios.clear()
+        filas_roles = [
+            (chat_key, uid, rol, vivo)
+            for chat_key in roles_nuevos
+            for uid, (rol, vivo) in (_partidas[chat_key].roles or {}).items()
+        ]
+        vidas = [
+            (_partidas[chat_key].roles[uid][1], chat_key, uid)
+            for chat_key, uid in roles_sucios
+            if chat_key not in roles_nuevos and uid in (_partidas[chat_key].roles or {})
+        ]
+    if not sucias and not snapshots and not snapshots_borrados:
+        return 0
+    try:
+        with transaccion() as conn:
+            conn.executemany(
+                f"INSERT OR REPLACE INTO partidas ({', '.join(_COLUMNAS_PARTIDA)}) "
+                f"VALUES ({', '.join('?' * len(_COLUMNAS_PARTIDA))})",
+                filas
+            )
+            conn.executemany("DELETE FROM partida_jugadores WHERE chat_key=?",
+                             [(chat_key,) for chat_key, _ in jugadores])
+            conn.executemany(
+                "INSERT INTO partida_jugadores (chat_key, user_id, username) VALUES (?,?,?)",
+                [(chat_key, uid, uname) for chat_key, js in jugadores for uid, uname in js]
+            )
+            conn.executemany("DELETE FROM partida_estado_jugador WHERE chat_key=?",
+                             [(chat_key,) for chat_key in roles_nuevos])
+            conn.executemany(
+                "INSERT INTO partida_estado_jugador (chat_key, user_id, rol, vivo) VALUES (?,?,?,?)",
+                filas_roles
+            )
+            conn.executemany(
+                "UPDATE partida_estado_jugador SET vivo=? WHERE chat_key=? AND user_id=?", vidas
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO partidas_snapshot (chat_key, datos) VALUES (?,?)", snapshots
+            )
+            conn.executemany("DELETE FROM partidas_snapshot WHERE chat_key=?",
+                             [(chat_key,) for chat_key in snapshots_borrados])
+    except Exception:
+        with _partidas_lock:
+            _partidas_sucias.update(e.chat_key for e in sucias)
+            _roles_nuevos.update(roles_nuevos)
+            _roles_sucios.update(roles_sucios)
+            # Que el próximo checkpoint los vuelva a escribir
+            for chat_key, _ in snapshots:
+                _snapshots_guardados.pop(chat_key, None)
+            for chat_key in snapshots_borrados:
+                _snapshots_guardados[chat_key] = ""
+        raise
+    return len(sucias)
+
+async def _checkpoint_partidas_periodico():
+    while True:
+        await asyncio.sleep(PARTIDAS_CHECKPOINT_SEGUNDOS)
+        snapshots = snapshots_cambiados()
+        if _partidas_sucias or snapshots[0] or snapshots[1]:
+            try:
+                await db(guardar_partidas_sucias, *snapshots)
+            except Exception as e:
+                logger.error(f"[DB] checkpoint de partidas falló: {e}")
+                continue
+        desalojar_partidas()
+
+def reanudar_partidas() -> list:
+    """Al arrancar, reconstruye en memoria las partidas activas que tienen
+    snapshot (y los lobbies, que no lo necesitan). Retorna [(chat_key, chat_id)].
+    Sus timers los restaura TIMERS con el tiempo que les quedaba."""
+    with get_conn_lectura() as conn:
+        filas = conn.execute(
+            "SELECT p.chat_key, p.chat_id, p.estado, s.datos FROM partidas p "
+            "LEFT JOIN partidas_snapshot s ON s.chat_key = p.chat_key "
+            "WHERE p.estado IN ('jugando', 'adivinando', 'esperando')"
         ).fetchall()
+    reanudadas = []
+    for chat_key, chat_id, estado, datos in filas:
+        if datos is None and estado != "esperando":
+            continue
+        e = juego(chat_key)
+        if datos:
+            for campo, valor in _de_json(json.loads(datos)).items():
+                setattr(e, campo, valor)
+            _snapshots_guardados[chat_key] = datos
+        reanudadas.append((chat_key, chat_id))
+    return reanudadas
+
+def get_partida(chat_key):
+    e = juego(chat_key)
+    return e.fila() if e.estado is not None else None
+
+def get_jugadores_activos(chat_key):
+    return list(juego(chat_key).jugadores)
+
+# ── Ranking ──
+# jugadores.balance (victorias - derrotas) se mantiene en cada suma y está
+# indexado junto con victorias: las páginas y las posiciones se leen del
+# índice sin ordenar toda la tabla del chat.
+MARCADOR_POR_PAGINA = 15
+_SQL_RANKING = ("SELECT user_id, username, victorias, derrotas FROM jugadores "
+                "WHERE chat_key=? AND (victorias > 0 OR derrotas > 0) ORDER BY balance DESC, victorias DESC")
 
 def get_marcador_global(chat_key):
-    with get_conn() as conn:
-        return conn.execute(
-            "SELECT user_id, username, victorias, derrotas FROM jugadores WHERE chat_key=? AND (victorias > 0 OR derrotas > 0) ORDER BY (victorias - derrotas) DESC, victorias DESC",
+    with get_conn_lectura() as conn:
+        return conn.execute(_SQL_RANKING, (chat_key,)).fetchall()
+
+def get_pagina_marcador(chat_key, pagina: int, por_pagina: int = MARCADOR_POR_PAGINA) -> tuple:
+    """(filas de la página, total de jugadores con partidas). pagina empieza en 1."""
+    with get_conn_lectura() as conn:
+        total = conn.execute(
+            "SELECT COUNT(*) FROM jugadores WHERE chat_key=? AND (victorias > 0 OR derrotas > 0)",
             (chat_key,)
-        ).fetchall()
+        ).fetchone()[0]
+        filas = conn.execute(_SQL_RANKING + " LIMIT ? OFFSET ?",
+                             (chat_key, por_pagina, (pagina - 1) * por_pagina)).fetchall()
+    return filas, total
+
+def get_posicion(chat_key, user_id):
+    """Posición de user_id en el marcador (1 = primero), o None si no jugó."""
+    with get_conn_lectura() as conn:
+        row = conn.execute(
+            "SELECT balance, victorias FROM jugadores WHERE chat_key=? AND user_id=? "
+            "AND (victorias > 0 OR derrotas > 0)",
+            (chat_key, user_id)
+        ).fetchone()
+        if not row:
+            return None
+        balance, victorias = row
+        delante = conn.execute(
+            "SELECT COUNT(*) FROM jugadores WHERE chat_key=? AND (victorias > 0 OR derrotas > 0) "
+            "AND (balance > ? OR (balance = ? AND victorias > ?))",
+            (chat_key, balance, balance, victorias)
+        ).fetchone()[0]
+    return delante + 1
 
 def upsert_jugador(chat_key, user_id, username):
     with get_conn() as conn:
@@ -1705,47 +2650,58 @@ def upsert_jugador(chat_key, user_id, username):
             "INSERT OR IGNORE INTO jugadores (chat_key, user_id, username) VALUES (?,?,?)",
             (chat_key, user_id, username)
         )
-        conn.execute(
-            "UPDATE jugadores SET username=? WHERE chat_key=? AND user_id=?",
-            (username, chat_key, user_id)
-        )
+        # Solo si el nombre cambió: así no se invalidan las imágenes del marcador
+        cambio = conn.execute(
+            "UPDATE jugadores SET username=? WHERE chat_key=? AND user_id=? AND username IS NOT ?",
+            (username, chat_key, user_id, username)
+        ).rowcount
+    if cambio:
+        tocar_version("jugadores", chat_key)
 
 def agregar_jugador_activo(chat_key, user_id, username):
-    with get_conn() as conn:
-        conn.execute(
-            "INSERT OR IGNORE INTO partida_jugadores (chat_key, user_id, username) VALUES (?,?,?)",
-            (chat_key, user_id, username)
-        )
+    with _partidas_lock:
+        e = juego(chat_key)
+        if all(uid != user_id for uid, _ in e.jugadores):
+            e.jugadores.append((user_id, username))
+            _partidas_sucias.add(chat_key)
 
 def actualizar_nombre_activo(chat_key, user_id, username):
     """Actualiza el nombre del jugador activo si cambió en Telegram."""
+    with _partidas_lock:
+        e = juego(chat_key)
+        for i, (uid, uname) in enumerate(e.jugadores):
+            if uid == user_id and uname != username:
+                e.jugadores[i] = (user_id, username)
+                _partidas_sucias.add(chat_key)
     with get_conn() as conn:
-        conn.execute(
-            "UPDATE partida_jugadores SET username=? WHERE chat_key=? AND user_id=?",
-            (username, chat_key, user_id)
-        )
-        conn.execute(
-            "UPDATE jugadores SET username=? WHERE chat_key=? AND user_id=?",
-            (username, chat_key, user_id)
-        )
+        cambio = conn.execute(
+            "UPDATE jugadores SET username=? WHERE chat_key=? AND user_id=? AND username IS NOT ?",
+            (username, chat_key, user_id, username)
+        ).rowcount
+    if cambio:
+        tocar_version("jugadores", chat_key)
 
 def limpiar_jugadores_activos(chat_key):
-    with get_conn() as conn:
-        conn.execute("DELETE FROM partida_jugadores WHERE chat_key=?", (chat_key,))
+    with _partidas_lock:
+        e = juego(chat_key)
+        e.jugadores = []
+        _partidas_sucias.add(chat_key)
 
 def sumar_victoria(chat_key, user_id):
     with get_conn() as conn:
         conn.execute(
-            "UPDATE jugadores SET victorias = victorias + 1 WHERE chat_key=? AND user_id=?",
+            "UPDATE jugadores SET victorias = victorias + 1, balance = balance + 1 WHERE chat_key=? AND user_id=?",
             (chat_key, user_id)
         )
+    tocar_version("jugadores", chat_key)
 
 def sumar_derrota(chat_key, user_id):
     with get_conn() as conn:
         conn.execute(
-            "UPDATE jugadores SET derrotas = derrotas + 1 WHERE chat_key=? AND user_id=?",
+            "UPDATE jugadores SET derrotas = derrotas + 1, balance = balance - 1 WHERE chat_key=? AND user_id=?",
             (chat_key, user_id)
         )
+    tocar_version("jugadores", chat_key)
 
 def sumar_vez_impostor(chat_key, user_id):
     with get_conn() as conn:
@@ -1753,6 +2709,7 @@ def sumar_vez_impostor(chat_key, user_id):
             "UPDATE jugadores SET veces_impostor = veces_impostor + 1 WHERE chat_key=? AND user_id=?",
             (chat_key, user_id)
         )
+    tocar_version("jugadores", chat_key)
 
 def sumar_vez_inocente(chat_key, user_id):
     with get_conn() as conn:
@@ -1760,6 +2717,7 @@ def sumar_vez_inocente(chat_key, user_id):
             "UPDATE jugadores SET veces_inocente = veces_inocente + 1 WHERE chat_key=? AND user_id=?",
             (chat_key, user_id)
         )
+    tocar_version("jugadores", chat_key)
 
 def sumar_victoria_impostor(chat_key, user_id):
     with get_conn() as conn:
@@ -1767,6 +2725,7 @@ def sumar_victoria_impostor(chat_key, user_id):
             "UPDATE jugadores SET victorias_impostor = victorias_impostor + 1 WHERE chat_key=? AND user_id=?",
             (chat_key, user_id)
         )
+    tocar_version("jugadores", chat_key)
 
 def sumar_victoria_inocente(chat_key, user_id):
     with get_conn() as conn:
@@ -1774,26 +2733,165 @@ def sumar_victoria_inocente(chat_key, user_id):
             "UPDATE jugadores SET victorias_inocente = victorias_inocente + 1 WHERE chat_key=? AND user_id=?",
             (chat_key, user_id)
         )
+    tocar_version("jugadores", chat_key)
+
+# ── Versiones de marcadores ──
+# Cada escritura en jugadores / gi_marcador cambia la versión de ese chat;
+# las imágenes cacheadas se indexan por versión, así que un cambio las invalida.
+# La versión se cambia recién al confirmar la transacción, para que nadie
+# guarde en cache una imagen con datos viejos bajo la versión nueva.
+_versiones: dict = {}                 # (tabla, chat_key) → int
+_contador_versiones = itertools.count(1)
+
+def version_tabla(tabla: str, chat_key: str) -> int:
+    return _versiones.get((tabla, chat_key), 0)
+
+def tocar_version(tabla: str, chat_key: str):
+    def _tocar():
+        _versiones[(tabla, chat_key)] = next(_contador_versiones)
+    _pool().al_confirmar(_tocar)
+
+# Columnas de contadores de jugadores, en el orden del UPDATE de sumar_contadores
+_CONTADORES_JUGADOR = (
+    "victorias", "derrotas", "veces_impostor", "veces_inocente",
+    "victorias_impostor", "victorias_inocente",
+)
+_SQL_SUMAR_CONTADORES = "UPDATE jugadores SET {}, balance = balance + ? WHERE chat_key=? AND user_id=?".format(
+    ", ".join(f"{c} = {c} + ?" for c in _CONTADORES_JUGADOR)
+)
 
-def get_vivos(chat_key):
+def sumar_contadores(chat_key, incrementos: dict):
+    """Aplica de una vez los incrementos de varios jugadores, en lugar de un
+    UPDATE por jugador y contador.
+    incrementos = {user_id: {"victorias": 2, "victorias_inocente": 1}, ...}
+    """
+    filas = [
+        tuple(cols.get(c, 0) for c in _CONTADORES_JUGADOR)
+        + (cols.get("victorias", 0) - cols.get("derrotas", 0), chat_key, uid)
+        for uid, cols in incrementos.items()
+    ]
     with get_conn() as conn:
-        row = conn.execute("SELECT vivos FROM partidas WHERE chat_key=?", (chat_key,)).fetchone()
-    if not row or not row[0]:
-        return []
-    return [int(i) for i in row[0].split(",")]
+        conn.executemany(_SQL_SUMAR_CONTADORES, filas)
+    tocar_version("jugadores", chat_key)
+
+def crear_partida(chat_key, chat_id, creador_id):
+    """Partida nueva en 'esperando' (pisa la fila anterior del chat)."""
+    with _partidas_lock:
+        e = juego(chat_key)
+        e.chat_id, e.estado, e.creador_id, e.ronda = chat_id, "esperando", creador_id, 1
+        e.categoria = e.palabra = e.impostor_ids = e.vivos = e.roles = None
+        _partidas_sucias.add(chat_key)
+        _roles_nuevos.add(chat_key)
+
+def set_estado_partida(chat_key, estado, solo_si=None) -> int:
+    """Cambia el estado de la partida. Con solo_si, únicamente si el estado
+    actual coincide (para transiciones atómicas). Retorna las filas afectadas."""
+    with _partidas_lock:
+        e = juego(chat_key)
+        if e.estado is None or (solo_si is not None and e.estado != solo_si):
+            return 0
+        e.estado = estado
+        _partidas_sucias.add(chat_key)
+        return 1
 
-def set_vivos(chat_key, vivos_ids):
-    with get_conn() as conn:
-        conn.execute(
-            "UPDATE partidas SET vivos=? WHERE chat_key=?",
-            (",".join(str(i) for i in vivos_ids), chat_key)
+def set_partida_jugando(chat_key, categoria, palabra, impostor_ids, vivos_ids):
+    """Pasa la partida a 'jugando' con todos vivos; impostor_ids y vivos_ids
+    son listas de user_id."""
+    impostor_ids = set(impostor_ids)
+    with _partidas_lock:
+        e = juego(chat_key)
+        e.estado, e.categoria, e.palabra = "jugando", categoria, palabra
+        e.roles = {uid: [ROL_IMPOSTOR if uid in impostor_ids else ROL_INOCENTE, 1] for uid in vivos_ids}
+        e.actualizar_legado()
+        _partidas_sucias.add(chat_key)
+        _roles_nuevos.add(chat_key)
+
+def set_creador(chat_key, user_id):
+    with _partidas_lock:
+        e = juego(chat_key)
+        e.creador_id = user_id
+        _partidas_sucias.add(chat_key)
+
+def guardar_votos(chat_key, votos: dict):
+    """Guarda los votos de una ronda en votos_historial y suma cada par en
+    rivalidad, en la misma transacción (para /rivalidad y /rivales)."""
+    filas = [(chat_key, v_from, v_to) for v_from, v_to in votos.items()]
+    with transaccion() as conn:
+        conn.executemany("INSERT INTO votos_historial (chat_key, voter_id, voted_id) VALUES (?,?,?)", filas)
+        conn.executemany(
+            "INSERT INTO rivalidad (chat_key, voter_id, voted_id, veces) VALUES (?,?,?,1) "
+            "ON CONFLICT(chat_key, voter_id, voted_id) DO UPDATE SET veces = veces + 1",
+            filas
         )
 
+def get_rivalidad(chat_key, id_a, id_b) -> tuple:
+    """(votos de a a b, votos de b a a)."""
+    with get_conn_lectura() as conn:
+        veces = dict(conn.execute(_SQL_RIVALIDAD, (chat_key, id_a, id_b, id_b, id_a)).fetchall())
+    return veces.get(id_a, 0), veces.get(id_b, 0)
+
+RIVALES_TOP = 3
+
+def get_top_rivales(chat_key, user_id, k: int = RIVALES_TOP) -> tuple:
+    """Los k jugadores a los que user_id más votó y los k que más lo votaron:
+    ([(user_id, nombre, veces)], [(user_id, nombre, veces)])."""
+    with get_conn_lectura() as conn:
+        votados  = conn.execute(_SQL_TOP_VOTADOS, (chat_key, user_id, k)).fetchall()
+        votantes = conn.execute(_SQL_TOP_VOTANTES, (chat_key, user_id, k)).fetchall()
+    return votados, votantes
+
+def registrar_fin_partida(chat_key, ganador, palabra, categoria, incrementos: dict):
+    """Puntos, historial y estado 'terminada' en una sola transacción.
+    Retorna la fila (chat_id,) de la partida, o None si ya estaba terminada
+    (otro camino llegó antes al final): en ese caso no suma nada.
+    El estado en memoria se marca antes de escribir, así dos llamadas
+    simultáneas no pueden sumar las dos; si la transacción falla se restaura."""
+    with _partidas_lock:
+        e = juego(chat_key)
+        previo = e.estado
+        if previo in (None, "terminada"):
+            return None
+        e.estado = "terminada"
+        _partidas_sucias.add(chat_key)
+    try:
+        with transaccion() as conn:
+            sumar_contadores(chat_key, incrementos)
+            conn.execute("INSERT INTO historial (chat_key, ganador, palabra, categoria) VALUES (?,?,?,?)",
+                         (chat_key, ganador, palabra, categoria))
+            conn.execute("UPDATE partidas SET estado='terminada' WHERE chat_key=?", (chat_key,))
+    except Exception:
+        with _partidas_lock:
+            e.estado = previo
+        raise
+    return (e.chat_id,)
+
+def get_vivos(chat_key):
+    roles = juego(chat_key).roles
+    if not roles:
+        return []
+    return [uid for uid, (_, vivo) in roles.items() if vivo]
+
+def get_impostores(chat_key) -> set:
+    roles = juego(chat_key).roles
+    if not roles:
+        return set()
+    return {uid for uid, (rol, _) in roles.items() if rol == ROL_IMPOSTOR}
+
+def set_vivo(chat_key, user_id, vivo: bool):
+    """Cambia la vida de un jugador; al checkpoint se actualiza solo su fila."""
+    with _partidas_lock:
+        e = juego(chat_key)
+        if not e.roles or user_id not in e.roles:
+            return
+        e.roles[user_id][1] = int(vivo)
+        e.actualizar_legado()
+        _partidas_sucias.add(chat_key)
+        _roles_sucios.add((chat_key, user_id))
+
 def eliminar_de_vivos(chat_key, user_id):
-    vivos = get_vivos(chat_key)
-    vivos = [v for v in vivos if v != user_id]
-    set_vivos(chat_key, vivos)
-    return vivos
+    with _partidas_lock:
+        set_vivo(chat_key, user_id, False)
+        return get_vivos(chat_key)
 
 
 # ══════════════════════════════════════════════════════════════
@@ -1894,7 +2992,7 @@ def _tz_label(offset: int) -> str:
     return f"UTC{offset}"
 
 def get_programa_pendiente(chat_key: str):
-    with get_conn() as conn:
+    with get_conn_lectura() as conn:
         return conn.execute(
             "SELECT * FROM programacion WHERE chat_key=? AND estado='pendiente' ORDER BY id DESC LIMIT 1",
             (chat_key,)
@@ -1907,6 +3005,35 @@ def cancelar_programas_db(chat_key: str):
             (chat_key,)
         )
 
+def get_programa_por_id(prog_id: int):
+    """Programación pendiente por id, o None si ya arrancó o se canceló."""
+    with get_conn_lectura() as conn:
+        return conn.execute(
+            "SELECT * FROM programacion WHERE id=? AND estado='pendiente'",
+            (prog_id,)
+        ).fetchone()
+
+def get_programas_pendientes() -> list:
+    with get_conn_lectura() as conn:
+        return conn.execute("SELECT * FROM programacion WHERE estado='pendiente'").fetchall()
+
+def crear_programa(chat_key: str, chat_id: int, thread_id, hora_ts: int, puntos: int, tz: int) -> int:
+    with get_conn() as conn:
+        conn.execute(
+            "INSERT INTO programacion (chat_key, chat_id, thread_id, hora_inicio, puntos_victoria, tz_offset, estado) "
+            "VALUES (?,?,?,?,?,?,'pendiente')",
+            (chat_key, chat_id, thread_id, hora_ts, puntos, tz)
+        )
+        return conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+
+def set_estado_programa(prog_id: int, estado: str):
+    with get_conn() as conn:
+        conn.execute("UPDATE programacion SET estado=? WHERE id=?", (estado, prog_id))
+
+def set_mensaje_programa(prog_id: int, mensaje_id: int):
+    with get_conn() as conn:
+        conn.execute("UPDATE programacion SET mensaje_id=? WHERE id=?", (mensaje_id, prog_id))
+
 def _build_programa_setup_text(chat_key: str, setup: dict):
     lang   = get_idioma(chat_key)
     hora_ts = setup.get("hora_inicio")
@@ -1982,11 +3109,7 @@ async def _task_programa_countdown(chat_key: str, prog_id: int, bot, bot_data: d
     """Actualiza el countdown cada hora y lanza la partida a tiempo."""
     try:
         while True:
-            with get_conn() as conn:
-                prog = conn.execute(
-                    "SELECT * FROM programacion WHERE id=? AND estado='pendiente'",
-                    (prog_id,)
-                ).fetchone()
+            prog = await db(get_programa_por_id, prog_id)
             if not prog:
                 return
             hora_ts    = prog[4]
@@ -1999,8 +3122,7 @@ async def _task_programa_countdown(chat_key: str, prog_id: int, bot, bot_data: d
             restantes  = hora_ts - now_ts
 
             if restantes <= 60:
-                with get_conn() as conn:
-                    conn.execute("UPDATE programacion SET estado='activa' WHERE id=?", (prog_id,))
+                await db(set_estado_programa, prog_id, "activa")
                 await _iniciar_partida_programada(
                     chat_key, chat_id, thread_id, puntos, tz_offset, mensaje_id, bot, bot_data
                 )
@@ -2030,11 +3152,7 @@ async def _task_programa_countdown(chat_key: str, prog_id: int, bot, bot_data: d
                             message_thread_id=thread_id
                         )
                         mensaje_id = nuevo_msg.message_id
-                        with get_conn() as conn:
-                            conn.execute(
-                                "UPDATE programacion SET mensaje_id=? WHERE id=?",
-                                (mensaje_id, prog_id)
-                            )
+                        await db(set_mensaje_programa, prog_id, mensaje_id)
 
                 except Exception as e:
                     logger.warning(f"[PROGRAMA] Error actualizando countdown {chat_key}: {e}")
@@ -2060,13 +3178,9 @@ async def _iniciar_partida_programada(chat_key: str, chat_id: int, thread_id,
         logger.warning(f"[PROGRAMA] Partida ya activa en {chat_key}, omitiendo inicio programado")
         return
     limpiar_jugadores_activos(chat_key)
-    with get_conn() as conn:
-        conn.execute(
-            "INSERT OR REPLACE INTO partidas (chat_key, chat_id, estado, creador_id, ronda) VALUES (?,?,?,?,1)",
-            (chat_key, chat_id, "esperando", 0)
-        )
+    crear_partida(chat_key, chat_id, 0)
     if puntos > 1:
-        bot_data[f"multiplicador_{chat_key}"] = puntos
+        juego(chat_key).multiplicador = puntos
     lang = get_idioma(chat_key)
     if lang == "es":
         pts_txt = f"victorias valen *{puntos} {'punto' if puntos == 1 else 'puntos'}*"
@@ -2104,11 +3218,9 @@ async def _iniciar_partida_programada(chat_key: str, chat_id: int, thread_id,
                                message_thread_id=thread_id)
         lobby_msg_id = sent.message_id
 
-    # Lanzar timeout de 2 minutos para cancelar si nadie inicia
-    tarea = asyncio.create_task(
-        _timeout_lobby_programado(chat_key, chat_id, thread_id, lobby_msg_id, bot, bot_data)
-    )
-    bot_data[f"timeout_lobby_{chat_key}"] = tarea
+    # Timeout de 2 minutos para cancelar si nadie inicia
+    TIMERS.armar(chat_key, "lobby", TIMEOUT_LOBBY_SEGUNDOS,
+                 chat_id=chat_id, thread_id=thread_id, mensaje_id=lobby_msg_id)
     logger.info(f"[PROGRAMA] Partida programada iniciada en {chat_key}")
 
 
@@ -2121,8 +3233,6 @@ async def _timeout_lobby_programado(chat_key: str, chat_id: int, thread_id,
     - Con <3 jugadores → cancela automáticamente
     """
     try:
-        await asyncio.sleep(TIMEOUT_LOBBY_SEGUNDOS)
-
         partida = get_partida(chat_key)
         if not partida or partida[2] != "esperando":
             return  # Ya se inició o canceló por otro medio
@@ -2132,12 +3242,8 @@ async def _timeout_lobby_programado(chat_key: str, chat_id: int, thread_id,
 
         # ── Menos de 3 jugadores → cancelar ──────────────────────
         if len(jugadores) < 3:
-            with get_conn() as conn:
-                conn.execute(
-                    "UPDATE partidas SET estado='terminada' WHERE chat_key=? AND estado='esperando'",
-                    (chat_key,)
-                )
-            bot_data.pop(f"multiplicador_{chat_key}", None)
+            set_estado_partida(chat_key, "terminada", solo_si="esperando")
+            juego(chat_key).multiplicador = None
 
             if lang == "es":
                 texto_exp = (
@@ -2172,11 +3278,7 @@ async def _timeout_lobby_programado(chat_key: str, chat_id: int, thread_id,
         # ── 3 o más jugadores → iniciar automáticamente ──────────
         # El creador pasa a ser el primer jugador que se unió
         primer_jugador = jugadores[0]
-        with get_conn() as conn:
-            conn.execute(
-                "UPDATE partidas SET creador_id=? WHERE chat_key=?",
-                (primer_jugador[0], chat_key)
-            )
+        set_creador(chat_key, primer_jugador[0])
 
         if lang == "es":
             aviso_auto = (
@@ -2199,17 +3301,12 @@ async def _timeout_lobby_programado(chat_key: str, chat_id: int, thread_id,
 
         num_impostores   = calcular_num_impostores(len(jugadores))
         impostores       = random.sample(jugadores, num_impostores)
-        impostor_ids     = ",".join(str(i[0]) for i in impostores)
         impostor_ids_set = set(i[0] for i in impostores)
-        vivos_ids        = ",".join(str(j[0]) for j in jugadores)
+        vivos_ids        = [j[0] for j in jugadores]
 
-        with get_conn() as conn:
-            conn.execute(
-                "UPDATE partidas SET estado='jugando', categoria=?, palabra=?, impostor_ids=?, vivos=? WHERE chat_key=?",
-                (categoria, palabra, impostor_ids, vivos_ids, chat_key)
-            )
+        set_partida_jugando(chat_key, categoria, palabra, impostor_ids_set, vivos_ids)
 
-        pistas_raw = generar_pistas(palabra, categoria, chat_key)
+        pistas_raw = await generar_pistas(palabra, categoria, chat_key)
         pistas     = "\n".join(esc(l) for l in pistas_raw.splitlines())
 
         lang_cat = esc(categoria)
@@ -2218,17 +3315,19 @@ async def _timeout_lobby_programado(chat_key: str, chat_id: int, thread_id,
         else:
             texto_cat = f"Category: *{lang_cat}*"
 
+        await db(sumar_contadores, chat_key, {
+            uid: {"veces_impostor" if uid in impostor_ids_set else "veces_inocente": 1}
+            for uid, _ in jugadores
+        })
         fallidos = []
         for uid, uname in jugadores:
             try:
                 if uid in impostor_ids_set:
-                    msg_privado = t(chat_key, "eres_impostor").format(cat=esc(categoria))
-                    sumar_vez_impostor(chat_key, uid)
+                    msg_privado = tf(chat_key, "eres_impostor", cat=esc(categoria))
                 else:
-                    msg_privado = t(chat_key, "eres_inocente").format(
+                    msg_privado = tf(chat_key, "eres_inocente",
                         palabra=esc(palabra), cat=esc(categoria), pistas=pistas
                     )
-                    sumar_vez_inocente(chat_key, uid)
                 await bot.send_message(uid, msg_privado, parse_mode="MarkdownV2")
             except Exception:
                 fallidos.append(uname)
@@ -2237,7 +3336,7 @@ async def _timeout_lobby_programado(chat_key: str, chat_id: int, thread_id,
         random.shuffle(orden)
         turno_lista = "\n".join(f"  {i+1}\\. {esc(j[1])}" for i, j in enumerate(orden))
 
-        bot_data[f"turno_{chat_key}"] = {
+        juego(chat_key).turno = {
             "orden": [j[0] for j in orden],
             "index": 0,
             "ya_dieron_pista": set(),
@@ -2252,13 +3351,13 @@ async def _timeout_lobby_programado(chat_key: str, chat_id: int, thread_id,
         )
         aviso_fallidos = ""
         if fallidos:
-            aviso_fallidos = t(chat_key, "aviso_fallidos").format(
+            aviso_fallidos = tf(chat_key, "aviso_fallidos",
                 nombres=", ".join(esc(f) for f in fallidos)
             )
 
         await bot.send_message(
             chat_id,
-            t(chat_key, "partida_comienza").format(
+            tf(chat_key, "partida_comienza",
                 cat=texto_cat, orden=turno_lista, aviso_rondas=aviso_rondas
             ) + aviso_fallidos,
             parse_mode="MarkdownV2",
@@ -2302,7 +3401,7 @@ async def cmd_program(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(msg)
         return
     setup = {
-        "hora_inicio": None, "puntos": 1, "tz_offset": 0,
+        "hora_inicio": None, "puntos": 1, "tz_offset": get_timezone_offset(chat_key),
         "esperando_hora": False, "admin_id": user.id, "mensaje_setup_id": None,
     }
     ctx.bot_data[f"programa_setup_{chat_key}"] = setup
@@ -2335,14 +3434,13 @@ async def btn_programa(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
                 prog_id_c = int(cb_parts[2])
                 t_c = ctx.bot_data.pop(f"programa_tarea_{prog_id_c}", None)
                 if t_c: t_c.cancel()
-                with get_conn() as conn:
-                    conn.execute("UPDATE programacion SET estado='cancelada' WHERE id=?", (prog_id_c,))
+                await db(set_estado_programa, prog_id_c, "cancelada")
             except (ValueError, IndexError):
-                cancelar_programas_db(chat_key)
+                await db(cancelar_programas_db, chat_key)
         else:
             tarea_old = ctx.bot_data.pop(f"programa_tarea_{chat_key}", None)
             if tarea_old: tarea_old.cancel()
-            cancelar_programas_db(chat_key)
+            await db(cancelar_programas_db, chat_key)
         await query.answer()
         cancel_txt = "❌ *Partida programada cancelada\\.*" if lang == "es" else "❌ *Scheduled game cancelled\\.*"
         try:
@@ -2395,13 +3493,8 @@ async def btn_programa(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         hora_ts   = setup["hora_inicio"]
         puntos    = setup.get("puntos", 1)
         tz        = setup.get("tz_offset", 0)
-        with get_conn() as conn:
-            conn.execute(
-                "INSERT INTO programacion (chat_key, chat_id, thread_id, hora_inicio, puntos_victoria, tz_offset, estado) "
-                "VALUES (?,?,?,?,?,?,'pendiente')",
-                (chat_key, chat_id, thread_id, hora_ts, puntos, tz)
-            )
-            prog_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+        set_timezone_offset(chat_key, tz)   # queda como zona por defecto del grupo
+        prog_id = await db(crear_programa, chat_key, chat_id, thread_id, hora_ts, puntos, tz)
         await query.answer()
         try:
             await query.message.delete()
@@ -2416,8 +3509,7 @@ async def btn_programa(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
             chat_id, texto_cd, parse_mode="MarkdownV2",
             reply_markup=InlineKeyboardMarkup(kbd_cd), message_thread_id=thread_id
         )
-        with get_conn() as conn:
-            conn.execute("UPDATE programacion SET mensaje_id=? WHERE id=?", (msg_cd.message_id, prog_id))
+        await db(set_mensaje_programa, prog_id, msg_cd.message_id)
         tarea = asyncio.create_task(
             _task_programa_countdown(chat_key, prog_id, ctx.bot, ctx.bot_data)
         )
@@ -2522,34 +3614,23 @@ async def cmd_nueva(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         return
 
     # Cancelar timeout anterior si existía
-    tarea_anterior = ctx.bot_data.pop(f"timeout_lobby_{chat_key}", None)
-    if tarea_anterior:
-        tarea_anterior.cancel()
+    TIMERS.cancelar(chat_key, "lobby")
 
     limpiar_jugadores_activos(chat_key)
-
-    with get_conn() as conn:
-        conn.execute(
-            "INSERT OR REPLACE INTO partidas (chat_key, chat_id, estado, creador_id, ronda) VALUES (?,?,?,?,1)",
-            (chat_key, chat_id, "esperando", user.id)
-        )
-
-    upsert_jugador(chat_key, user.id, nombre(user))
+    crear_partida(chat_key, chat_id, user.id)
+    await db(upsert_jugador, chat_key, user.id, nombre(user))
     agregar_jugador_activo(chat_key, user.id, nombre(user))
 
     keyboard = [[InlineKeyboardButton(t(chat_key, "btn_unirse"), callback_data="unirse")]]
     msg = await update.message.reply_text(
-        t(chat_key, "nueva_partida").format(nombre=esc(nombre(user))),
+        tf(chat_key, "nueva_partida", nombre=esc(nombre(user))),
         parse_mode="MarkdownV2",
         reply_markup=InlineKeyboardMarkup(keyboard)
     )
 
-    # Lanzar timeout de 2 minutos
-    thread_id = get_thread_id(chat_key)
-    tarea = asyncio.create_task(
-        _timeout_lobby_programado(chat_key, chat_id, thread_id, msg.message_id, ctx.bot, ctx.bot_data)
-    )
-    ctx.bot_data[f"timeout_lobby_{chat_key}"] = tarea
+    # Timeout de 2 minutos
+    TIMERS.armar(chat_key, "lobby", TIMEOUT_LOBBY_SEGUNDOS,
+                 chat_id=chat_id, thread_id=get_thread_id(chat_key), mensaje_id=msg.message_id)
 
 
 async def cmd_unirse(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
@@ -2590,7 +3671,8 @@ async def btn_unirse(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     # Verificar condiciones de error ANTES de llamar answer()
     # (Telegram solo permite una llamada a answer() por callback)
     partida = get_partida(chat_key)
-    logger.info(f"[btn_unirse] user={user.id} partida_estado={partida[2] if partida else None} activos={[j[0] for j in get_jugadores_activos(chat_key)]}")
+    activos = get_jugadores_activos(chat_key)
+    logger.info(f"[btn_unirse] user={user.id} partida_estado={partida[2] if partida else None} activos={[j[0] for j in activos]}")
     if not partida or partida[2] == "terminada":
         await query.answer(t(chat_key, "sin_partida"), show_alert=True)
         # Intentar quitar los botones del mensaje expirado
@@ -2602,12 +3684,11 @@ async def btn_unirse(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     if partida[2] != "esperando":
         await query.answer(t(chat_key, "partida_en_curso"), show_alert=True)
         return
-    activos = get_jugadores_activos(chat_key)
     if user.id in [j[0] for j in activos]:
         await query.answer(t(chat_key, "ya_en_partida"), show_alert=True)
         return
     if len(activos) >= MAX_JUGADORES:
-        await query.answer(t(chat_key, "partida_llena").format(n=MAX_JUGADORES), show_alert=True)
+        await query.answer(tf(chat_key, "partida_llena", n=MAX_JUGADORES), show_alert=True)
         return
 
     await query.answer()
@@ -2628,10 +3709,10 @@ async def _unirse(chat_key, user, reply_fn, bot=None):
         return
 
     if len(activos) >= MAX_JUGADORES:
-        await reply_fn(t(chat_key, "partida_llena").format(n=MAX_JUGADORES))
+        await reply_fn(tf(chat_key, "partida_llena", n=MAX_JUGADORES))
         return
 
-    upsert_jugador(chat_key, user.id, nombre(user))
+    await db(upsert_jugador, chat_key, user.id, nombre(user))
     agregar_jugador_activo(chat_key, user.id, nombre(user))
     activos = get_jugadores_activos(chat_key)
 
@@ -2657,12 +3738,12 @@ async def _unirse(chat_key, user, reply_fn, bot=None):
         keyboard = [btn_unirse_row, btn_cancelar_row]
 
     sufijo = (
-        t(chat_key, "partida_llena").format(n=MAX_JUGADORES) if len(activos) >= MAX_JUGADORES
+        tf(chat_key, "partida_llena", n=MAX_JUGADORES) if len(activos) >= MAX_JUGADORES
         else t(chat_key, "puede_iniciar") if len(activos) >= 3
-        else t(chat_key, "faltan_jugadores").format(n=3 - len(activos))
+        else tf(chat_key, "faltan_jugadores", n=3 - len(activos))
     )
     await reply_fn(
-        t(chat_key, "unido").format(nombre=esc(nombre(user)), n=len(activos), lista=lista) + sufijo,
+        tf(chat_key, "unido", nombre=esc(nombre(user)), n=len(activos), lista=lista) + sufijo,
         parse_mode="MarkdownV2",
         reply_markup=InlineKeyboardMarkup(keyboard) if keyboard else None
     )
@@ -2686,15 +3767,11 @@ async def btn_cancelar_lobby(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         return
 
     # Cancelar timers y limpiar estado
-    for key in [f"timer_{chat_key}", f"timer_adiv_{chat_key}", f"timeout_lobby_{chat_key}"]:
-        t_obj = ctx.bot_data.pop(key, None)
-        if t_obj: t_obj.cancel()
-    for key in [f"turno_{chat_key}", f"adivinando_{chat_key}",
-                f"votos_{chat_key}", f"revotacion_{chat_key}"]:
-        ctx.bot_data.pop(key, None)
+    TIMERS.cancelar_grupo(chat_key)
+    e = juego(chat_key)
+    e.turno = e.adivinando = e.votos = e.revotacion = None
 
-    with get_conn() as conn:
-        conn.execute("UPDATE partidas SET estado='terminada' WHERE chat_key=?", (chat_key,))
+    set_estado_partida(chat_key, "terminada")
 
     await query.answer()
     lang = get_idioma(chat_key)
@@ -2730,19 +3807,16 @@ async def btn_iniciar_partida(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         if not es_admin and not (BOT_OWNER_ID and user.id == BOT_OWNER_ID):
             await query.answer(t(chat_key, "solo_creador_iniciar"), show_alert=True)
             return
-        with get_conn() as conn:
-            conn.execute("UPDATE partidas SET creador_id=? WHERE chat_key=?", (user.id, chat_key))
+        set_creador(chat_key, user.id)
 
     jugadores = get_jugadores_activos(chat_key)
     if len(jugadores) < 3:
-        await query.answer(t(chat_key, "pocos_jugadores").format(n=len(jugadores)), show_alert=True)
+        await query.answer(tf(chat_key, "pocos_jugadores", n=len(jugadores)), show_alert=True)
         return
 
     await query.answer()
     # Cancelar el timeout de lobby
-    tarea_timeout = ctx.bot_data.pop(f"timeout_lobby_{chat_key}", None)
-    if tarea_timeout:
-        tarea_timeout.cancel()
+    TIMERS.cancelar(chat_key, "lobby")
 
     es_manual = (partida[8] != 0)  # 0 = partida programada
 
@@ -2750,12 +3824,12 @@ async def btn_iniciar_partida(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     if len(jugadores) >= 5 and es_manual:
         max_imp = min(3, len(jugadores) - 2)  # máx impostores (siempre ≥2 inocentes)
         imp_default = calcular_num_impostores(len(jugadores))
-        ctx.bot_data[f"imp_config_{chat_key}"] = {"imp": imp_default, "max": max_imp, "n": len(jugadores)}
+        juego(chat_key).imp_config = {"imp": imp_default, "max": max_imp, "n": len(jugadores)}
         await _mostrar_config_impostores(chat_key, jugadores, query.message, ctx)
         return
 
     # Si no → ir directo a elegir categoría
-    categorias = cats(chat_key)
+    categorias = await db(cats, chat_key)
     keyboard = [
         [InlineKeyboardButton(cat, callback_data=f"cat:{cat}")]
         for cat in categorias
@@ -2770,16 +3844,16 @@ async def btn_iniciar_partida(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 
 async def _mostrar_config_impostores(chat_key, jugadores, message, ctx):
     """Muestra la pantalla de configuración de número de impostores."""
-    cfg = ctx.bot_data.get(f"imp_config_{chat_key}", {})
+    cfg = juego(chat_key).imp_config or {}
     imp = cfg.get("imp", 1)
     es_random = cfg.get("random", False)
     n   = cfg.get("n", len(jugadores))
 
     if es_random:
-        texto = t(chat_key, "config_impostores_random").format(n=n)
+        texto = tf(chat_key, "config_impostores_random", n=n)
         imp_label = "🎲"
     else:
-        texto = t(chat_key, "config_impostores").format(n=n, imp=imp)
+        texto = tf(chat_key, "config_impostores", n=n, imp=imp)
         imp_label = f"{'👤' * imp} {imp}"
 
     keyboard = [
@@ -2807,7 +3881,7 @@ async def btn_imp_config(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         await query.answer(t(chat_key, "solo_creador_iniciar"), show_alert=True)
         return
 
-    cfg = ctx.bot_data.get(f"imp_config_{chat_key}")
+    cfg = juego(chat_key).imp_config
     if not cfg:
         await query.answer()
         return
@@ -2829,10 +3903,10 @@ async def btn_imp_config(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     elif action == "confirmar":
         # Guardar elección y pasar a categoría
         if cfg.get("random"):
-            ctx.bot_data[f"num_impostores_{chat_key}"] = "random"
+            juego(chat_key).num_impostores = "random"
         else:
-            ctx.bot_data[f"num_impostores_{chat_key}"] = cfg["imp"]
-        ctx.bot_data.pop(f"imp_config_{chat_key}", None)
+            juego(chat_key).num_impostores = cfg["imp"]
+        juego(chat_key).imp_config = None
         await query.answer()
 
         categorias = cats(chat_key)
@@ -2852,10 +3926,10 @@ async def btn_imp_config(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     imp = cfg["imp"]
     es_random_r = cfg.get("random", False)
     if es_random_r:
-        texto = t(chat_key, "config_impostores_random").format(n=cfg["n"])
+        texto = tf(chat_key, "config_impostores_random", n=cfg["n"])
         imp_label_r = "🎲"
     else:
-        texto = t(chat_key, "config_impostores").format(n=cfg["n"], imp=imp)
+        texto = tf(chat_key, "config_impostores", n=cfg["n"], imp=imp)
         imp_label_r = f"{'👤' * imp} {imp}"
     keyboard = [
         [
@@ -2892,16 +3966,12 @@ async def btn_categoria(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     await query.answer()
 
     # Marcar como 'iniciando' atómicamente para bloquear segundos clics
-    with get_conn() as conn:
-        updated = conn.execute(
-            "UPDATE partidas SET estado='iniciando' WHERE chat_key=? AND estado='esperando'",
-            (chat_key,)
-        ).rowcount
+    updated = set_estado_partida(chat_key, "iniciando", solo_si="esperando")
     if updated == 0:
         return  # Otro proceso ya tomó el control
 
     try:
-        categorias = cats(chat_key)
+        categorias = await db(cats, chat_key)
         categoria_raw = query.data.split(":", 1)[1]
         es_random = (categoria_raw == "RANDOM")
         categoria = random.choice(list(categorias.keys())) if es_random else categoria_raw
@@ -2909,61 +3979,66 @@ async def btn_categoria(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         # Verificar que la categoria exista (por si acaso llegó un valor inválido)
         if categoria not in categorias:
             logger.error(f"[btn_categoria] categoria invalida: {categoria!r}")
-            with get_conn() as conn:
-                conn.execute("UPDATE partidas SET estado='esperando' WHERE chat_key=?", (chat_key,))
+            set_estado_partida(chat_key, "esperando")
             await query.message.reply_text("⚠️ Error al elegir categoría. Intenta de nuevo.")
             return
 
-        texto_cat_grupo = t(chat_key, "cat_sorpresa_grupo") if es_random else t(chat_key, "cat_grupo").format(cat=esc(categoria))
-        texto_cat_confirmacion = t(chat_key, "cat_sorpresa_grupo") if es_random else t(chat_key, "cat_confirmacion").format(cat=esc(categoria))
+        texto_cat_grupo = t(chat_key, "cat_sorpresa_grupo") if es_random else tf(chat_key, "cat_grupo", cat=esc(categoria))
+        texto_cat_confirmacion = t(chat_key, "cat_sorpresa_grupo") if es_random else tf(chat_key, "cat_confirmacion", cat=esc(categoria))
 
-        palabra = elegir_palabra(chat_key, categoria, categorias[categoria])
+        palabra = await db(elegir_palabra, chat_key, categoria, categorias[categoria])
         jugadores = get_jugadores_activos(chat_key)
         # Usar número configurado manualmente si existe
-        num_impostores = ctx.bot_data.pop(f"num_impostores_{chat_key}", None)
+        num_impostores = juego(chat_key).sacar("num_impostores")
         if num_impostores == "random":
             num_impostores = random.randint(1, min(3, len(jugadores) - 2))
         elif num_impostores is None:
             num_impostores = calcular_num_impostores(len(jugadores))
         num_impostores = max(1, min(num_impostores, len(jugadores) - 2))
         impostores = random.sample(jugadores, num_impostores)
-        impostor_ids = ",".join(str(i[0]) for i in impostores)
         impostor_ids_set = set(i[0] for i in impostores)
-        vivos_ids = ",".join(str(j[0]) for j in jugadores)
+        vivos_ids = [j[0] for j in jugadores]
 
-        with get_conn() as conn:
-            conn.execute(
-                "UPDATE partidas SET estado='jugando', categoria=?, palabra=?, impostor_ids=?, vivos=? WHERE chat_key=?",
-                (categoria, palabra, impostor_ids, vivos_ids, chat_key)
-            )
+        set_partida_jugando(chat_key, categoria, palabra, impostor_ids_set, vivos_ids)
 
     except Exception as e:
         # Si algo falla, devolver la partida a 'esperando' para que se pueda reintentar
         logger.error(f"[btn_categoria] error inesperado: {e}")
-        with get_conn() as conn:
-            conn.execute("UPDATE partidas SET estado='esperando' WHERE chat_key=?", (chat_key,))
+        set_estado_partida(chat_key, "esperando")
         await query.message.reply_text("⚠️ Ocurrió un error al iniciar la partida. Intenta de nuevo.")
         return
 
-    await query.edit_message_text(
-        f"{texto_cat_confirmacion}\n\n{t(chat_key, 'enviando_privado')}",
-        parse_mode="MarkdownV2"
-    )
+    # Pedir las pistas en paralelo mientras se edita el mensaje del grupo
+    tarea_pistas = asyncio.create_task(generar_pistas(palabra, categoria, chat_key))
 
-    pistas_raw = generar_pistas(palabra, categoria, chat_key)
+    try:
+        await query.edit_message_text(
+            f"{texto_cat_confirmacion}\n\n{t(chat_key, 'enviando_privado')}",
+            parse_mode="MarkdownV2"
+        )
+    except asyncio.CancelledError:
+        tarea_pistas.cancel()
+        raise
+    except Exception as e:
+        # Solo es la confirmación en el grupo: la partida sigue igual
+        logger.warning(f"[btn_categoria] no se pudo editar el mensaje de categoría: {e}")
+
+    pistas_raw = await tarea_pistas
     pistas = "\n".join(esc(linea) for linea in pistas_raw.splitlines())
 
+    await db(sumar_contadores, chat_key, {
+        uid: {"veces_impostor" if uid in impostor_ids_set else "veces_inocente": 1}
+        for uid, _ in jugadores
+    })
     fallidos = []
     for uid, uname in jugadores:
         try:
             if uid in impostor_ids_set:
-                msg = t(chat_key, "eres_impostor").format(cat=esc(categoria))
-                sumar_vez_impostor(chat_key, uid)
+                msg = tf(chat_key, "eres_impostor", cat=esc(categoria))
             else:
-                msg = t(chat_key, "eres_inocente").format(
+                msg = tf(chat_key, "eres_inocente",
                     palabra=esc(palabra), cat=esc(categoria), pistas=pistas
                 )
-                sumar_vez_inocente(chat_key, uid)
             await ctx.bot.send_message(uid, msg, parse_mode="MarkdownV2")
         except Exception:
             fallidos.append(uname)
@@ -2972,7 +4047,7 @@ async def btn_categoria(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     random.shuffle(orden)
     turno_lista = "\n".join(f"  {i+1}\\. {esc(j[1])}" for i, j in enumerate(orden))
 
-    ctx.bot_data[f"turno_{chat_key}"] = {
+    juego(chat_key).turno = {
         "orden": [j[0] for j in orden],
         "index": 0,
         "ya_dieron_pista": set(),
@@ -2983,7 +4058,7 @@ async def btn_categoria(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 
     aviso = ""
     if fallidos:
-        aviso = t(chat_key, "aviso_fallidos").format(
+        aviso = tf(chat_key, "aviso_fallidos",
             nombres=", ".join(esc(f) for f in fallidos)
         )
 
@@ -2995,7 +4070,7 @@ async def btn_categoria(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     thread_id = get_thread_id(chat_key)
     await ctx.bot.send_message(
         chat_id,
-        t(chat_key, "partida_comienza").format(
+        tf(chat_key, "partida_comienza",
             cat=texto_cat_grupo, orden=turno_lista, aviso_rondas=aviso_rondas
         ) + aviso,
         parse_mode="MarkdownV2",
@@ -3006,15 +4081,17 @@ async def btn_categoria(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     await _anunciar_turno(chat_key, primer[0], primer[1], chat_id, thread_id, ctx)
 
 
+TIMER_ABRIR_VOTACION_SEGUNDOS = 30
+TIMER_VOTACION_SEGUNDOS       = 60
+
 async def _timer_abrir_votacion(chat_key: str, chat_id: int, thread_id, ctx):
     """Abre la votación automáticamente después de 30 segundos."""
-    await asyncio.sleep(30)
     # Verificar que la partida sigue en jugando y no se abrió ya la votación
     partida = get_partida(chat_key)
     if not partida or partida[2] != "jugando":
         return
     # Verificar que no hay votación ya abierta
-    if ctx.bot_data.get(f"votos_{chat_key}") is not None:
+    if juego(chat_key).votos is not None:
         return
 
     vivos_ids = get_vivos(chat_key)
@@ -3025,12 +4102,12 @@ async def _timer_abrir_votacion(chat_key: str, chat_id: int, thread_id, ctx):
         [InlineKeyboardButton(f"🗳️ {j[1]}", callback_data=f"voto:{j[0]}")]
         for j in vivos
     ]
-    ctx.bot_data[f"votos_{chat_key}"] = {}
+    juego(chat_key).votos = {}
 
     try:
         await ctx.bot.send_message(
             chat_id,
-            t(chat_key, "votacion_auto").format(n=len(vivos)),
+            tf(chat_key, "votacion_auto", n=len(vivos)),
             parse_mode="MarkdownV2",
             reply_markup=InlineKeyboardMarkup(keyboard),
             message_thread_id=thread_id
@@ -3039,28 +4116,22 @@ async def _timer_abrir_votacion(chat_key: str, chat_id: int, thread_id, ctx):
         logger.error(f"[TIMER_VOTAR] Error auto-abriendo votación {chat_key}: {e}")
         return
 
-    # Lanzar timer de 1 minuto para auto-resolver
-    tarea = asyncio.create_task(_timer_resolver_votacion(chat_key, chat_id, thread_id, ctx))
-    ctx.bot_data[f"timer_votacion_{chat_key}"] = tarea
-    ctx.bot_data.pop(f"timer_abrir_votacion_{chat_key}", None)
+    # Timer de 1 minuto para auto-resolver
+    TIMERS.armar(chat_key, "resolver_votacion", TIMER_VOTACION_SEGUNDOS,
+                 chat_id=chat_id, thread_id=thread_id)
 
 
 async def _timer_resolver_votacion(chat_key: str, chat_id: int, thread_id, ctx):
     """Resuelve la votación automáticamente después de 1 minuto."""
-    await asyncio.sleep(60)
-
     partida = get_partida(chat_key)
     if not partida or partida[2] != "jugando":
-        ctx.bot_data.pop(f"timer_votacion_{chat_key}", None)
         return
 
-    votos = ctx.bot_data.get(f"votos_{chat_key}")
+    votos = juego(chat_key).votos
     if votos is None:
-        ctx.bot_data.pop(f"timer_votacion_{chat_key}", None)
         return
 
-    ctx.bot_data.pop(f"timer_votacion_{chat_key}", None)
-    ctx.bot_data.pop(f"votos_{chat_key}", None)
+    juego(chat_key).votos = None
 
     vivos_ids = get_vivos(chat_key)
     jugadores = get_jugadores_activos(chat_key)
@@ -3090,10 +4161,9 @@ async def _timer_resolver_votacion(chat_key: str, chat_id: int, thread_id, ctx):
         lang = get_idioma(chat_key)
 
         # ¿Ya ocurrió antes? → nueva ronda de pistas
-        if ctx.bot_data.get(f"votacion_sin_resultado_{chat_key}"):
-            ctx.bot_data.pop(f"votacion_sin_resultado_{chat_key}", None)
-            impostor_ids_raw = partida[5] or ""
-            impostor_ids_set = set(int(i) for i in impostor_ids_raw.split(",") if i.strip())
+        if juego(chat_key).votacion_sin_resultado:
+            juego(chat_key).votacion_sin_resultado = None
+            impostor_ids_set = get_impostores(chat_key)
             await ctx.bot.send_message(
                 chat_id,
                 t(chat_key, "segundo_empate"),
@@ -3106,12 +4176,12 @@ async def _timer_resolver_votacion(chat_key: str, chat_id: int, thread_id, ctx):
             )
         else:
             # Primera vez → reabrir votación
-            ctx.bot_data[f"votacion_sin_resultado_{chat_key}"] = True
+            juego(chat_key).votacion_sin_resultado = True
             keyboard = [
                 [InlineKeyboardButton(f"🗳️ {j[1]}", callback_data=f"voto:{j[0]}")]
                 for j in vivos
             ]
-            ctx.bot_data[f"votos_{chat_key}"] = {}
+            juego(chat_key).votos = {}
             msg_reopen = await ctx.bot.send_message(
                 chat_id,
                 t(chat_key, "votos_insuficientes"),
@@ -3120,13 +4190,13 @@ async def _timer_resolver_votacion(chat_key: str, chat_id: int, thread_id, ctx):
                 message_thread_id=thread_id
             )
             # Nuevo timer de 1 minuto
-            tarea2 = asyncio.create_task(_timer_resolver_votacion(chat_key, chat_id, thread_id, ctx))
-            ctx.bot_data[f"timer_votacion_{chat_key}"] = tarea2
+            TIMERS.armar(chat_key, "resolver_votacion", TIMER_VOTACION_SEGUNDOS,
+                         chat_id=chat_id, thread_id=thread_id)
         return
 
     # Hay alguien con 2+ votos → proceder con la eliminación
-    ctx.bot_data.pop(f"votacion_sin_resultado_{chat_key}", None)
-    ctx.bot_data[f"votos_{chat_key}"] = votos  # restaurar para resolver_votacion
+    juego(chat_key).votacion_sin_resultado = None
+    juego(chat_key).votos = votos  # restaurar para resolver_votacion
     await resolver_votacion(chat_key, ctx, partida, jugadores, vivos, votos, fake_msg)
 
 
@@ -3139,22 +4209,17 @@ async def _abrir_votacion(chat_key, ctx, message):
         [InlineKeyboardButton(f"🗳️ {j[1]}", callback_data=f"voto:{j[0]}")]
         for j in vivos
     ]
-    ctx.bot_data[f"votos_{chat_key}"] = {}
+    juego(chat_key).votos = {}
 
     await message.reply_text(
-        t(chat_key, "quien_es_impostor").format(n=len(vivos)),
+        tf(chat_key, "quien_es_impostor", n=len(vivos)),
         parse_mode="MarkdownV2",
         reply_markup=InlineKeyboardMarkup(keyboard)
     )
-    # Cancelar timer previo si existe (evita doble resolución)
-    prev_tv = ctx.bot_data.pop(f"timer_votacion_{chat_key}", None)
-    if prev_tv:
-        prev_tv.cancel()
-    # Lanzar timer de 1 minuto para auto-resolver
-    chat_id = message.chat.id
-    thread_id = get_thread_id(chat_key)
-    tarea = asyncio.create_task(_timer_resolver_votacion(chat_key, chat_id, thread_id, ctx))
-    ctx.bot_data[f"timer_votacion_{chat_key}"] = tarea
+    # Timer de 1 minuto para auto-resolver (re-armar reemplaza el previo,
+    # así no hay doble resolución)
+    TIMERS.armar(chat_key, "resolver_votacion", TIMER_VOTACION_SEGUNDOS,
+                 chat_id=message.chat.id, thread_id=get_thread_id(chat_key))
 
 
 async def btn_abrir_votar(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
@@ -3171,9 +4236,7 @@ async def btn_abrir_votar(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         return
 
     # Cancelar timer de auto-abrir si existe
-    tarea_abv = ctx.bot_data.pop(f"timer_abrir_votacion_{chat_key}", None)
-    if tarea_abv:
-        tarea_abv.cancel()
+    TIMERS.cancelar(chat_key, "abrir_votacion")
 
     await query.answer()
     await _abrir_votacion(chat_key, ctx, query.message)
@@ -3192,8 +4255,7 @@ async def cmd_votar(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         return
 
     # Cancelar timer de auto-abrir si existe
-    tav = ctx.bot_data.pop(f"timer_abrir_votacion_{chat_key}", None)
-    if tav: tav.cancel()
+    TIMERS.cancelar(chat_key, "abrir_votacion")
     await _abrir_votacion(chat_key, ctx, update.message)
 
 
@@ -3216,7 +4278,10 @@ async def btn_voto(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     vivos = [j for j in jugadores if j[0] in vivos_ids]
 
     votado_id = int(query.data.split(":")[1])
-    votos = ctx.bot_data.setdefault(f"votos_{chat_key}", {})
+    e = juego(chat_key)
+    if e.votos is None:
+        e.votos = {}
+    votos = e.votos
 
     if voter_id in votos:
         await query.answer(t(chat_key, "voto_ya"), show_alert=True)
@@ -3226,16 +4291,16 @@ async def btn_voto(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     await query.answer(t(chat_key, "voto_ok"))
 
     faltantes = len(vivos) - len(votos)
-    sufijo_faltantes = t(chat_key, "faltan_votos").format(n=faltantes) if faltantes > 0 else ""
-    await query.message.reply_text(
-        t(chat_key, "voto_confirmado").format(nombre=esc(query.from_user.first_name), faltantes=sufijo_faltantes),
-        parse_mode="MarkdownV2"
+    sufijo_faltantes = tf(chat_key, "faltan_votos", n=faltantes) if faltantes > 0 else ""
+    await responder(
+        query.message,
+        tf(chat_key, "voto_confirmado", nombre=esc(query.from_user.first_name), faltantes=sufijo_faltantes),
+        PRIORIDAD_JUEGO, parse_mode="MarkdownV2"
     )
 
     if len(votos) >= len(vivos):
         # Cancelar timer de auto-resolver (ya se resuelve ahora)
-        tv = ctx.bot_data.pop(f"timer_votacion_{chat_key}", None)
-        if tv: tv.cancel()
+        TIMERS.cancelar(chat_key, "resolver_votacion")
         await resolver_votacion(chat_key, ctx, partida, jugadores, vivos, votos, query.message)
 
 
@@ -3254,7 +4319,7 @@ async def btn_revoto(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         await query.answer(t(chat_key, "no_puedes_votar"), show_alert=True)
         return
 
-    datos = ctx.bot_data.get(f"revotacion_{chat_key}")
+    datos = juego(chat_key).revotacion
     if not datos:
         await query.answer(t(chat_key, "no_revotacion"), show_alert=True)
         return
@@ -3264,7 +4329,10 @@ async def btn_revoto(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         await query.answer(t(chat_key, "voto_invalido"), show_alert=True)
         return
 
-    votos = ctx.bot_data.setdefault(f"votos_{chat_key}", {})
+    e = juego(chat_key)
+    if e.votos is None:
+        e.votos = {}
+    votos = e.votos
     if voter_id in votos:
         await query.answer(t(chat_key, "voto_ya"), show_alert=True)
         return
@@ -3274,14 +4342,15 @@ async def btn_revoto(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 
     vivos = datos["vivos"]
     faltantes = len(vivos) - len(votos)
-    sufijo_faltantes = t(chat_key, "faltan_votos").format(n=faltantes) if faltantes > 0 else ""
-    await query.message.reply_text(
-        t(chat_key, "voto_confirmado_revoto").format(nombre=esc(query.from_user.first_name), faltantes=sufijo_faltantes),
-        parse_mode="MarkdownV2"
+    sufijo_faltantes = tf(chat_key, "faltan_votos", n=faltantes) if faltantes > 0 else ""
+    await responder(
+        query.message,
+        tf(chat_key, "voto_confirmado_revoto", nombre=esc(query.from_user.first_name), faltantes=sufijo_faltantes),
+        PRIORIDAD_JUEGO, parse_mode="MarkdownV2"
     )
 
     if len(votos) >= len(vivos):
-        ctx.bot_data.pop(f"revotacion_{chat_key}", None)
+        juego(chat_key).revotacion = None
 
         conteo2 = {}
         for v in votos.values():
@@ -3299,7 +4368,7 @@ async def btn_revoto(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
             partida_fresca = get_partida(chat_key)
             vivos_ids_actual = get_vivos(chat_key)
             jugadores_frescos = get_jugadores_activos(chat_key)
-            impostor_ids_set2 = set(int(i) for i in partida_fresca[5].split(","))
+            impostor_ids_set2 = get_impostores(chat_key)
             await _nueva_ronda_pistas(
                 chat_key, ctx, jugadores_frescos, vivos_ids_actual,
                 impostor_ids_set2, partida_fresca[4], partida_fresca[3], query.message
@@ -3327,20 +4396,20 @@ async def resolver_votacion(chat_key, ctx, partida, jugadores, vivos, votos, mes
         nombre_map = {j[0]: j[1] for j in jugadores_frescos}
         nombres_empatados = " y ".join(f"*{esc(nombre_map.get(e, '?'))}*" for e in empatados)
 
-        ctx.bot_data[f"revotacion_{chat_key}"] = {
+        juego(chat_key).revotacion = {
             "candidatos": empatados,
             "partida": partida,
             "jugadores": jugadores_frescos,
             "vivos": vivos_frescos,
         }
-        ctx.bot_data[f"votos_{chat_key}"] = {}
+        juego(chat_key).votos = {}
 
         keyboard = [
             [InlineKeyboardButton(f"🗳️ {nombre_map.get(uid, '?')}", callback_data=f"revoto:{uid}")]
             for uid in empatados
         ]
         await message.reply_text(
-            t(chat_key, "empate").format(nombres=nombres_empatados, n=max_votos),
+            tf(chat_key, "empate", nombres=nombres_empatados, n=max_votos),
             parse_mode="MarkdownV2",
             reply_markup=InlineKeyboardMarkup(keyboard)
         )
@@ -3354,8 +4423,7 @@ async def resolver_votacion(chat_key, ctx, partida, jugadores, vivos, votos, mes
     if not partida:
         return
 
-    impostor_ids_raw = partida[5] or ""
-    impostor_ids_set = set(int(i) for i in impostor_ids_raw.split(",") if i.strip())
+    impostor_ids_set = get_impostores(chat_key)
 
     todos_jugadores = get_jugadores_activos(chat_key)
     vivos_ids_frescos = get_vivos(chat_key)
@@ -3368,7 +4436,7 @@ async def resolver_votacion(chat_key, ctx, partida, jugadores, vivos, votos, mes
     if eliminado is None:
         eliminado = (eliminado_id, impostor_names_map.get(eliminado_id, str(eliminado_id)))
 
-    logger.info(f"[resolver_votacion] eliminado_id={eliminado_id} impostor_ids={impostor_ids_raw} impostor_ids_set={impostor_ids_set} es_impostor={eliminado_id in impostor_ids_set}")
+    logger.info(f"[resolver_votacion] eliminado_id={eliminado_id} impostor_ids_set={impostor_ids_set} es_impostor={eliminado_id in impostor_ids_set}")
     palabra = partida[4]
     categoria = partida[3]
 
@@ -3379,12 +4447,7 @@ async def resolver_votacion(chat_key, ctx, partida, jugadores, vivos, votos, mes
     )
 
     # Guardar votos en historial para estadísticas de rivalidad
-    with get_conn() as conn:
-        for v_from, v_to in votos.items():
-            conn.execute(
-                "INSERT INTO votos_historial (chat_key, voter_id, voted_id) VALUES (?,?,?)",
-                (chat_key, v_from, v_to)
-            )
+    await db(guardar_votos, chat_key, votos)
 
     es_impostor = eliminado_id in impostor_ids_set
     etiqueta = t(chat_key, "era_impostor") if es_impostor else t(chat_key, "era_inocente")
@@ -3396,19 +4459,15 @@ async def resolver_votacion(chat_key, ctx, partida, jugadores, vivos, votos, mes
     # Transferir creador si fue eliminado
     if eliminado_id == partida[8] and vivos_restantes_ids:
         nuevo_creador = vivos_restantes_ids[0]
-        with get_conn() as conn:
-            conn.execute(
-                "UPDATE partidas SET creador_id=? WHERE chat_key=?",
-                (nuevo_creador, chat_key)
-            )
+        set_creador(chat_key, nuevo_creador)
         nombre_nuevo = nombre_map.get(nuevo_creador, "?")
         await message.reply_text(
-            t(chat_key, "nuevo_creador").format(nombre=esc(nombre_nuevo)),
+            tf(chat_key, "nuevo_creador", nombre=esc(nombre_nuevo)),
             parse_mode="MarkdownV2"
         )
 
     await message.reply_text(
-        t(chat_key, "resultado_votacion").format(
+        tf(chat_key, "resultado_votacion",
             nombre=esc(eliminado[1]), etiqueta=etiqueta, detalle=detalle_votos
         ),
         parse_mode="MarkdownV2"
@@ -3416,10 +4475,9 @@ async def resolver_votacion(chat_key, ctx, partida, jugadores, vivos, votos, mes
 
     # ── Impostor votado → oportunidad de adivinar ──
     if es_impostor:
-        with get_conn() as conn:
-            conn.execute("UPDATE partidas SET estado='adivinando' WHERE chat_key=?", (chat_key,))
+        set_estado_partida(chat_key, "adivinando")
 
-        ctx.bot_data[f"adivinando_{chat_key}"] = {
+        juego(chat_key).adivinando = {
             "impostor_id": eliminado_id,
             "impostor_ids_set": impostor_ids_set,
             "palabra": palabra,
@@ -3434,15 +4492,12 @@ async def resolver_votacion(chat_key, ctx, partida, jugadores, vivos, votos, mes
         }
 
         await message.reply_text(
-            t(chat_key, "ultima_oportunidad").format(nombre=esc(eliminado[1]), cat=esc(categoria)),
+            tf(chat_key, "ultima_oportunidad", nombre=esc(eliminado[1]), cat=esc(categoria)),
             parse_mode="MarkdownV2"
         )
-        chat_id = message.chat.id
-        thread_id = get_thread_id(chat_key)
-        tarea = asyncio.create_task(
-            _timer_adivinanza(chat_key, eliminado[0], chat_id, thread_id, ctx)
-        )
-        ctx.bot_data[f"timer_adiv_{chat_key}"] = tarea
+        args = dict(impostor_id=eliminado[0], chat_id=message.chat.id, thread_id=get_thread_id(chat_key))
+        TIMERS.armar(chat_key, "aviso_adivinanza", TIMER_ADIV_SEGUNDOS // 2, **args)
+        TIMERS.armar(chat_key, "adivinanza", TIMER_ADIV_SEGUNDOS, **args)
         return
 
     # ── Inocente votado ──
@@ -3463,24 +4518,23 @@ async def resolver_votacion(chat_key, ctx, partida, jugadores, vivos, votos, mes
 
 TIMER_ADIV_SEGUNDOS = 30
 
-async def _timer_adivinanza(chat_key, impostor_id, chat_id, thread_id, ctx):
-    """Si el impostor no adivina en 30s, el grupo gana automáticamente."""
-    # Aviso a mitad de tiempo (15s)
-    await asyncio.sleep(TIMER_ADIV_SEGUNDOS // 2)
+async def _aviso_adivinanza(chat_key, impostor_id, chat_id, thread_id, ctx):
+    """Aviso a mitad del tiempo de adivinanza (15s)."""
     try:
-        datos = ctx.bot_data.get(f"adivinando_{chat_key}")
+        datos = juego(chat_key).adivinando
         if datos and datos.get("impostor_id") == impostor_id:
             nombre_j = next((j[1] for j in datos.get("jugadores", []) if j[0] == impostor_id), "?")
             await ctx.bot.send_message(
                 chat_id,
-                t(chat_key, "aviso_15s").format(nombre=esc_link(nombre_j), uid=impostor_id),
+                tf(chat_key, "aviso_15s", nombre=esc_link(nombre_j), uid=impostor_id),
                 parse_mode="MarkdownV2",
                 message_thread_id=thread_id
             )
     except Exception:
         pass
-    # Esperar los 15s restantes
-    await asyncio.sleep(TIMER_ADIV_SEGUNDOS // 2)
+
+async def _timer_adivinanza(chat_key, impostor_id, chat_id, thread_id, ctx):
+    """Si el impostor no adivina en 30s, el grupo gana automáticamente."""
     try:
         await _timer_adivinanza_body(chat_key, impostor_id, chat_id, thread_id, ctx)
     except Exception as e:
@@ -3489,7 +4543,7 @@ async def _timer_adivinanza(chat_key, impostor_id, chat_id, thread_id, ctx):
 async def _timer_adivinanza_body(chat_key, impostor_id, chat_id, thread_id, ctx):
 
     # Si ya fue respondido (datos limpiados), ignorar
-    datos = ctx.bot_data.pop(f"adivinando_{chat_key}", None)
+    datos = juego(chat_key).sacar("adivinando")
     if not datos:
         return
     # Verificar que sigue siendo el mismo impostor esperando
@@ -3524,7 +4578,7 @@ async def _timer_adivinanza_body(chat_key, impostor_id, chat_id, thread_id, ctx)
         if normalizar(intento) == normalizar(palabra):
             msg = await ctx.bot.send_message(
                 chat_id,
-                t(chat_key, "adivino").format(nombre=esc(nombre_j), palabra=esc(palabra)),
+                tf(chat_key, "adivino", nombre=esc(nombre_j), palabra=esc(palabra)),
                 parse_mode="MarkdownV2",
                 message_thread_id=thread_id
             )
@@ -3535,7 +4589,7 @@ async def _timer_adivinanza_body(chat_key, impostor_id, chat_id, thread_id, ctx)
         else:
             msg = await ctx.bot.send_message(
                 chat_id,
-                t(chat_key, "incorrecto").format(nombre=esc(nombre_j), texto=esc(intento.lower())),
+                tf(chat_key, "incorrecto", nombre=esc(nombre_j), texto=esc(intento.lower())),
                 parse_mode="MarkdownV2",
                 message_thread_id=thread_id
             )
@@ -3553,7 +4607,7 @@ async def _timer_adivinanza_body(chat_key, impostor_id, chat_id, thread_id, ctx)
         return
 
     # Sin intento → timeout real, el impostor eliminado no adivinó
-    msg_text = t(chat_key, "adiv_timeout").format(nombre=esc_link(nombre_j), uid=impostor_id)
+    msg_text = tf(chat_key, "adiv_timeout", nombre=esc_link(nombre_j), uid=impostor_id)
     msg = await ctx.bot.send_message(chat_id, msg_text, parse_mode="MarkdownV2", message_thread_id=thread_id)
 
     # Verificar si quedan otros impostores vivos antes de declarar ganador
@@ -3572,25 +4626,24 @@ async def _timer_adivinanza_body(chat_key, impostor_id, chat_id, thread_id, ctx)
 
 TIMER_TURNO_SEGUNDOS = 60
 
-async def _timer_turno(chat_key, user_id, chat_id, thread_id, ctx):
-    """Callback que se ejecuta cuando expira el tiempo de turno."""
-    # Aviso a mitad de tiempo (30s)
-    await asyncio.sleep(TIMER_TURNO_SEGUNDOS // 2)
+async def _aviso_turno(chat_key, user_id, chat_id, thread_id, ctx):
+    """Aviso a mitad del tiempo de turno (30s)."""
     try:
-        turno_data = ctx.bot_data.get(f"turno_{chat_key}")
+        turno_data = juego(chat_key).turno
         if turno_data and turno_data.get("index") < len(turno_data.get("orden", [])):
             if turno_data["orden"][turno_data["index"]] == user_id:
                 nombre_j = next((j[1] for j in get_jugadores_activos(chat_key) if j[0] == user_id), "?")
                 await ctx.bot.send_message(
                     chat_id,
-                    t(chat_key, "aviso_30s").format(nombre=esc_link(nombre_j), uid=user_id),
+                    tf(chat_key, "aviso_30s", nombre=esc_link(nombre_j), uid=user_id),
                     parse_mode="MarkdownV2",
                     message_thread_id=thread_id
                 )
     except Exception:
         pass
-    # Esperar los 30s restantes
-    await asyncio.sleep(TIMER_TURNO_SEGUNDOS // 2)
+
+async def _timer_turno(chat_key, user_id, chat_id, thread_id, ctx):
+    """Callback que se ejecuta cuando expira el tiempo de turno."""
     try:
         await _timer_turno_body(chat_key, user_id, chat_id, thread_id, ctx)
     except Exception as e:
@@ -3598,7 +4651,7 @@ async def _timer_turno(chat_key, user_id, chat_id, thread_id, ctx):
 
 async def _timer_turno_body(chat_key, user_id, chat_id, thread_id, ctx):
 
-    turno_data = ctx.bot_data.get(f"turno_{chat_key}")
+    turno_data = juego(chat_key).turno
     if not turno_data:
         return
     orden = turno_data["orden"]
@@ -3616,7 +4669,7 @@ async def _timer_turno_body(chat_key, user_id, chat_id, thread_id, ctx):
         # Tenía algo escrito → auto-confirmar
         await ctx.bot.send_message(
             chat_id,
-            t(chat_key, "turno_timeout_autoconf").format(nombre=esc_link(nombre_j), uid=user_id),
+            tf(chat_key, "turno_timeout_autoconf", nombre=esc_link(nombre_j), uid=user_id),
             parse_mode="MarkdownV2",
             message_thread_id=thread_id
         )
@@ -3630,7 +4683,7 @@ async def _timer_turno_body(chat_key, user_id, chat_id, thread_id, ctx):
         # No escribió nada → saltar turno
         await ctx.bot.send_message(
             chat_id,
-            t(chat_key, "turno_timeout").format(nombre=esc_link(nombre_j), uid=user_id),
+            tf(chat_key, "turno_timeout", nombre=esc_link(nombre_j), uid=user_id),
             parse_mode="MarkdownV2",
             message_thread_id=thread_id
         )
@@ -3645,13 +4698,13 @@ async def _timer_turno_body(chat_key, user_id, chat_id, thread_id, ctx):
         jugadores_iniciales = turno_data.get("jugadores_iniciales", len(orden))
 
         if jugadores_iniciales == 3 and ronda_pistas == 1:
-            ctx.bot_data.pop(f"turno_{chat_key}", None)
+            juego(chat_key).turno = None
             vivos_ids = get_vivos(chat_key)
             vivos = [j for j in jugadores if j[0] in vivos_ids]
             nuevo_orden = list(vivos)
             random.shuffle(nuevo_orden)
             turno_lista = "\n".join(f"  {i+1}\\. {esc(j[1])}" for i, j in enumerate(nuevo_orden))
-            ctx.bot_data[f"turno_{chat_key}"] = {
+            juego(chat_key).turno = {
                 "orden": [j[0] for j in nuevo_orden],
                 "index": 0,
                 "ya_dieron_pista": set(),
@@ -3659,20 +4712,20 @@ async def _timer_turno_body(chat_key, user_id, chat_id, thread_id, ctx):
                 "jugadores_iniciales": jugadores_iniciales,
                 "intentos_pista": {}
             }
-            await ctx.bot.send_message(chat_id, t(chat_key, "segunda_ronda").format(orden=turno_lista), parse_mode="MarkdownV2", message_thread_id=thread_id)
+            await ctx.bot.send_message(chat_id, tf(chat_key, "segunda_ronda", orden=turno_lista), parse_mode="MarkdownV2", message_thread_id=thread_id)
             primer = nuevo_orden[0]
             await _anunciar_turno(chat_key, primer[0], primer[1], chat_id, thread_id, ctx)
             return
 
-        ctx.bot_data.pop(f"turno_{chat_key}", None)
+        juego(chat_key).turno = None
         await ctx.bot.send_message(
             chat_id, t(chat_key, "todos_dieron_pista"), parse_mode="MarkdownV2",
             message_thread_id=thread_id,
             reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton(t(chat_key, "btn_abrir_votacion"), callback_data="abrir_votar")]])
         )
         # Timer de 30s para auto-abrir votación
-        tarea_abv = asyncio.create_task(_timer_abrir_votacion(chat_key, chat_id, thread_id, ctx))
-        ctx.bot_data[f"timer_abrir_votacion_{chat_key}"] = tarea_abv
+        TIMERS.armar(chat_key, "abrir_votacion", TIMER_ABRIR_VOTACION_SEGUNDOS,
+                     chat_id=chat_id, thread_id=thread_id)
         return
 
     siguiente_id = orden[siguiente_index]
@@ -3682,36 +4735,35 @@ async def _timer_turno_body(chat_key, user_id, chat_id, thread_id, ctx):
 
 async def _anunciar_turno(chat_key, user_id, nombre_j, chat_id, thread_id, ctx):
     """Anuncia el turno e inicia el timer de 1 minuto."""
-    # Cancelar timer anterior si existe, pero nunca el task propio
-    tarea_actual = asyncio.current_task()
-    tarea_anterior = ctx.bot_data.pop(f"timer_{chat_key}", None)
-    if tarea_anterior and tarea_anterior is not tarea_actual:
-        tarea_anterior.cancel()
+    # Cancelar timer anterior si existe
+    TIMERS.cancelar(chat_key, "aviso_turno", "turno")
 
     await asyncio.shield(ctx.bot.send_message(
         chat_id,
-        t(chat_key, "turno").format(nombre=esc_link(nombre_j), uid=user_id),
+        tf(chat_key, "turno", nombre=esc_link(nombre_j), uid=user_id),
         parse_mode="MarkdownV2",
-        message_thread_id=thread_id
+        message_thread_id=thread_id,
+        rate_limit_args=PRIORIDAD_JUEGO
     ))
 
     # Iniciar nuevo timer
-    tarea = asyncio.create_task(_timer_turno(chat_key, user_id, chat_id, thread_id, ctx))
-    ctx.bot_data[f"timer_{chat_key}"] = tarea
+    args = dict(user_id=user_id, chat_id=chat_id, thread_id=thread_id)
+    TIMERS.armar(chat_key, "aviso_turno", TIMER_TURNO_SEGUNDOS // 2, **args)
+    TIMERS.armar(chat_key, "turno", TIMER_TURNO_SEGUNDOS, **args)
 
 
 async def _nueva_ronda_pistas(chat_key, ctx, jugadores, vivos_ids, impostor_ids_set, palabra, categoria, message):
     # Limpiar estado de votación anterior para que _timer_abrir_votacion funcione correctamente
-    ctx.bot_data.pop(f"votos_{chat_key}", None)
-    ctx.bot_data.pop(f"revotacion_{chat_key}", None)
-    ctx.bot_data.pop(f"timer_votacion_{chat_key}", None)
+    juego(chat_key).votos = None
+    juego(chat_key).revotacion = None
+    TIMERS.cancelar(chat_key, "resolver_votacion")
 
     vivos = [j for j in jugadores if j[0] in vivos_ids]
     orden = list(vivos)
     random.shuffle(orden)
     turno_lista = "\n".join(f"  {i+1}\\. {esc(j[1])}" for i, j in enumerate(orden))
 
-    ctx.bot_data[f"turno_{chat_key}"] = {
+    juego(chat_key).turno = {
         "orden": [j[0] for j in orden],
         "index": 0,
         "ya_dieron_pista": set(),
@@ -3720,11 +4772,10 @@ async def _nueva_ronda_pistas(chat_key, ctx, jugadores, vivos_ids, impostor_ids_
         "intentos_pista": {}
     }
 
-    with get_conn() as conn:
-        conn.execute("UPDATE partidas SET estado='jugando' WHERE chat_key=?", (chat_key,))
+    set_estado_partida(chat_key, "jugando")
 
     await message.reply_text(
-        t(chat_key, "nueva_ronda_pistas").format(n=len(vivos), orden=turno_lista),
+        tf(chat_key, "nueva_ronda_pistas", n=len(vivos), orden=turno_lista),
         parse_mode="MarkdownV2"
     )
 
@@ -3739,7 +4790,7 @@ async def btn_confirmar_pista(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     chat_key = get_chat_key(update)
     user = query.from_user
 
-    turno_data = ctx.bot_data.get(f"turno_{chat_key}")
+    turno_data = juego(chat_key).turno
     if not turno_data:
         await query.answer(t(chat_key, "no_tu_turno"), show_alert=True)
         return
@@ -3754,9 +4805,7 @@ async def btn_confirmar_pista(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     await query.answer(t(chat_key, "pista_confirmada"))
 
     # Cancelar timer activo
-    tarea = ctx.bot_data.pop(f"timer_{chat_key}", None)
-    if tarea:
-        tarea.cancel()
+    TIMERS.cancelar(chat_key, "aviso_turno", "turno")
 
     pista_texto = turno_data.pop("pista_pendiente", None)
     turno_data.setdefault("intentos_pista", {})[user.id] = 0  # resetear contador
@@ -3788,7 +4837,7 @@ async def btn_confirmar_pista(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         jugadores_iniciales = turno_data.get("jugadores_iniciales", len(orden))
 
         if jugadores_iniciales == 3 and ronda_pistas == 1:
-            ctx.bot_data.pop(f"turno_{chat_key}", None)
+            juego(chat_key).turno = None
             jugadores = get_jugadores_activos(chat_key)
             vivos_ids = get_vivos(chat_key)
             vivos = [j for j in jugadores if j[0] in vivos_ids]
@@ -3796,7 +4845,7 @@ async def btn_confirmar_pista(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
             random.shuffle(nuevo_orden)
             turno_lista = "\n".join(f"  {i+1}\\. {esc(j[1])}" for i, j in enumerate(nuevo_orden))
 
-            ctx.bot_data[f"turno_{chat_key}"] = {
+            juego(chat_key).turno = {
                 "orden": [j[0] for j in nuevo_orden],
                 "index": 0,
                 "ya_dieron_pista": set(),
@@ -3807,7 +4856,7 @@ async def btn_confirmar_pista(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 
             await ctx.bot.send_message(
                 chat_id,
-                t(chat_key, "segunda_ronda").format(orden=turno_lista),
+                tf(chat_key, "segunda_ronda", orden=turno_lista),
                 parse_mode="MarkdownV2",
                 message_thread_id=thread_id
             )
@@ -3815,7 +4864,7 @@ async def btn_confirmar_pista(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
             await _anunciar_turno(chat_key, primer[0], primer[1], chat_id, thread_id, ctx)
             return
 
-        ctx.bot_data.pop(f"turno_{chat_key}", None)
+        juego(chat_key).turno = None
         await ctx.bot.send_message(
             chat_id,
             t(chat_key, "todos_dieron_pista"),
@@ -3826,8 +4875,8 @@ async def btn_confirmar_pista(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
             ]])
         )
         # Timer de 30s para auto-abrir votación
-        tarea_abv2 = asyncio.create_task(_timer_abrir_votacion(chat_key, chat_id, thread_id, ctx))
-        ctx.bot_data[f"timer_abrir_votacion_{chat_key}"] = tarea_abv2
+        TIMERS.armar(chat_key, "abrir_votacion", TIMER_ABRIR_VOTACION_SEGUNDOS,
+                     chat_id=chat_id, thread_id=thread_id)
         return
 
     siguiente_id = orden[siguiente_index]
@@ -3837,6 +4886,20 @@ async def btn_confirmar_pista(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     await _anunciar_turno(chat_key, siguiente_id, nombre_siguiente, chat_id, thread_id, ctx)
 
 
+def _texto_enrutable(ctx, chat, chat_key, user) -> bool:
+    """True si algo puede consumir un texto libre en este chat: capturas del
+    owner en privado, setup de /program, partida en juego o ronda GI.
+    Solo mira memoria; las partidas activas siempre están en _partidas."""
+    if chat and chat.type == "private" and user and user.id == BOT_OWNER_ID:
+        return True
+    if f"programa_setup_{chat_key}" in ctx.bot_data:
+        return True
+    e = _partidas.get(chat_key)
+    if e is not None and e.estado in ("jugando", "adivinando"):
+        return True
+    return bool(chat and chat.type in ("group", "supergroup") and gi_hay_ronda(chat_key, chat.id))
+
+
 async def handle_adivinanza(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     if not update.message or not update.message.text:
         return
@@ -3847,7 +4910,15 @@ async def handle_adivinanza(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     # ── Registrar grupo para Adivina la Idol ───────────────────
     chat = update.effective_chat
     if chat and chat.type in ("group", "supergroup"):
-        gi_registrar_grupo(chat.id, chat.title or "?", chat_key)
+        if gi_registrar_grupo(chat.id, chat.title or "?"):
+            try:
+                await db(gi_insertar_grupo, chat.id, chat.title or "?")
+            except Exception as e:
+                logger.warning(f"[IDOL] no se pudo registrar el grupo {chat.id}: {e}")
+
+    # ── Ruta rápida: charla sin nada en curso que consuma el texto ──
+    if not _texto_enrutable(ctx, chat, chat_key, user):
+        return
 
     # ── Owner: enviar mensaje a grupo ────────────────────────
     if chat and chat.type == "private" and user.id == BOT_OWNER_ID:
@@ -3950,10 +5021,10 @@ async def handle_adivinanza(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         partida_imp_gi  = get_partida(chat_key)
         imp_activo_gi   = partida_imp_gi and partida_imp_gi[2] in ("jugando", "adivinando")
         if not imp_activo_gi:
-            gi_ronda_activa = gi_get_ronda_activa(chat_key, update.effective_chat.id)
+            gi_ronda_activa = await db(gi_get_ronda_activa, chat_key, update.effective_chat.id)
             if gi_ronda_activa:
                 gi_ronda_id   = gi_ronda_activa[0]
-                gi_part_check = gi_get_participante(gi_ronda_id, user.id)
+                gi_part_check = await db(gi_get_participante, gi_ronda_id, user.id)
                 if gi_part_check and gi_part_check[6]:   # activo=1
                     if gi_part_check[5] <= 0:            # sin vidas
                         return
@@ -3981,7 +5052,7 @@ async def handle_adivinanza(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
                             pass  # Ya borrado o expirado — ignorar
                     # Enviar nuevo mensaje de confirmación y guardar su message_id
                     msg_confirm = await update.message.reply_text(
-                        gi_t(lang_gi2, "gi_confirmar_msg").format(respuesta=esc(texto)),
+                        gi_tf(lang_gi2, "gi_confirmar_msg", respuesta=esc(texto)),
                         parse_mode="MarkdownV2",
                         reply_markup=InlineKeyboardMarkup(kbd_gi2)
                     )
@@ -3994,7 +5065,7 @@ async def handle_adivinanza(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 
     # ── Modo adivinanza del impostor ──
     if partida[2] == "adivinando":
-        datos = ctx.bot_data.get(f"adivinando_{chat_key}")
+        datos = juego(chat_key).adivinando
         if not datos or user.id != datos["impostor_id"]:
             return
 
@@ -4005,7 +5076,7 @@ async def handle_adivinanza(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
             callback_data=f"confirmar_adiv:{user.id}"
         )]]
         await update.message.reply_text(
-            t(chat_key, "confirmar_adivinanza_msg").format(palabra=esc(texto)),
+            tf(chat_key, "confirmar_adivinanza_msg", palabra=esc(texto)),
             parse_mode="MarkdownV2",
             reply_markup=InlineKeyboardMarkup(keyboard)
         )
@@ -4015,7 +5086,7 @@ async def handle_adivinanza(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     if partida[2] != "jugando":
         return
 
-    turno_data = ctx.bot_data.get(f"turno_{chat_key}")
+    turno_data = juego(chat_key).turno
     if not turno_data:
         return
 
@@ -4028,17 +5099,16 @@ async def handle_adivinanza(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     # Actualizar nombre por si cambió en Telegram
     actualizar_nombre_activo(chat_key, user.id, nombre(user))
 
-    impostor_ids_raw = partida[5] or ""
-    impostor_ids_set = set(int(i) for i in impostor_ids_raw.split(",") if i.strip())
+    impostor_ids_set = get_impostores(chat_key)
     if user.id in impostor_ids_set and normalizar(texto) == normalizar(partida[4]):
         todos_jugadores = get_jugadores_activos(chat_key)
         impostores = [(uid, next((j[1] for j in todos_jugadores if j[0] == uid), str(uid))) for uid in impostor_ids_set]
-        ctx.bot_data.pop(f"turno_{chat_key}", None)
+        juego(chat_key).turno = None
         chat_id = update.effective_chat.id
         thread_id = get_thread_id(chat_key)
         await ctx.bot.send_message(
             chat_id,
-            t(chat_key, "adivino").format(nombre=esc(nombre(user)), palabra=esc(partida[4])),
+            tf(chat_key, "adivino", nombre=esc(nombre(user)), palabra=esc(partida[4])),
             parse_mode="MarkdownV2",
             message_thread_id=thread_id
         )
@@ -4072,9 +5142,7 @@ async def handle_adivinanza(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         intentos[user.id] = 0
 
         # Cancelar timer activo
-        tarea = ctx.bot_data.pop(f"timer_{chat_key}", None)
-        if tarea:
-            tarea.cancel()
+        TIMERS.cancelar(chat_key, "aviso_turno", "turno")
 
         turno_data["ya_dieron_pista"].add(user.id)
         siguiente_index = index + 1
@@ -4094,14 +5162,14 @@ async def handle_adivinanza(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
             jugadores_iniciales = turno_data.get("jugadores_iniciales", len(orden))
 
             if jugadores_iniciales == 3 and ronda_pistas == 1:
-                ctx.bot_data.pop(f"turno_{chat_key}", None)
+                juego(chat_key).turno = None
                 jugadores_frescos = get_jugadores_activos(chat_key)
                 vivos_ids = get_vivos(chat_key)
                 vivos = [j for j in jugadores_frescos if j[0] in vivos_ids]
                 nuevo_orden = list(vivos)
                 random.shuffle(nuevo_orden)
                 turno_lista = "\n".join(f"  {i+1}\\. {esc(j[1])}" for i, j in enumerate(nuevo_orden))
-                ctx.bot_data[f"turno_{chat_key}"] = {
+                juego(chat_key).turno = {
                     "orden": [j[0] for j in nuevo_orden],
                     "index": 0,
                     "ya_dieron_pista": set(),
@@ -4109,20 +5177,20 @@ async def handle_adivinanza(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
                     "jugadores_iniciales": jugadores_iniciales,
                     "intentos_pista": {}
                 }
-                await ctx.bot.send_message(chat_id, t(chat_key, "segunda_ronda").format(orden=turno_lista), parse_mode="MarkdownV2", message_thread_id=thread_id)
+                await ctx.bot.send_message(chat_id, tf(chat_key, "segunda_ronda", orden=turno_lista), parse_mode="MarkdownV2", message_thread_id=thread_id)
                 primer = nuevo_orden[0]
                 await _anunciar_turno(chat_key, primer[0], primer[1], chat_id, thread_id, ctx)
                 return
 
-            ctx.bot_data.pop(f"turno_{chat_key}", None)
+            juego(chat_key).turno = None
             await ctx.bot.send_message(
                 chat_id, t(chat_key, "todos_dieron_pista"), parse_mode="MarkdownV2",
                 message_thread_id=thread_id,
                 reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton(t(chat_key, "btn_abrir_votacion"), callback_data="abrir_votar")]])
             )
             # Timer de 30s para auto-abrir votación
-            tarea_abv3 = asyncio.create_task(_timer_abrir_votacion(chat_key, chat_id, thread_id, ctx))
-            ctx.bot_data[f"timer_abrir_votacion_{chat_key}"] = tarea_abv3
+            TIMERS.armar(chat_key, "abrir_votacion", TIMER_ABRIR_VOTACION_SEGUNDOS,
+                         chat_id=chat_id, thread_id=thread_id)
             return
 
         siguiente_id = orden[siguiente_index]
@@ -4132,7 +5200,7 @@ async def handle_adivinanza(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         return
 
     await update.message.reply_text(
-        t(chat_key, "confirmar_pista_msg").format(pista=esc(texto)),
+        tf(chat_key, "confirmar_pista_msg", pista=esc(texto)),
         parse_mode="MarkdownV2",
         reply_markup=InlineKeyboardMarkup(keyboard)
     )
@@ -4149,7 +5217,7 @@ async def btn_confirmar_adivinanza(update: Update, ctx: ContextTypes.DEFAULT_TYP
         await query.answer()
         return
 
-    datos = ctx.bot_data.get(f"adivinando_{chat_key}")
+    datos = juego(chat_key).adivinando
     if not datos or user.id != datos["impostor_id"]:
         await query.answer()
         return
@@ -4169,10 +5237,8 @@ async def btn_confirmar_adivinanza(update: Update, ctx: ContextTypes.DEFAULT_TYP
     inocentes_vivos_ids = datos["inocentes_vivos_ids"]
     impostor_ids_set = datos["impostor_ids_set"]
 
-    ctx.bot_data.pop(f"adivinando_{chat_key}", None)
-    tarea_adiv = ctx.bot_data.pop(f"timer_adiv_{chat_key}", None)
-    if tarea_adiv:
-        tarea_adiv.cancel()
+    juego(chat_key).adivinando = None
+    TIMERS.cancelar(chat_key, "aviso_adivinanza", "adivinanza")
     await query.answer(t(chat_key, "pista_confirmada"))
     await query.message.delete()
 
@@ -4183,13 +5249,13 @@ async def btn_confirmar_adivinanza(update: Update, ctx: ContextTypes.DEFAULT_TYP
         return await ctx.bot.send_message(chat_id, text, parse_mode="MarkdownV2", message_thread_id=thread_id)
 
     if normalizar(texto) == normalizar(palabra):
-        msg = await send(t(chat_key, "adivino").format(nombre=esc(nombre(user)), palabra=esc(palabra)))
+        msg = await send(tf(chat_key, "adivino", nombre=esc(nombre(user)), palabra=esc(palabra)))
         await _fin_impostores_ganan(
             chat_key, ctx, partida, jugadores, impostores,
             None, palabra, categoria, detalle_votos, msg
         )
     else:
-        msg = await send(t(chat_key, "incorrecto").format(nombre=esc(nombre(user)), texto=esc(texto.lower())))
+        msg = await send(tf(chat_key, "incorrecto", nombre=esc(nombre(user)), texto=esc(texto.lower())))
         if not impostores_vivos:
             await _fin_grupo_gana(chat_key, ctx, jugadores, impostores, palabra, categoria, detalle_votos, msg)
             return
@@ -4206,59 +5272,53 @@ async def btn_confirmar_adivinanza(update: Update, ctx: ContextTypes.DEFAULT_TYP
 async def _fin_grupo_gana(chat_key, ctx, jugadores, impostores, palabra, categoria, detalle_votos, _unused=None, bonus=False):
     logger.info(f"[FIN_GRUPO] iniciando chat_key={chat_key} palabra={palabra}")
     try:
-        tarea_actual = asyncio.current_task()
-        tarea = ctx.bot_data.pop(f"timer_{chat_key}", None)
-        if tarea and tarea is not tarea_actual: tarea.cancel()
-        tarea_adiv = ctx.bot_data.pop(f"timer_adiv_{chat_key}", None)
-        if tarea_adiv and tarea_adiv is not tarea_actual: tarea_adiv.cancel()
-        tarea_abv3 = ctx.bot_data.pop(f"timer_abrir_votacion_{chat_key}", None)
-        if tarea_abv3 and tarea_abv3 is not tarea_actual: tarea_abv3.cancel()
-        tarea_tv3 = ctx.bot_data.pop(f"timer_votacion_{chat_key}", None)
-        if tarea_tv3 and tarea_tv3 is not tarea_actual: tarea_tv3.cancel()
+        TIMERS.cancelar_grupo(chat_key)
 
         impostor_ids_set = set(j[0] for j in impostores)
-        multiplicador = ctx.bot_data.pop(f"multiplicador_{chat_key}", 1)
+        multiplicador = juego(chat_key).sacar("multiplicador", 1)
+        incrementos = {}
         for j in jugadores:
             if j[0] not in impostor_ids_set:
-                for _ in range(multiplicador):
-                    sumar_victoria(chat_key, j[0])
-                sumar_victoria_inocente(chat_key, j[0])
+                incrementos[j[0]] = {"victorias": multiplicador, "victorias_inocente": 1}
         for imp in impostores:
-            sumar_derrota(chat_key, imp[0])
+            incrementos[imp[0]] = {"derrotas": 1}
+        row = await db(registrar_fin_partida, chat_key, "grupo", palabra, categoria, incrementos)
+        if row is None:
+            logger.info("[FIN_GRUPO] la partida ya estaba terminada, no se suma de nuevo")
+            return
         if multiplicador > 1:
             logger.info(f"[FIN_GRUPO] puntos x{multiplicador} sumados")
         else:
             logger.info(f"[FIN_GRUPO] puntos sumados")
-
-        with get_conn() as conn:
-            row = conn.execute("SELECT chat_id FROM partidas WHERE chat_key=?", (chat_key,)).fetchone()
-            conn.execute("INSERT INTO historial (chat_key, ganador, palabra, categoria) VALUES (?,?,?,?)",
-                         (chat_key, "grupo", palabra, categoria))
-            conn.execute("UPDATE partidas SET estado=\'terminada\' WHERE chat_key=?", (chat_key,))
         logger.info(f"[FIN_GRUPO] DB actualizada, row={row}")
 
         chat_id = row[0] if row else int(chat_key.split("_")[0])
         thread_id = get_thread_id(chat_key)
-        marcador = get_marcador_global(chat_key)
+        clave_img = clave_imagen("marcador", chat_key, 1)
+        marcador, total = await db(get_pagina_marcador, chat_key, 1)
         logger.info(f"[FIN_GRUPO] chat_id={chat_id} marcador={len(marcador)} jugadores")
 
         nombres_impostores = ", ".join(f"*{esc(i[1])}*" for i in impostores)
-        texto_final = t(chat_key, "grupo_gana").format(
+        texto_final = tf(chat_key, "grupo_gana",
             impostores=nombres_impostores, palabra=esc(palabra),
             cat=esc(categoria)
         )
         logger.info(f"[FIN_GRUPO] texto generado len={len(texto_final)}, enviando...")
         await asyncio.shield(ctx.bot.send_message(chat_id, texto_final, parse_mode="MarkdownV2", message_thread_id=thread_id))
-        img_buf = generar_imagen_marcador(chat_key, marcador)
-        if img_buf:
-            await asyncio.shield(ctx.bot.send_photo(chat_id, photo=img_buf, message_thread_id=thread_id))
+        enviada = await asyncio.shield(enviar_imagen_cacheada(
+            functools.partial(ctx.bot.send_photo, chat_id, message_thread_id=thread_id),
+            clave_img, lambda: render_marcador(chat_key, marcador, 1, -(-total // MARCADOR_POR_PAGINA))
+        ))
+        if not enviada:
+            await asyncio.shield(ctx.bot.send_message(
+                chat_id, tf(chat_key, "marcador", tabla=formatear_tabla(chat_key, marcador)),
+                parse_mode="MarkdownV2", message_thread_id=thread_id
+            ))
         logger.info(f"[FIN_GRUPO] mensaje enviado OK")
     except BaseException as e:
         logger.error(f"[FIN_GRUPO] ERROR tipo={type(e).__name__}: {e}", exc_info=True)
         try:
-            with get_conn() as conn:
-                row2 = conn.execute("SELECT chat_id FROM partidas WHERE chat_key=?", (chat_key,)).fetchone()
-            chat_id2 = row2[0] if row2 else int(chat_key.split("_")[0])
+            chat_id2 = juego(chat_key).chat_id or int(chat_key.split("_")[0])
             thread_id2 = get_thread_id(chat_key)
             fb = (f"🎉 ¡El grupo ganó!\n\n"
                   f"Impostores: {', '.join(i[1] for i in impostores)}\n"
@@ -4272,36 +5332,30 @@ async def _fin_grupo_gana(chat_key, ctx, jugadores, impostores, palabra, categor
 async def _fin_impostores_ganan(chat_key, ctx, partida, jugadores, impostores, eliminado, palabra, categoria, detalle_votos, _unused=None, razon=None):
     logger.info(f"[FIN_IMPOSTORES] iniciando chat_key={chat_key} palabra={palabra} razon={razon}")
     try:
-        tarea_actual = asyncio.current_task()
-        tarea = ctx.bot_data.pop(f"timer_{chat_key}", None)
-        if tarea and tarea is not tarea_actual: tarea.cancel()
-        tarea_adiv = ctx.bot_data.pop(f"timer_adiv_{chat_key}", None)
-        if tarea_adiv and tarea_adiv is not tarea_actual: tarea_adiv.cancel()
+        TIMERS.cancelar_grupo(chat_key)
 
         impostor_ids_set = set(j[0] for j in impostores)
-        multiplicador = ctx.bot_data.pop(f"multiplicador_{chat_key}", 1)
+        multiplicador = juego(chat_key).sacar("multiplicador", 1)
+        incrementos = {}
         for imp in impostores:
-            for _ in range(multiplicador):
-                sumar_victoria(chat_key, imp[0])
-            sumar_victoria_impostor(chat_key, imp[0])
+            incrementos[imp[0]] = {"victorias": multiplicador, "victorias_impostor": 1}
         for j in jugadores:
             if j[0] not in impostor_ids_set:
-                sumar_derrota(chat_key, j[0])
+                incrementos[j[0]] = {"derrotas": 1}
+        row = await db(registrar_fin_partida, chat_key, "impostor", palabra, categoria, incrementos)
+        if row is None:
+            logger.info("[FIN_IMPOSTORES] la partida ya estaba terminada, no se suma de nuevo")
+            return
         if multiplicador > 1:
             logger.info(f"[FIN_IMPOSTORES] puntos x{multiplicador} sumados")
         else:
             logger.info(f"[FIN_IMPOSTORES] puntos sumados")
-
-        with get_conn() as conn:
-            row = conn.execute("SELECT chat_id FROM partidas WHERE chat_key=?", (chat_key,)).fetchone()
-            conn.execute("INSERT INTO historial (chat_key, ganador, palabra, categoria) VALUES (?,?,?,?)",
-                         (chat_key, "impostor", palabra, categoria))
-            conn.execute("UPDATE partidas SET estado=\'terminada\' WHERE chat_key=?", (chat_key,))
         logger.info(f"[FIN_IMPOSTORES] DB actualizada, row={row}")
 
         chat_id = row[0] if row else int(chat_key.split("_")[0])
         thread_id = get_thread_id(chat_key)
-        marcador = get_marcador_global(chat_key)
+        clave_img = clave_imagen("marcador", chat_key, 1)
+        marcador, total = await db(get_pagina_marcador, chat_key, 1)
         logger.info(f"[FIN_IMPOSTORES] chat_id={chat_id} marcador={len(marcador)} jugadores")
 
         nombres_impostores = ", ".join(f"*{esc(i[1])}*" for i in impostores)
@@ -4311,24 +5365,28 @@ async def _fin_impostores_ganan(chat_key, ctx, partida, jugadores, impostores, e
         elif eliminado is None:
             desc = t(chat_key, "desc_adivino")
         else:
-            desc = t(chat_key, "desc_error_voto").format(nombre=esc(eliminado[1]))
+            desc = tf(chat_key, "desc_error_voto", nombre=esc(eliminado[1]))
 
-        texto_final = t(chat_key, "impostores_ganan").format(
+        texto_final = tf(chat_key, "impostores_ganan",
             impostores=nombres_impostores, desc=desc,
             palabra=esc(palabra), cat=esc(categoria)
         )
         logger.info(f"[FIN_IMPOSTORES] texto generado len={len(texto_final)}, enviando...")
         await asyncio.shield(ctx.bot.send_message(chat_id, texto_final, parse_mode="MarkdownV2", message_thread_id=thread_id))
-        img_buf = generar_imagen_marcador(chat_key, marcador)
-        if img_buf:
-            await asyncio.shield(ctx.bot.send_photo(chat_id, photo=img_buf, message_thread_id=thread_id))
+        enviada = await asyncio.shield(enviar_imagen_cacheada(
+            functools.partial(ctx.bot.send_photo, chat_id, message_thread_id=thread_id),
+            clave_img, lambda: render_marcador(chat_key, marcador, 1, -(-total // MARCADOR_POR_PAGINA))
+        ))
+        if not enviada:
+            await asyncio.shield(ctx.bot.send_message(
+                chat_id, tf(chat_key, "marcador", tabla=formatear_tabla(chat_key, marcador)),
+                parse_mode="MarkdownV2", message_thread_id=thread_id
+            ))
         logger.info(f"[FIN_IMPOSTORES] mensaje enviado OK")
     except BaseException as e:
         logger.error(f"[FIN_IMPOSTORES] ERROR tipo={type(e).__name__}: {e}", exc_info=True)
         try:
-            with get_conn() as conn:
-                row2 = conn.execute("SELECT chat_id FROM partidas WHERE chat_key=?", (chat_key,)).fetchone()
-            chat_id2 = row2[0] if row2 else int(chat_key.split("_")[0])
+            chat_id2 = juego(chat_key).chat_id or int(chat_key.split("_")[0])
             thread_id2 = get_thread_id(chat_key)
             fb = (f"🕵️ ¡Los impostores ganaron!\n\n"
                   f"Eran: {', '.join(i[1] for i in impostores)}\n"
@@ -4418,8 +5476,201 @@ def limpiar_nombre_tabla(nombre):
     clean = _re.sub(r'\s+', ' ', clean).strip()
     return (clean or nombre)[:7]
 
-def generar_imagen_marcador(chat_key, jugadores):
-    """Genera un PNG con la tabla del marcador y devuelve bytes."""
+# ── Cache de imágenes renderizadas ──
+# Clave: (tipo, chat_key, extra, idioma, versión de la tabla de la que sale).
+# Se guardan los bytes PNG y, tras la primera subida, el file_id de Telegram,
+# así una vista repetida no vuelve a renderizar ni a subir la imagen.
+# Además, imagenes_subidas guarda hash del PNG → file_id: una imagen idéntica
+# (otro chat, otra versión con los mismos datos, o tras reiniciar) tampoco
+# se vuelve a subir.
+_TABLA_IMAGEN = {"marcador": "jugadores", "roles": "jugadores", "giscore": "gi_marcador"}
+_IMG_CACHE_MAX = 256
+_img_cache: OrderedDict = OrderedDict()
+IMG_STATS = {"hit": 0, "miss": 0, "por_file_id": 0}
+# Errores de Telegram que invalidan un file_id guardado. Cualquier otro
+# BadRequest (caption mal formado, chat sin permisos…) no es culpa del
+# file_id y se deja subir al llamador.
+_ERRORES_FILE_ID = ("wrong file identifier", "wrong remote file identifier",
+                    "file reference expired", "file_reference_expired")
+
+def clave_imagen(tipo: str, chat_key: str, extra=None) -> tuple:
+    """Hay que pedir la clave ANTES de consultar los datos de la imagen."""
+    return (tipo, chat_key, extra, get_idioma(chat_key),
+            version_tabla(_TABLA_IMAGEN[tipo], chat_key))
+
+async def enviar_imagen_cacheada(enviar, clave: tuple, generar) -> bool:
+    """Envía la imagen de `clave` con `enviar(photo=...)`, reusando file_id o
+    bytes si ya existe; si no, la renderiza con `await generar()`.
+    Retorna False si no se pudo generar (el llamador usa el texto de fallback)."""
+    entrada = _img_cache.get(clave)
+    if entrada is not None:
+        _img_cache.move_to_end(clave)
+        IMG_STATS["hit"] += 1
+    else:
+        IMG_STATS["miss"] += 1
+        buf = await generar()
+        if buf is None:
+            return False
+        png = buf.getvalue()
+        hash_png = hashlib.blake2b(png, digest_size=16).hexdigest()
+        entrada = {"png": png, "hash": hash_png,
+                   "file_id": await db(get_imagen_subida, hash_png)}
+        _img_cache[clave] = entrada
+        while len(_img_cache) > _IMG_CACHE_MAX:
+            _img_cache.popitem(last=False)
+
+    if entrada["file_id"]:
+        try:
+            await enviar(photo=entrada["file_id"])
+            IMG_STATS["por_file_id"] += 1
+            await db(sumar_uso_imagen, entrada["hash"])
+            return True
+        except BadRequest as e:
+            if not any(err in str(e).lower() for err in _ERRORES_FILE_ID):
+                raise
+            logger.warning(f"[IMG] file_id rechazado, se vuelve a subir: {e}")
+            entrada["file_id"] = None
+            await db(borrar_imagen_subida, entrada["hash"])
+    msg = await enviar(photo=io.BytesIO(entrada["png"]))
+    if msg and msg.photo:
+        entrada["file_id"] = msg.photo[-1].file_id
+        await db(set_imagen_subida, entrada["hash"], entrada["file_id"], len(entrada["png"]))
+    return True
+
+
+# ── Workers de render ──
+# Pillow (dibujo + encode PNG) bloquea el event loop decenas de ms por imagen,
+# así que el render corre en procesos aparte (spawn: no heredan el loop ni las
+# conexiones SQLite). Cada worker carga cmaps y fuentes al arrancar. Los datos
+# se consultan en el proceso principal y al worker solo viajan tuplas.
+RENDER_WORKERS      = int(os.environ.get("RENDER_WORKERS", "2"))
+# Renders en curso + en espera. Pasado el tope se rechaza y el llamador
+# responde con la tabla en texto en vez de encolar sin límite.
+RENDER_MAX_EN_COLA  = int(os.environ.get("RENDER_MAX_EN_COLA", str(RENDER_WORKERS * 4)))
+RENDER_STATS = {"ok": 0, "error": 0, "rechazadas": 0, "sin_fuentes": 0}
+_render_executor = None
+_render_en_cola  = 0
+# Las fuentes se descargan y los workers se levantan después de empezar a
+# atender updates; hasta entonces _render devuelve None y se responde en texto.
+FUENTES_ESPERA_MAX = 120    # segundos; pasado esto se renderiza con lo que haya
+_fuentes_listas = False
+ARRANQUE_STATS = {"inicio": None, "primer_update_ms": None, "fuentes_ms": None}
+
+def _init_worker_render():
+    """Initializer de cada worker: índice de fuentes y tamaños usados."""
+    _ensure_cmaps()
+    for size in (22, 24, 26, 28):
+        _get_font(size)
+        _get_font(size, bold=True)
+
+def _pool_render() -> ProcessPoolExecutor:
+    global _render_executor
+    if _render_executor is None:
+        _render_executor = ProcessPoolExecutor(
+            max_workers=RENDER_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker_render,
+        )
+    return _render_executor
+
+async def _levantar_workers_render():
+    futuros = [_pool_render().submit(int) for _ in range(RENDER_WORKERS)]
+    await asyncio.gather(*(asyncio.wrap_future(f) for f in futuros), return_exceptions=True)
+
+async def _preparar_fuentes():
+    """Descarga las fuentes que falten y levanta los workers de render (que
+    arman el índice de cmaps en su initializer). Al terminar marca las
+    fuentes como listas.
+
+    Si la descarga pasa de FUENTES_ESPERA_MAX, los workers arrancan con las
+    fuentes que haya; cuando termina, se reemplaza el pool para que los
+    nuevos workers carguen también las que llegaron tarde."""
+    global _fuentes_listas, _render_executor
+    t0 = time.monotonic()
+    descarga = asyncio.get_running_loop().run_in_executor(None, _init_fonts)
+    tardia = False
+    try:
+        # shield: el timeout deja de esperar pero no suelta el futuro de la descarga
+        await asyncio.wait_for(asyncio.shield(descarga), FUENTES_ESPERA_MAX)
+    except asyncio.TimeoutError:
+        tardia = True
+        logger.warning(f"[FONTS] descarga sin terminar tras {FUENTES_ESPERA_MAX}s, se sigue con las disponibles")
+    except Exception as e:
+        logger.error(f"[FONTS] error preparando fuentes: {e}")
+    await _levantar_workers_render()
+    _fuentes_listas = True
+    ARRANQUE_STATS["fuentes_ms"] = (time.monotonic() - t0) * 1000
+    logger.info(f"[FONTS] fuentes y workers listos en {ARRANQUE_STATS['fuentes_ms']:.0f} ms")
+    if not tardia:
+        return
+    try:
+        await descarga
+    except Exception as e:
+        logger.error(f"[FONTS] error preparando fuentes: {e}")
+        return
+    # No cerrar_render(): su shutdown(wait=True) frenaría el loop. El pool
+    # viejo termina lo que ya tiene en cola y se apaga solo.
+    viejo, _render_executor = _render_executor, None
+    if viejo is not None:
+        viejo.shutdown(wait=False)
+    await _levantar_workers_render()
+    logger.info(f"[FONTS] descarga terminada a los {time.monotonic() - t0:.0f}s, workers de render renovados")
+
+def cerrar_render():
+    global _render_executor
+    if _render_executor is not None:
+        _render_executor.shutdown(wait=True, cancel_futures=True)
+        _render_executor = None
+
+async def _render(fn, *args):
+    """Corre un _dibujar_* en el pool y devuelve BytesIO, o None si falló o
+    la cola está llena (el llamador usa el fallback de texto)."""
+    global _render_executor, _render_en_cola
+    if not _fuentes_listas:
+        RENDER_STATS["sin_fuentes"] += 1
+        return None
+    if _render_en_cola >= RENDER_MAX_EN_COLA:
+        RENDER_STATS["rechazadas"] += 1
+        logger.warning(f"[RENDER] cola llena ({_render_en_cola}), {fn.__name__} va como texto")
+        return None
+    _render_en_cola += 1
+    ejecutor = _pool_render()
+    try:
+        png = await asyncio.get_running_loop().run_in_executor(ejecutor, fn, *args)
+    except BrokenProcessPool:
+        # Un worker murió (OOM, señal): se apaga el pool (sin esperar, para no
+        # frenar el loop) y el próximo render lo recrea. Si otro render roto
+        # ya lo reemplazó, no se toca el nuevo.
+        logger.error("[RENDER] pool roto, se recrea en el próximo render")
+        if _render_executor is ejecutor:
+            ejecutor.shutdown(wait=False, cancel_futures=True)
+            _render_executor = None
+        png = None
+    finally:
+        _render_en_cola -= 1
+    RENDER_STATS["ok" if png else "error"] += 1
+    return io.BytesIO(png) if png else None
+
+async def render_marcador(chat_key, jugadores, inicio=1, paginas=1):
+    return await _render(_dibujar_marcador, get_idioma(chat_key), [tuple(j) for j in jugadores],
+                         inicio, paginas)
+
+async def render_roles(chat_key, jugadores):
+    return await _render(_dibujar_roles, get_idioma(chat_key), [tuple(j) for j in jugadores])
+
+async def render_giscore(chat_key: str, division: int):
+    datos = await db(_datos_giscore, chat_key, division)
+    if datos is None:
+        return None
+    rows, ids_descenso, ids_ascenso = datos
+    return await _render(_dibujar_giscore, get_idioma(chat_key), division,
+                         [tuple(r) for r in rows], ids_descenso, ids_ascenso)
+
+
+def _dibujar_marcador(lang, jugadores, inicio=1, paginas=1):
+    """Dibuja la tabla del marcador y devuelve los bytes PNG (o None).
+    inicio es la posición de la primera fila (para páginas > 1).
+    No toca la DB: corre dentro de los workers de render."""
     try:
         FONT_SIZE = 22
         font       = _get_font(FONT_SIZE)
@@ -4446,7 +5697,6 @@ def generar_imagen_marcador(chat_key, jugadores):
         COL_W = [40, 150, 50, 50, 65]   # #, Jugador, V, D, Bal
         COLS_ES = ["#", "Jugador", "V", "D", "Bal"]
         COLS_EN = ["#", "Player",  "V", "D", "Bal"]
-        lang = get_idioma(chat_key)
         COLS = COLS_EN if lang == "en" else COLS_ES
 
         filas = []
@@ -4466,6 +5716,8 @@ def generar_imagen_marcador(chat_key, jugadores):
 
         # Título
         titulo = "Leaderboard" if lang == "en" else "Marcador"
+        if paginas > 1:
+            titulo += f"  {(inicio - 1) // MARCADOR_POR_PAGINA + 1}/{paginas}"
         draw.text((PAD, PAD // 2 + 2), f"  {titulo}", font=font_title, fill=GOLD)
 
         # Header
@@ -4482,7 +5734,7 @@ def generar_imagen_marcador(chat_key, jugadores):
             draw.rectangle([PAD, y, total_w - PAD, y + ROW_H - 1], fill=ROW_A if idx % 2 == 0 else ROW_B)
             draw.line([PAD, y + ROW_H - 1, total_w - PAD, y + ROW_H - 1], fill=LINE, width=1)
 
-            pos = idx + 1
+            pos = idx + inicio
             x = PAD + 8
 
             # Número de posición con color
@@ -4504,14 +5756,14 @@ def generar_imagen_marcador(chat_key, jugadores):
 
         buf = io.BytesIO()
         img.save(buf, format="PNG")
-        buf.seek(0)
-        return buf
+        return buf.getvalue()
     except Exception as e:
-        logger.error(f"[generar_imagen_marcador] error: {e}")
+        logger.error(f"[_dibujar_marcador] error: {e}")
         return None
 
-def generar_imagen_roles(chat_key, jugadores):
-    """Genera un PNG con la tabla de roles y devuelve bytes."""
+def _dibujar_roles(lang, jugadores):
+    """Dibuja la tabla de roles y devuelve los bytes PNG (o None).
+    No toca la DB: corre dentro de los workers de render."""
     try:
         FONT_SIZE = 24
         font       = _get_font(FONT_SIZE)
@@ -4532,7 +5784,6 @@ def generar_imagen_roles(chat_key, jugadores):
         LINE      = (55,  57,  80)
         TITLE_BG  = (30,  30,  50)
 
-        lang = get_idioma(chat_key)
         if lang == "en":
             COLS  = ["#", "Player",  "Imp", "W",  "Ino", "W" ]
             titulo = "ROLES"
@@ -4610,13 +5861,12 @@ def generar_imagen_roles(chat_key, jugadores):
 
         buf = io.BytesIO()
         img.save(buf, format="PNG")
-        buf.seek(0)
-        return buf
+        return buf.getvalue()
     except Exception as e:
-        logger.error(f"[generar_imagen_roles] error: {e}")
+        logger.error(f"[_dibujar_roles] error: {e}")
         return None
 
-def formatear_tabla(chat_key, jugadores):
+def formatear_tabla(chat_key, jugadores, inicio=1):
     MEDALLAS = {1: "🥇", 2: "🥈", 3: "🥉"}
     filas = []
     for j in jugadores:
@@ -4632,7 +5882,7 @@ def formatear_tabla(chat_key, jugadores):
     encabezado = f"    {col:<{max_nombre}}  V    D   Bal"
     separador  = "─" * len(encabezado)
     lineas = [encabezado, separador]
-    for i, (nombre_j, v, d, bal) in enumerate(filas, 1):
+    for i, (nombre_j, v, d, bal) in enumerate(filas, inicio):
         prefijo = MEDALLAS.get(i, f"{i:<3} ")
         pad = " " if i in MEDALLAS else ""
         lineas.append(f"{prefijo}{pad}{nombre_j:<{max_nombre}}  {v:<4} {d:<4} {bal}")
@@ -4640,27 +5890,100 @@ def formatear_tabla(chat_key, jugadores):
 
 
 async def cmd_puntaje(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    """/score [N] → página N del marcador (de a MARCADOR_POR_PAGINA jugadores)."""
     chat_key = get_chat_key(update)
-    jugadores = get_marcador_global(chat_key)
+    pagina = int(ctx.args[0]) if ctx.args and ctx.args[0].isdigit() else 1
+    pagina = max(1, pagina)
+    clave_img = clave_imagen("marcador", chat_key, pagina)
+    jugadores, total = await db(get_pagina_marcador, chat_key, pagina)
 
-    if not jugadores:
+    if not total:
         await update.message.reply_text(
             t(chat_key, "sin_estadisticas"),
             parse_mode="MarkdownV2"
         )
         return
-
-    img_buf = generar_imagen_marcador(chat_key, jugadores)
-    if img_buf:
-        await update.message.reply_photo(photo=img_buf)
-    else:
-        tabla = formatear_tabla(chat_key, jugadores)
+    paginas = -(-total // MARCADOR_POR_PAGINA)
+    if not jugadores:
+        # Página fuera de rango → la última
+        pagina = paginas
+        clave_img = clave_imagen("marcador", chat_key, pagina)
+        jugadores, total = await db(get_pagina_marcador, chat_key, pagina)
+        paginas = -(-total // MARCADOR_POR_PAGINA)
+    inicio = (pagina - 1) * MARCADOR_POR_PAGINA + 1
+
+    pie = ""
+    if paginas > 1:
+        posicion = await db(get_posicion, chat_key, update.effective_user.id)
+        pie = tf(chat_key, "marcador_pagina", pagina=pagina, paginas=paginas,
+                 siguiente=pagina % paginas + 1)
+        if posicion:
+            pie += tf(chat_key, "marcador_posicion", posicion=posicion, total=total)
+
+    enviada = await enviar_imagen_cacheada(
+        functools.partial(update.message.reply_photo, caption=pie or None, parse_mode="MarkdownV2"),
+        clave_img,
+        lambda: render_marcador(chat_key, jugadores, inicio, paginas)
+    )
+    if not enviada:
+        tabla = formatear_tabla(chat_key, jugadores, inicio)
         await update.message.reply_text(
-            t(chat_key, "marcador").format(tabla=tabla),
+            tf(chat_key, "marcador", tabla=tabla) + (f"\n\n{pie}" if pie else ""),
             parse_mode="MarkdownV2"
         )
 
 
+def get_jugadores_con_stats(chat_key) -> list:
+    with get_conn_lectura() as conn:
+        return conn.execute(
+            "SELECT user_id, username FROM jugadores WHERE chat_key=? "
+            "AND (victorias>0 OR derrotas>0 OR veces_impostor>0) ORDER BY username",
+            (chat_key,)
+        ).fetchall()
+
+def get_username_jugador(chat_key, user_id):
+    with get_conn_lectura() as conn:
+        row = conn.execute(
+            "SELECT username FROM jugadores WHERE chat_key=? AND user_id=?",
+            (chat_key, user_id)
+        ).fetchone()
+    return row[0] if row else None
+
+def buscar_jugador(chat_key, busqueda: str):
+    """(user_id, username) del jugador con más victorias cuyo nombre contiene busqueda."""
+    with get_conn_lectura() as conn:
+        return conn.execute(
+            "SELECT user_id, username FROM jugadores WHERE chat_key=? "
+            "AND LOWER(username) LIKE LOWER(?) ORDER BY victorias DESC LIMIT 1",
+            (chat_key, f"%{busqueda}%")
+        ).fetchone()
+
+def resetear_jugador(chat_key, user_id):
+    with get_conn() as conn:
+        conn.execute(
+            "UPDATE jugadores SET victorias=0, derrotas=0, balance=0, veces_impostor=0, veces_inocente=0, "
+            "victorias_impostor=0, victorias_inocente=0 WHERE chat_key=? AND user_id=?",
+            (chat_key, user_id)
+        )
+    tocar_version("jugadores", chat_key)
+
+def resetear_ranking(chat_key):
+    with get_conn() as conn:
+        conn.execute(
+            "UPDATE jugadores SET victorias=0, derrotas=0, balance=0 WHERE chat_key=?",
+            (chat_key,)
+        )
+    tocar_version("jugadores", chat_key)
+
+def resetear_roles(chat_key):
+    with get_conn() as conn:
+        conn.execute(
+            "UPDATE jugadores SET veces_impostor=0, veces_inocente=0, victorias_impostor=0, victorias_inocente=0 WHERE chat_key=?",
+            (chat_key,)
+        )
+    tocar_version("jugadores", chat_key)
+
+
 async def cmd_resetjugador(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     chat_key = get_chat_key(update)
     user     = update.effective_user
@@ -4672,12 +5995,7 @@ async def cmd_resetjugador(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     # Sin argumentos → listar todos los jugadores del grupo
     if not ctx.args and not (update.message.entities and
             any(e.type in ("mention","text_mention") for e in update.message.entities)):
-        with get_conn() as conn:
-            jugadores = conn.execute(
-                "SELECT user_id, username FROM jugadores WHERE chat_key=? "
-                "AND (victorias>0 OR derrotas>0 OR veces_impostor>0) ORDER BY username",
-                (chat_key,)
-            ).fetchall()
+        jugadores = await db(get_jugadores_con_stats, chat_key)
         if not jugadores:
             await update.message.reply_text("📭 No hay jugadores con estadísticas en este grupo.")
             return
@@ -4705,40 +6023,25 @@ async def cmd_resetjugador(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     # 2. Puede ser un user_id numérico directo
     if target_id is None and busqueda.isdigit():
         target_id = int(busqueda)
-        with get_conn() as conn:
-            row = conn.execute(
-                "SELECT username FROM jugadores WHERE chat_key=? AND user_id=?",
-                (chat_key, target_id)
-            ).fetchone()
-        target_name = row[0] if row else str(target_id)
+        target_name = await db(get_username_jugador, chat_key, target_id) or str(target_id)
 
     # 3. Buscar por nombre (coincidencia exacta o parcial)
     if target_id is None and busqueda:
-        with get_conn() as conn:
-            row = conn.execute(
-                "SELECT user_id, username FROM jugadores WHERE chat_key=? "
-                "AND LOWER(username) LIKE LOWER(?) ORDER BY victorias DESC LIMIT 1",
-                (chat_key, f"%{busqueda}%")
-            ).fetchone()
+        row = await db(buscar_jugador, chat_key, busqueda)
         if row:
             target_id, target_name = row[0], row[1]
 
     if target_id is None:
         await update.message.reply_text(
-            t(chat_key, "resetjugador_no_encontrado").format(nombre=esc(busqueda)),
+            tf(chat_key, "resetjugador_no_encontrado", nombre=esc(busqueda)),
             parse_mode="MarkdownV2"
         )
         return
 
-    with get_conn() as conn:
-        conn.execute(
-            "UPDATE jugadores SET victorias=0, derrotas=0, veces_impostor=0, veces_inocente=0, "
-            "victorias_impostor=0, victorias_inocente=0 WHERE chat_key=? AND user_id=?",
-            (chat_key, target_id)
-        )
+    await db(resetear_jugador, chat_key, target_id)
 
     await update.message.reply_text(
-        t(chat_key, "resetjugador_ok").format(nombre=esc(target_name or busqueda)),
+        tf(chat_key, "resetjugador_ok", nombre=esc(target_name or busqueda)),
         parse_mode="MarkdownV2"
     )
 
@@ -4759,11 +6062,7 @@ async def cmd_resetimpostor(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(t(chat_key, "solo_admin_reset"))
         return
 
-    with get_conn() as conn:
-        conn.execute(
-            "UPDATE jugadores SET victorias=0, derrotas=0 WHERE chat_key=?",
-            (chat_key,)
-        )
+    await db(resetear_ranking, chat_key)
 
     await update.message.reply_text(t(chat_key, "reset_ok"), parse_mode="MarkdownV2")
 
@@ -4784,11 +6083,7 @@ async def cmd_resetroles(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(t(chat_key, "solo_admin_reset"))
         return
 
-    with get_conn() as conn:
-        conn.execute(
-            "UPDATE jugadores SET veces_impostor=0, veces_inocente=0, victorias_impostor=0, victorias_inocente=0 WHERE chat_key=?",
-            (chat_key,)
-        )
+    await db(resetear_roles, chat_key)
 
     await update.message.reply_text(t(chat_key, "resetroles_ok"), parse_mode="MarkdownV2")
 
@@ -4811,28 +6106,13 @@ async def cmd_cancelar(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(t(chat_key, "solo_creador_cancelar"))
         return
 
-    tarea = ctx.bot_data.pop(f"timer_{chat_key}", None)
-    if tarea:
-        tarea.cancel()
-    tarea_adiv = ctx.bot_data.pop(f"timer_adiv_{chat_key}", None)
-    if tarea_adiv:
-        tarea_adiv.cancel()
-    tarea_lobby = ctx.bot_data.pop(f"timeout_lobby_{chat_key}", None)
-    if tarea_lobby:
-        tarea_lobby.cancel()
-    tarea_abv = ctx.bot_data.pop(f"timer_abrir_votacion_{chat_key}", None)
-    if tarea_abv:
-        tarea_abv.cancel()
-    tarea_tv = ctx.bot_data.pop(f"timer_votacion_{chat_key}", None)
-    if tarea_tv:
-        tarea_tv.cancel()
-    ctx.bot_data.pop(f"turno_{chat_key}", None)
-    ctx.bot_data.pop(f"adivinando_{chat_key}", None)
-    ctx.bot_data.pop(f"votos_{chat_key}", None)
-    ctx.bot_data.pop(f"revotacion_{chat_key}", None)
+    TIMERS.cancelar_grupo(chat_key)
+    juego(chat_key).turno = None
+    juego(chat_key).adivinando = None
+    juego(chat_key).votos = None
+    juego(chat_key).revotacion = None
 
-    with get_conn() as conn:
-        conn.execute("UPDATE partidas SET estado='terminada' WHERE chat_key=?", (chat_key,))
+    set_estado_partida(chat_key, "terminada")
     await update.message.reply_text(t(chat_key, "cancelado"), parse_mode="MarkdownV2")
 
 
@@ -4861,12 +6141,12 @@ async def cmd_addword(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 
     if agregada:
         await update.message.reply_text(
-            t(chat_key, "addword_ok").format(palabra=esc(palabra)),
+            tf(chat_key, "addword_ok", palabra=esc(palabra)),
             parse_mode="MarkdownV2"
         )
     else:
         await update.message.reply_text(
-            t(chat_key, "addword_ya_existe").format(palabra=esc(palabra)),
+            tf(chat_key, "addword_ya_existe", palabra=esc(palabra)),
             parse_mode="MarkdownV2"
         )
 
@@ -4896,12 +6176,12 @@ async def cmd_removeword(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 
     if eliminada:
         await update.message.reply_text(
-            t(chat_key, "removeword_ok").format(palabra=esc(palabra)),
+            tf(chat_key, "removeword_ok", palabra=esc(palabra)),
             parse_mode="MarkdownV2"
         )
     else:
         await update.message.reply_text(
-            t(chat_key, "removeword_no_existe").format(palabra=esc(palabra)),
+            tf(chat_key, "removeword_no_existe", palabra=esc(palabra)),
             parse_mode="MarkdownV2"
         )
 
@@ -4916,16 +6196,128 @@ async def cmd_words(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 
     lista = "\n".join(f"  {i+1}\\. {esc(p)}" for i, p in enumerate(palabras))
     await update.message.reply_text(
-        t(chat_key, "words_lista").format(n=len(palabras), lista=lista),
+        tf(chat_key, "words_lista", n=len(palabras), lista=lista),
         parse_mode="MarkdownV2"
     )
 
 
 
-async def cmd_roles(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
-    chat_key = get_chat_key(update)
-    with get_conn() as conn:
-        jugadores = conn.execute(
+async def cmd_pistas(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    """Avance del precalentado de pistas por idioma (solo owner)."""
+    user = update.effective_user
+    if not BOT_OWNER_ID or user.id != BOT_OWNER_ID:
+        await update.message.reply_text("⚠️ Solo el creador del bot puede usar este comando.")
+        return
+
+    pool      = await db(_pool_pistas)
+    cacheadas = await db(get_pistas_cacheadas)
+    lineas = ["🧠 Pistas en cache"]
+    for lang in TEXTOS:
+        del_idioma = [x for x in pool if x[2] == lang]
+        listas = sum(1 for x in del_idioma if x in cacheadas)
+        pct = round(100 * listas / len(del_idioma)) if del_idioma else 100
+        lineas.append(f"• {lang.upper()}: {listas}/{len(del_idioma)} ({pct}%)")
+
+    tarea = ctx.bot_data.get("tarea_precalentado")
+    if tarea is None:
+        lineas.append("\nPrecalentado: no iniciado")
+    elif tarea.done():
+        lineas.append("\nPrecalentado: terminado")
+    else:
+        lineas.append(f"\nPrecalentado: en curso ({PISTAS_WARMUP_POR_MINUTO}/min)")
+    await update.message.reply_text("\n".join(lineas))
+
+
+def _lineas_stats_cache() -> list:
+    lineas = ["🗂 Cache de config"]
+    for nombre, c in CACHE_STATS.items():
+        total = c["hit"] + c["miss"]
+        pct = round(100 * c["hit"] / total, 1) if total else 0
+        lineas.append(f"• {nombre}: {c['hit']} hit / {c['miss']} miss ({pct}%)")
+    lineas.append(f"• entradas: {len(_config_cache)} chats, {len(_gi_activo_cache)} grupos GI")
+    return lineas
+
+
+def _lineas_stats_imagenes() -> list:
+    distintas, subidos, ahorrados = get_stats_imagenes_subidas()
+    total = IMG_STATS["hit"] + IMG_STATS["miss"]
+    pct = round(100 * IMG_STATS["hit"] / total, 1) if total else 0
+    return [
+        "🖼 Cache de imágenes",
+        f"• {IMG_STATS['hit']} hit / {IMG_STATS['miss']} miss ({pct}%)",
+        f"• enviadas por file_id: {IMG_STATS['por_file_id']}",
+        f"• entradas: {len(_img_cache)}",
+        f"• subidas: {distintas} imágenes, {subidos / 1024:.0f} KB",
+        f"• ahorrado: {ahorrados / 1024:.0f} KB",
+        f"• render: {RENDER_STATS['ok']} ok / {RENDER_STATS['error']} error / "
+        f"{RENDER_STATS['rechazadas']} rechazadas, {RENDER_STATS['sin_fuentes']} sin fuentes, "
+        f"{_render_en_cola} en cola",
+    ]
+
+
+def _lineas_stats_salida() -> list:
+    st = _limitador_salida.stats
+    tramos = [f"≤{lim}s" for lim in _TRAMOS_ESPERA] + [f">{_TRAMOS_ESPERA[-1]}s"]
+    lineas = [
+        "📤 Cola de salida",
+        f"• en cola: {_limitador_salida.en_cola()} (máx. {st['max_cola']})",
+        f"• RetryAfter: {st['retry_after']}",
+    ]
+    for prioridad, cuentas in st["espera"].items():
+        if any(cuentas):
+            detalle = " ".join(f"{tr}:{n}" for tr, n in zip(tramos, cuentas) if n)
+            lineas.append(f"• espera {_NOMBRES_PRIORIDAD[prioridad]}: {detalle}")
+    return lineas
+
+
+def _lineas_stats_timers() -> list:
+    st = TIMERS.stats
+    return [
+        "⏱ Temporizadores",
+        f"• armados: {TIMERS.armados()}",
+        f"• disparados: {st['disparados']} / cancelados: {st['cancelados']} / errores: {st['errores']}",
+    ]
+
+
+def _lineas_stats_broadcast() -> list:
+    lineas = ["📡 Broadcast GI", f"• rondas publicadas: {GI_BROADCAST_STATS['broadcasts']}"]
+    if GI_BROADCAST_STATS["ultimo"]:
+        grupos, ok, fallos, duracion = GI_BROADCAST_STATS["ultimo"]
+        lineas.append(f"• última: {ok}/{grupos} grupos en {duracion:.1f}s, {fallos} fallos")
+    return lineas
+
+
+def _lineas_stats_grupos() -> list:
+    st = GI_VISTOS_STATS
+    lineas = ["👥 Registro de grupos", f"• flushes: {st['flushes']}, pendientes: {len(_gi_vistos)}"]
+    if st["flushes"]:
+        lineas.append(f"• lote medio: {st['grupos'] / st['flushes']:.1f} grupos (máx. {st['max_lote']})")
+        lineas.append(f"• duración media: {st['ms_total'] / st['flushes']:.1f} ms (máx. {st['ms_max']:.1f} ms)")
+    return lineas
+
+
+def _lineas_stats_arranque() -> list:
+    st = ARRANQUE_STATS
+    primer = f"{st['primer_update_ms']:.0f} ms" if st["primer_update_ms"] is not None else "—"
+    fuentes = f"{st['fuentes_ms']:.0f} ms" if _fuentes_listas else "cargando"
+    return ["🚀 Arranque", f"• primer update: {primer}", f"• fuentes listas: {fuentes}"]
+
+
+async def cmd_stats(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    """Métricas internas del bot (solo owner)."""
+    user = update.effective_user
+    if not BOT_OWNER_ID or user.id != BOT_OWNER_ID:
+        await update.message.reply_text("⚠️ Solo el creador del bot puede usar este comando.")
+        return
+    secciones = [_lineas_stats_cache(), _lineas_stats_imagenes(), _lineas_stats_salida(),
+                 _lineas_stats_broadcast(), _lineas_stats_timers(), _lineas_stats_grupos(),
+                 _lineas_stats_arranque()]
+    await update.message.reply_text("\n\n".join("\n".join(s) for s in secciones))
+
+
+def get_stats_roles(chat_key) -> list:
+    with get_conn_lectura() as conn:
+        return conn.execute(
             """SELECT username, veces_impostor, veces_inocente,
                       victorias_impostor, victorias_inocente
                FROM jugadores
@@ -4934,14 +6326,21 @@ async def cmd_roles(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
             (chat_key,)
         ).fetchall()
 
+
+async def cmd_roles(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    chat_key = get_chat_key(update)
+    clave_img = clave_imagen("roles", chat_key)
+    jugadores = await db(get_stats_roles, chat_key)
+
     if not jugadores:
         await update.message.reply_text(t(chat_key, "roles_sin_datos"), parse_mode="MarkdownV2")
         return
 
-    img_buf = generar_imagen_roles(chat_key, jugadores)
-    if img_buf:
-        await update.message.reply_photo(photo=img_buf)
-    else:
+    enviada = await enviar_imagen_cacheada(
+        update.message.reply_photo, clave_img,
+        lambda: render_roles(chat_key, jugadores)
+    )
+    if not enviada:
         # Fallback texto
         col = t(chat_key, "col_jugador")
         encabezado = f"#   {col:<6}  Imp  W   Ino  W"
@@ -4953,11 +6352,29 @@ async def cmd_roles(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
             lineas.append(f"{i:<3} {nom:<6}  {vi:<4} {wvi:<4} {ino:<4} {wino}")
         tabla = "```\n" + "\n".join(lineas) + "\n```"
         await update.message.reply_text(
-            t(chat_key, "roles_tabla").format(tabla=tabla),
+            tf(chat_key, "roles_tabla", tabla=tabla),
             parse_mode="MarkdownV2"
         )
 
 
+def _resolver_mencion(update: Update, chat_key: str, m):
+    """Resuelve una mención a (user_id, nombre); (None, nombre) si no es
+    un jugador conocido del grupo."""
+    if m.type == "text_mention" and m.user:
+        return m.user.id, m.user.first_name
+    elif m.type == "mention":
+        username = update.message.text[m.offset+1:m.offset+m.length]
+        with get_conn_lectura() as conn:
+            row = conn.execute(
+                "SELECT user_id, username FROM jugadores WHERE chat_key=? AND LOWER(username)=LOWER(?)",
+                (chat_key, username)
+            ).fetchone()
+        if row:
+            return row[0], row[1]
+        return None, username
+    return None, "?"
+
+
 async def cmd_rivalidad(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     """Muestra estadísticas de votos mutuos entre dos jugadores.
     - /rivalidad @usuario  → yo contra ese jugador
@@ -4975,25 +6392,12 @@ async def cmd_rivalidad(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(t(chat_key, "rivalidad_uso"), parse_mode="MarkdownV2")
         return
 
-    # Resolver menciones a (user_id, nombre)
-    def resolver_mencion(m):
-        if m.type == "text_mention" and m.user:
-            return m.user.id, m.user.first_name
-        elif m.type == "mention":
-            username = update.message.text[m.offset+1:m.offset+m.length]
-            with get_conn() as conn:
-                row = conn.execute(
-                    "SELECT user_id, username FROM jugadores WHERE chat_key=? AND LOWER(username)=LOWER(?)",
-                    (chat_key, username)
-                ).fetchone()
-            if row:
-                return row[0], row[1]
-            return None, username
-        return None, "?"
+    async def resolver_mencion(m):
+        return await db(_resolver_mencion, update, chat_key, m)
 
     if len(menciones) == 1:
         # Modo: yo contra ese jugador
-        id_b, name_b = resolver_mencion(menciones[0])
+        id_b, name_b = await resolver_mencion(menciones[0])
         if id_b is None:
             await update.message.reply_text(
                 esc(f"⚠️ No encontré a @{name_b} en este grupo."),
@@ -5004,8 +6408,8 @@ async def cmd_rivalidad(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         name_a = nombre(user)
     else:
         # Modo: cualquiera contra cualquiera
-        id_a, name_a = resolver_mencion(menciones[0])
-        id_b, name_b = resolver_mencion(menciones[1])
+        id_a, name_a = await resolver_mencion(menciones[0])
+        id_b, name_b = await resolver_mencion(menciones[1])
         if id_a is None:
             await update.message.reply_text(
                 esc(f"⚠️ No encontré a @{name_a} en este grupo."),
@@ -5019,15 +6423,7 @@ async def cmd_rivalidad(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
             )
             return
 
-    with get_conn() as conn:
-        a_a_b = conn.execute(
-            "SELECT COUNT(*) FROM votos_historial WHERE chat_key=? AND voter_id=? AND voted_id=?",
-            (chat_key, id_a, id_b)
-        ).fetchone()[0]
-        a_b_a = conn.execute(
-            "SELECT COUNT(*) FROM votos_historial WHERE chat_key=? AND voter_id=? AND voted_id=?",
-            (chat_key, id_b, id_a)
-        ).fetchone()[0]
+    a_a_b, a_b_a = await db(get_rivalidad, chat_key, id_a, id_b)
 
     if a_a_b == 0 and a_b_a == 0:
         await update.message.reply_text(t(chat_key, "rivalidad_sin_datos"), parse_mode="MarkdownV2")
@@ -5055,18 +6451,61 @@ async def cmd_rivalidad(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(msg, parse_mode="MarkdownV2")
 
 
-async def cmd_all(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+async def cmd_rivales(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    """Top de rivales de un jugador: a quién más votó y quién más lo votó.
+    - /rivales           → los míos
+    - /rivales @usuario  → los de ese jugador
+    """
     chat_key = get_chat_key(update)
     user = update.effective_user
-    chat = update.effective_chat
 
-    # Obtener todos los usuarios registrados en el grupo
-    with get_conn() as conn:
-        miembros = conn.execute(
+    menciones = []
+    if update.message.entities:
+        menciones = [e for e in update.message.entities
+                     if e.type in ("mention", "text_mention")]
+    if menciones:
+        user_id, nombre_j = await db(_resolver_mencion, update, chat_key, menciones[0])
+        if user_id is None:
+            await update.message.reply_text(
+                esc(f"⚠️ No encontré a @{nombre_j} en este grupo."),
+                parse_mode="MarkdownV2"
+            )
+            return
+    else:
+        user_id, nombre_j = user.id, nombre(user)
+
+    votados, votantes = await db(get_top_rivales, chat_key, user_id)
+    if not votados and not votantes:
+        await update.message.reply_text(t(chat_key, "rivalidad_sin_datos"), parse_mode="MarkdownV2")
+        return
+
+    def lista(filas):
+        if not filas:
+            return "  —"
+        return "\n".join(f"  {i+1}\\. {esc(n[:15])}: *{v}*" for i, (_, n, v) in enumerate(filas))
+
+    msg = tf(chat_key, "rivales_tabla",
+             nombre=esc(nombre_j[:15]), votados=lista(votados), votantes=lista(votantes))
+    await update.message.reply_text(msg, parse_mode="MarkdownV2")
+
+
+def get_miembros(chat_key) -> list:
+    """Todos los usuarios registrados en el grupo: [(user_id, username)]."""
+    with get_conn_lectura() as conn:
+        return conn.execute(
             "SELECT user_id, username FROM jugadores WHERE chat_key=?",
             (chat_key,)
         ).fetchall()
 
+
+async def cmd_all(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    chat_key = get_chat_key(update)
+    user = update.effective_user
+    chat = update.effective_chat
+
+    # Obtener todos los usuarios registrados en el grupo
+    miembros = await db(get_miembros, chat_key)
+
     if not miembros:
         await update.message.reply_text("⚠️ No hay usuarios registrados en este grupo aún.")
         return
@@ -5086,7 +6525,7 @@ async def cmd_all(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     if texto_extra:
         msg += "\n\n" + texto_extra
 
-    await update.message.reply_text(msg, parse_mode="Markdown")
+    await responder(update.message, msg, PRIORIDAD_COSMETICA, parse_mode="Markdown")
 
 
 async def error_handler(update, ctx):
@@ -5136,24 +6575,229 @@ async def set_commands(app):
 
     logger.info("✅ Comandos registrados en Telegram (grupos + privado, ES + EN).")
 
-async def _limpiar_partidas_zombies(app):
-    """Al arrancar, marca como terminadas las partidas que quedaron activas
-    tras un reinicio inesperado del bot. Notifica en el grupo."""
-    estados_activos = ("jugando", "adivinando", "iniciando", "esperando")
+# ── Temporizadores ──
+# Un solo heap de vencimientos y una tarea que los despacha, en lugar de una
+# tarea dormida por cada timer. Cada timer se identifica por (chat_key, acción)
+# y armar de nuevo reemplaza al anterior; cancelar es O(1) (la entrada vieja
+# del heap se descarta al salir). Al terminar una partida se cancelan todos
+# los de su chat_key de una vez. Los cambios se guardan en la tabla
+# temporizadores cada TIMERS_PERSISTIR_SEGUNDOS y se vuelven a armar al
+# arrancar; las acciones ya verifican el estado de la partida al dispararse.
+TIMERS_PERSISTIR_SEGUNDOS = 1.0
+
+_ACCIONES_TIMER = {
+    "lobby":             lambda chat_key, ctx, **a: _timeout_lobby_programado(
+                             chat_key, bot=ctx.bot, bot_data=ctx.bot_data, **a),
+    "aviso_turno":       _aviso_turno,
+    "turno":             _timer_turno,
+    "aviso_adivinanza":  _aviso_adivinanza,
+    "adivinanza":        _timer_adivinanza,
+    "abrir_votacion":    _timer_abrir_votacion,
+    "resolver_votacion": _timer_resolver_votacion,
+}
+
+
+def cargar_temporizadores() -> list:
+    with get_conn_lectura() as conn:
+        return conn.execute("SELECT chat_key, accion, vence, args FROM temporizadores").fetchall()
+
+def guardar_temporizadores(cambios: dict):
+    """cambios: (chat_key, accion) → (vence, args_json), o None si se quitó."""
+    with transaccion() as conn:
+        conn.executemany(
+            "DELETE FROM temporizadores WHERE chat_key=? AND accion=?",
+            [clave for clave, fila in cambios.items() if fila is None]
+        )
+        conn.executemany(
+            "INSERT OR REPLACE INTO temporizadores (chat_key, accion, vence, args) VALUES (?,?,?,?)",
+            [(*clave, *fila) for clave, fila in cambios.items() if fila is not None]
+        )
+
+
+class _Temporizadores:
+    def __init__(self):
+        self._heap: list = []        # (vence, seq, (chat_key, accion))
+        self._armados: dict = {}     # (chat_key, accion) → (seq, vence, args)
+        self._por_chat: dict = {}    # chat_key → set(accion)
+        self._cambios: dict = {}     # pendientes de guardar en la DB
+        self._seq = itertools.count()
+        self._despertar = asyncio.Event()
+        self._app = None
+        self._tareas: list = []
+        self._en_curso: dict = {}    # (chat_key, accion) → tarea ya disparada, en ejecución
+        self.stats = {"disparados": 0, "cancelados": 0, "errores": 0}
+
+    def armar(self, chat_key: str, accion: str, segundos: float, _vence: float = None, **args):
+        """Programa `accion` para dentro de `segundos`; reemplaza la anterior."""
+        clave = (chat_key, accion)
+        vence = _vence if _vence is not None else time.time() + segundos
+        seq   = next(self._seq)
+        self._armados[clave] = (seq, vence, args)
+        self._por_chat.setdefault(chat_key, set()).add(accion)
+        if not self._heap or vence < self._heap[0][0]:
+            self._despertar.set()
+        heapq.heappush(self._heap, (vence, seq, clave))
+        if _vence is None:
+            self._cambios[clave] = (vence, json.dumps(args))
+
+    def _quitar(self, clave) -> bool:
+        if self._armados.pop(clave, None) is None:
+            return False
+        acciones = self._por_chat.get(clave[0])
+        if acciones is not None:
+            acciones.discard(clave[1])
+            if not acciones:
+                del self._por_chat[clave[0]]
+        self._cambios[clave] = None
+        return True
+
+    def _cancelar_en_curso(self, clave) -> bool:
+        """Corta la acción de `clave` si ya se disparó y sigue corriendo (como
+        el task.cancel() de antes), salvo que sea la tarea que llama."""
+        tarea = self._en_curso.get(clave)
+        if tarea is None or tarea is asyncio.current_task():
+            return False
+        tarea.cancel()
+        return True
+
+    def cancelar(self, chat_key: str, *acciones: str):
+        for accion in acciones:
+            quitado = self._quitar((chat_key, accion))
+            cortado = self._cancelar_en_curso((chat_key, accion))
+            if quitado or cortado:
+                self.stats["cancelados"] += 1
+
+    def cancelar_grupo(self, chat_key: str):
+        """Cancela todos los timers de la partida de chat_key, armados o en ejecución."""
+        acciones = set(self._por_chat.get(chat_key, ()))
+        acciones.update(accion for ck, accion in self._en_curso if ck == chat_key)
+        self.cancelar(chat_key, *acciones)
+
+    def armados(self) -> int:
+        return len(self._armados)
+
+    def iniciar(self, app):
+        """Carga los timers guardados y arranca el despachador (post_init)."""
+        self._app = app
+        for chat_key, accion, vence, args in cargar_temporizadores():
+            if accion in _ACCIONES_TIMER:
+                self.armar(chat_key, accion, 0, _vence=vence, **json.loads(args))
+        if self._armados:
+            logger.info(f"[TIMERS] {len(self._armados)} temporizadores restaurados")
+        self._tareas = [asyncio.create_task(self._despachar()),
+                        asyncio.create_task(self._persistir_periodico())]
+
+    async def _despachar(self):
+        while True:
+            self._despertar.clear()
+            ahora = time.time()
+            while self._heap and self._heap[0][0] <= ahora:
+                _vence, seq, clave = heapq.heappop(self._heap)
+                entrada = self._armados.get(clave)
+                if entrada is None or entrada[0] != seq:
+                    continue   # cancelado o re-armado
+                self._quitar(clave)
+                self._disparar(clave, entrada[2])
+            # Las entradas canceladas quedan en el heap hasta vencer; si se
+            # acumulan muchas se reconstruye
+            if len(self._heap) > 2 * len(self._armados) + 64:
+                self._heap = [(v, sq, c) for c, (sq, v, _a) in self._armados.items()]
+                heapq.heapify(self._heap)
+            espera = self._heap[0][0] - ahora if self._heap else None
+            try:
+                await asyncio.wait_for(self._despertar.wait(), espera)
+            except asyncio.TimeoutError:
+                pass
+
+    def _disparar(self, clave, args: dict):
+        self.stats["disparados"] += 1
+        tarea = asyncio.create_task(self._ejecutar(clave, args))
+        self._en_curso[clave] = tarea
+        tarea.add_done_callback(functools.partial(self._terminada, clave))
+
+    def _terminada(self, clave, tarea):
+        if self._en_curso.get(clave) is tarea:
+            del self._en_curso[clave]
+
+    async def _ejecutar(self, clave, args: dict):
+        chat_key, accion = clave
+        try:
+            await _ACCIONES_TIMER[accion](chat_key, ctx=CallbackContext(self._app), **args)
+        except Exception as e:
+            self.stats["errores"] += 1
+            logger.error(f"[TIMERS] {accion} en {chat_key}: {e}", exc_info=True)
+
+    def guardar_pendientes(self):
+        cambios, self._cambios = self._cambios, {}
+        if cambios:
+            guardar_temporizadores(cambios)
+
+    async def _persistir_periodico(self):
+        while True:
+            await asyncio.sleep(TIMERS_PERSISTIR_SEGUNDOS)
+            if self._cambios:
+                cambios, self._cambios = self._cambios, {}
+                try:
+                    await db(guardar_temporizadores, cambios)
+                except Exception as e:
+                    logger.error(f"[TIMERS] error guardando: {e}")
+                    # Reintentar en la próxima vuelta sin pisar cambios más nuevos
+                    self._cambios = {**cambios, **self._cambios}
+
+
+TIMERS = _Temporizadores()
+
+
+async def _post_init(app):
+    """Tareas de arranque: limpiar partidas colgadas y precalentar pistas."""
+    await _limpiar_partidas_zombies(app)
+    TIMERS.iniciar(app)
+    asyncio.create_task(_checkpoint_wal_periodico())
+    asyncio.create_task(_checkpoint_partidas_periodico())
+    asyncio.create_task(_gi_flush_grupos_periodico())
+    # Fuentes y workers de render en segundo plano, no en el camino del arranque
+    asyncio.create_task(_preparar_fuentes())
+    app.bot_data["tarea_precalentado"] = asyncio.create_task(_precalentar_pistas())
+
+
+def terminar_partidas_zombies(claves_reanudadas: set) -> list:
+    """Marca como terminadas las partidas activas que no se reanudaron y borra
+    su snapshot y timers. Retorna [(chat_key, chat_id)] para avisar en el grupo."""
     with get_conn() as conn:
-        zombies = conn.execute(
-            "SELECT chat_key, chat_id FROM partidas WHERE estado IN ({})".format(
-                ",".join("?" * len(estados_activos))
-            ),
-            estados_activos
-        ).fetchall()
-        if zombies:
-            conn.execute(
-                "UPDATE partidas SET estado='terminada' WHERE estado IN ({})".format(
-                    ",".join("?" * len(estados_activos))
+        zombies = [
+            (chat_key, chat_id) for chat_key, chat_id in conn.execute(
+                "SELECT chat_key, chat_id FROM partidas WHERE estado IN ({})".format(
+                    ",".join("?" * len(_ESTADOS_ACTIVOS))
                 ),
-                estados_activos
-            )
+                _ESTADOS_ACTIVOS
+            ).fetchall()
+            if chat_key not in claves_reanudadas
+        ]
+        claves = [(chat_key,) for chat_key, _ in zombies]
+        conn.executemany("UPDATE partidas SET estado='terminada' WHERE chat_key=?", claves)
+        conn.executemany("DELETE FROM partidas_snapshot WHERE chat_key=?", claves)
+        conn.executemany("DELETE FROM temporizadores WHERE chat_key=?", claves)
+    return zombies
+
+async def _limpiar_partidas_zombies(app):
+    """Al arrancar, reanuda las partidas que tienen snapshot y marca como
+    terminadas las demás que quedaron activas tras el reinicio. Notifica en
+    el grupo."""
+    reanudadas = await db(reanudar_partidas)
+    claves_reanudadas = {chat_key for chat_key, _ in reanudadas}
+    zombies = await db(terminar_partidas_zombies, claves_reanudadas)
+    for chat_key, chat_id in reanudadas:
+        try:
+            if get_idioma(chat_key) == "es":
+                msg = "♻️ El bot se reinició\\. La partida sigue donde había quedado\\."
+            else:
+                msg = "♻️ The bot restarted\\. The game continues where it left off\\."
+            await app.bot.send_message(chat_id, msg, parse_mode="MarkdownV2",
+                                       message_thread_id=get_thread_id(chat_key))
+        except Exception as e:
+            logger.warning(f"[ZOMBIE] No se pudo notificar {chat_key}: {e}")
+    if reanudadas:
+        logger.info(f"[ZOMBIE] {len(reanudadas)} partidas reanudadas")
     for chat_key, chat_id in zombies:
         try:
             thread_id = get_thread_id(chat_key)
@@ -5171,11 +6815,7 @@ async def _limpiar_partidas_zombies(app):
         logger.info(f"[ZOMBIE] {len(zombies)} partidas zombie limpiadas")
 
     # Restaurar tareas de countdown para programas pendientes
-    pendientes = []
-    with get_conn() as conn:
-        pendientes = conn.execute(
-            "SELECT * FROM programacion WHERE estado='pendiente'"
-        ).fetchall()
+    pendientes = await db(get_programas_pendientes)
     now_ts = int(datetime.now(_tz.utc).timestamp())
     for prog in pendientes:
         prog_id   = prog[0]
@@ -5188,8 +6828,7 @@ async def _limpiar_partidas_zombies(app):
         msg_id_   = prog[7]
         if hora_ts_ <= now_ts:
             # Pasó mientras el bot estaba caído → iniciar ahora
-            with get_conn() as conn:
-                conn.execute("UPDATE programacion SET estado='activa' WHERE id=?", (prog_id,))
+            await db(set_estado_programa, prog_id, "activa")
             asyncio.create_task(
                 _iniciar_partida_programada(chat_key_, chat_id_, thread_id_, puntos_, tz_, msg_id_, app.bot, app.bot_data)
             )
@@ -5202,10 +6841,7 @@ async def _limpiar_partidas_zombies(app):
             logger.info(f"[PROGRAMA] Countdown restaurado {chat_key_} ({len(pendientes)} programas)")
 
         # ── Restaurar rondas activas de GI (relanzar tareas sin cerrarlas) ──
-    with get_conn() as conn:
-        gi_rondas_activas = conn.execute(
-            "SELECT id, chat_key, chat_id FROM gi_rondas WHERE estado='activa'"
-        ).fetchall()
+    gi_rondas_activas = await db(gi_listar_rondas_activas)
     for r in gi_rondas_activas:
         try:
             tarea_gi_r = asyncio.create_task(
@@ -5217,16 +6853,12 @@ async def _limpiar_partidas_zombies(app):
             logger.warning(f"[IDOL] No se pudo restaurar ronda {r[0]}: {e}")
 
     # ── Restaurar countdowns de GI pendientes ──
-    with get_conn() as conn:
-        gi_pendientes_prog = conn.execute(
-            "SELECT * FROM gi_programacion WHERE estado='pendiente'"
-        ).fetchall()
+    gi_pendientes_prog = await db(gi_get_programas_pendientes)
     now_gi = int(datetime.now(_tz.utc).timestamp())
     for gp in gi_pendientes_prog:
         # gi_programacion: id(0) idol_name(1) file_id(2) file_id_reveal(3) hint1(4) hint2(5) hint3(6) inicio_ts(7) fin_ts(8) tz_offset(9) estado(10)
         if gp[7] <= now_gi:
-            with get_conn() as conn:
-                conn.execute("UPDATE gi_programacion SET estado='activa' WHERE id=?", (gp[0],))
+            await db(gi_set_estado_programa, gp[0], "activa")
             asyncio.create_task(_gi_countdown(gp[0], app.bot, app.bot_data))
             logger.info(f"[IDOL] Countdown atrasado restaurado prog_id={gp[0]}")
         else:
@@ -5360,7 +6992,7 @@ def gi_get_temporada(chat_key: str) -> int:
 def gi_get_division(chat_key: str, user_id: int) -> int:
     """Retorna la división del jugador (1 o 2). Si no existe, devuelve 2 (nueva incorporación)."""
     temporada = gi_get_temporada(chat_key)
-    with get_conn() as conn:
+    with get_conn_lectura() as conn:
         row = conn.execute(
             "SELECT division FROM gi_marcador WHERE chat_key=? AND user_id=?",
             (chat_key, user_id)
@@ -5373,7 +7005,7 @@ def gi_get_division(chat_key: str, user_id: int) -> int:
 
 def gi_segunda_existe(chat_key: str) -> bool:
     """Retorna True si ya existe segunda división en este grupo."""
-    with get_conn() as conn:
+    with get_conn_lectura() as conn:
         row = conn.execute(
             "SELECT COUNT(*) FROM gi_marcador WHERE chat_key=? AND division=2",
             (chat_key,)
@@ -5385,56 +7017,193 @@ def gi_grupo_activo(chat_id: int) -> bool:
     """Retorna True si el juego GI está activo en este grupo.
     NULL se trata como activo (1) para grupos registrados antes del toggle.
     """
-    with get_conn() as conn:
-        row = conn.execute(
-            "SELECT COALESCE(gi_activo, 1) FROM gi_grupos WHERE chat_id=?", (chat_id,)
-        ).fetchone()
-    return row[0] != 0 if row else True
+    activo = _gi_activo_cache.get(chat_id)
+    if activo is not None:
+        CACHE_STATS["gi_activo"]["hit"] += 1
+        return activo
+    with _cache_lock:
+        CACHE_STATS["gi_activo"]["miss"] += 1
+        with get_conn_lectura() as conn:
+            row = conn.execute(
+                "SELECT COALESCE(gi_activo, 1) FROM gi_grupos WHERE chat_id=?", (chat_id,)
+            ).fetchone()
+        activo = row[0] != 0 if row else True
+        _gi_activo_cache[chat_id] = activo
+    return activo
+
+
+def gi_grupos_activos() -> set:
+    """chat_id de todos los grupos con GI activo, en una sola consulta.
+    De paso deja cargada la cache de gi_grupo_activo."""
+    with get_conn_lectura() as conn:
+        rows = conn.execute("SELECT chat_id, COALESCE(gi_activo, 1) FROM gi_grupos").fetchall()
+    with _cache_lock:
+        for chat_id, activo in rows:
+            _gi_activo_cache[chat_id] = activo != 0
+    return {chat_id for chat_id, activo in rows if activo != 0}
 
 
 def gi_toggle_grupo(chat_id: int) -> bool:
     """Alterna el estado GI del grupo. Retorna el nuevo estado (True=activo)."""
     actual = gi_grupo_activo(chat_id)
     nuevo  = 0 if actual else 1
-    with get_conn() as conn:
-        # Forzar escritura explícita del valor (reemplaza NULL si existía)
-        conn.execute(
-            "UPDATE gi_grupos SET gi_activo=? WHERE chat_id=?", (nuevo, chat_id)
-        )
-        # Si no existía la fila (raro), asegurarse de que quede en DB
-        conn.execute(
-            "UPDATE gi_grupos SET gi_activo=1 WHERE chat_id=? AND gi_activo IS NULL",
-            (chat_id,)
-        )
-    return bool(nuevo)
-
-
-def gi_registrar_grupo(chat_id: int, chat_title: str, chat_key: str):
-    try:
-        # Siempre guardar el chat_key raíz (sin topic) para que la normalización funcione
-        chat_key_root = str(chat_id)
+    with _cache_lock:
         with get_conn() as conn:
-            # INSERT OR IGNORE preserva gi_activo y chat_key si el grupo ya existía
+            # Forzar escritura explícita del valor (reemplaza NULL si existía)
             conn.execute(
-                "INSERT OR IGNORE INTO gi_grupos (chat_id, chat_title, chat_key, gi_activo, ultimo_msg) VALUES (?,?,?,0,CURRENT_TIMESTAMP)",
-                (chat_id, chat_title or "?", chat_key_root)
+                "UPDATE gi_grupos SET gi_activo=? WHERE chat_id=?", (nuevo, chat_id)
             )
-            # Actualizar solo título y timestamp — NO tocar chat_key ni gi_activo
+            # Si no existía la fila (raro), asegurarse de que quede en DB
             conn.execute(
-                "UPDATE gi_grupos SET chat_title=?, ultimo_msg=CURRENT_TIMESTAMP WHERE chat_id=?",
-                (chat_title or "?", chat_id)
+                "UPDATE gi_grupos SET gi_activo=1 WHERE chat_id=? AND gi_activo IS NULL",
+                (chat_id,)
+            )
+        _gi_activo_cache.pop(chat_id, None)
+    return bool(nuevo)
+
+
+# ── Registro de grupos (último mensaje) ──
+# handle_adivinanza ve todos los mensajes de texto: en lugar de una
+# transacción por mensaje, se acumula (título, hora) por grupo y se vuelca
+# todo junto cada GI_VISTOS_FLUSH_SEGUNDOS y al apagar. Solo los grupos que
+# aún no están en gi_grupos se insertan en el momento (gi_insertar_grupo),
+# para que gi_grupo_activo y /grupos los vean desde el primer mensaje.
+GI_VISTOS_FLUSH_SEGUNDOS = 30
+_gi_vistos: dict = {}          # chat_id → (título, timestamp)
+_gi_vistos_lock = threading.Lock()
+_gi_grupos_conocidos = None    # chat_id ya presentes en gi_grupos (se carga en el primer gi_insertar_grupo)
+GI_VISTOS_STATS = {"flushes": 0, "grupos": 0, "max_lote": 0, "ms_total": 0.0, "ms_max": 0.0}
+
+def _fecha_utc(ts: float) -> str:
+    return datetime.fromtimestamp(ts, _tz.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+def gi_registrar_grupo(chat_id: int, chat_title: str) -> bool:
+    """Anota que el grupo tuvo actividad; se escribe en el próximo flush.
+    Retorna True si el grupo puede no estar en gi_grupos todavía: el
+    llamador lo inserta ya con gi_insertar_grupo."""
+    with _gi_vistos_lock:
+        _gi_vistos[chat_id] = (chat_title or "?", time.time())
+    return _gi_grupos_conocidos is None or chat_id not in _gi_grupos_conocidos
+
+def gi_insertar_grupo(chat_id: int, chat_title: str):
+    """Inserta un grupo recién visto (entra con GI desactivado) y deja la
+    cache de gi_grupo_activo en línea con la fila."""
+    global _gi_grupos_conocidos
+    if _gi_grupos_conocidos is None:
+        with get_conn_lectura() as conn:
+            _gi_grupos_conocidos = {r[0] for r in conn.execute("SELECT chat_id FROM gi_grupos")}
+    if chat_id in _gi_grupos_conocidos:
+        return
+    with _cache_lock:
+        with get_conn() as conn:
+            # Siempre guardar el chat_key raíz (sin topic) para que la normalización funcione
+            insertado = conn.execute(
+                "INSERT OR IGNORE INTO gi_grupos (chat_id, chat_title, chat_key, gi_activo, ultimo_msg) "
+                "VALUES (?,?,?,0,?)",
+                (chat_id, chat_title or "?", str(chat_id), _fecha_utc(time.time()))
+            ).rowcount
+        if insertado:
+            _gi_activo_cache[chat_id] = False
+        else:
+            _gi_activo_cache.pop(chat_id, None)
+    _gi_grupos_conocidos.add(chat_id)
+
+def gi_flush_grupos() -> int:
+    """Actualiza título y último mensaje de los grupos acumulados con un
+    executemany en una transacción. Retorna cuántos grupos se escribieron."""
+    with _gi_vistos_lock:
+        lote = list(_gi_vistos.items())
+        _gi_vistos.clear()
+    if not lote:
+        return 0
+    inicio = time.perf_counter()
+    try:
+        with transaccion() as conn:
+            # Solo título y timestamp — NO tocar chat_key ni gi_activo
+            conn.executemany(
+                "UPDATE gi_grupos SET chat_title=?, ultimo_msg=? WHERE chat_id=?",
+                [(titulo, _fecha_utc(ts), chat_id) for chat_id, (titulo, ts) in lote]
             )
     except Exception:
-        pass
+        # Devolver el lote sin pisar lo que llegó mientras tanto
+        with _gi_vistos_lock:
+            for chat_id, datos in lote:
+                _gi_vistos.setdefault(chat_id, datos)
+        raise
+    ms = (time.perf_counter() - inicio) * 1000
+    GI_VISTOS_STATS["flushes"]  += 1
+    GI_VISTOS_STATS["grupos"]   += len(lote)
+    GI_VISTOS_STATS["max_lote"]  = max(GI_VISTOS_STATS["max_lote"], len(lote))
+    GI_VISTOS_STATS["ms_total"] += ms
+    GI_VISTOS_STATS["ms_max"]    = max(GI_VISTOS_STATS["ms_max"], ms)
+    return len(lote)
+
+async def _gi_flush_grupos_periodico():
+    while True:
+        await asyncio.sleep(GI_VISTOS_FLUSH_SEGUNDOS)
+        if _gi_vistos:
+            try:
+                await db(gi_flush_grupos)
+            except Exception as e:
+                logger.warning(f"[IDOL] flush de grupos falló: {e}")
 
 def gi_get_grupos() -> list:
-    with get_conn() as conn:
+    with get_conn_lectura() as conn:
         return conn.execute(
             "SELECT chat_id, chat_title, chat_key FROM gi_grupos ORDER BY ultimo_msg DESC"
         ).fetchall()
 
+# ── Índice de rondas GI activas ──
+# handle_adivinanza lo consulta antes de ir a la DB; se carga la primera vez
+# y se mantiene al insertar y al cerrar rondas (gi_ronda_abierta / gi_ronda_cerrada).
+_gi_rondas_activas = None      # ronda_id → (chat_key, chat_id)
+_gi_chats_con_ronda: dict = {} # chat_key o chat_id → cantidad de rondas activas
+_gi_rondas_lock = threading.Lock()
+
+def gi_listar_rondas_activas() -> list:
+    with get_conn_lectura() as conn:
+        return conn.execute("SELECT id, chat_key, chat_id FROM gi_rondas WHERE estado='activa'").fetchall()
+
+def _gi_indexar(ronda_id, chat_key, chat_id):
+    _gi_rondas_activas[ronda_id] = (chat_key, chat_id)
+    for clave in (chat_key, chat_id):
+        _gi_chats_con_ronda[clave] = _gi_chats_con_ronda.get(clave, 0) + 1
+
+def _gi_cargar_rondas_activas():
+    global _gi_rondas_activas
+    with _gi_rondas_lock:
+        if _gi_rondas_activas is not None:
+            return
+        filas = gi_listar_rondas_activas()
+        _gi_rondas_activas = {}
+        _gi_chats_con_ronda.clear()
+        for ronda_id, chat_key, chat_id in filas:
+            _gi_indexar(ronda_id, chat_key, chat_id)
+
+def gi_ronda_abierta(ronda_id: int, chat_key: str, chat_id: int):
+    _gi_cargar_rondas_activas()
+    with _gi_rondas_lock:
+        if ronda_id not in _gi_rondas_activas:
+            _gi_indexar(ronda_id, chat_key, chat_id)
+
+def gi_ronda_cerrada(ronda_id: int):
+    _gi_cargar_rondas_activas()
+    with _gi_rondas_lock:
+        datos = _gi_rondas_activas.pop(ronda_id, None)
+        for clave in datos or ():
+            restantes = _gi_chats_con_ronda.get(clave, 0) - 1
+            if restantes > 0:
+                _gi_chats_con_ronda[clave] = restantes
+            else:
+                _gi_chats_con_ronda.pop(clave, None)
+
+def gi_hay_ronda(chat_key: str, chat_id: int = None) -> bool:
+    if _gi_rondas_activas is None:
+        _gi_cargar_rondas_activas()
+    return chat_key in _gi_chats_con_ronda or (chat_id is not None and chat_id in _gi_chats_con_ronda)
+
 def gi_get_ronda_activa(chat_key: str, chat_id: int = None):
-    with get_conn() as conn:
+    with get_conn_lectura() as conn:
         row = conn.execute(
             "SELECT * FROM gi_rondas WHERE chat_key=? AND estado='activa' ORDER BY id DESC LIMIT 1",
             (chat_key,)
@@ -5448,8 +7217,53 @@ def gi_get_ronda_activa(chat_key: str, chat_id: int = None):
             ).fetchone()
         return row
 
-def gi_get_participante(ronda_id: int, user_id: int):
+def gi_get_ronda(ronda_id: int, solo_activa: bool = False):
+    sql = "SELECT * FROM gi_rondas WHERE id=?" + (" AND estado='activa'" if solo_activa else "")
+    with get_conn_lectura() as conn:
+        return conn.execute(sql, (ronda_id,)).fetchone()
+
+def gi_ronda_sigue_activa(ronda_id: int) -> bool:
+    with get_conn_lectura() as conn:
+        row = conn.execute("SELECT estado FROM gi_rondas WHERE id=?", (ronda_id,)).fetchone()
+    return bool(row) and row[0] == "activa"
+
+def gi_set_pista(ronda_id: int, pistas_dadas: int, puntos: int):
+    with get_conn() as conn:
+        conn.execute(
+            "UPDATE gi_rondas SET pistas_dadas=?, puntos_actuales=? WHERE id=?",
+            (pistas_dadas, puntos, ronda_id)
+        )
+
+def gi_set_mensaje_ronda(ronda_id: int, mensaje_id: int):
     with get_conn() as conn:
+        conn.execute("UPDATE gi_rondas SET mensaje_id=? WHERE id=?", (mensaje_id, ronda_id))
+
+def gi_terminar_ronda(ronda_id: int, ganador_id: int = None, ganador_nombre: str = None) -> bool:
+    """Cierra la ronda si sigue activa y la saca del índice. Retorna False si
+    ya la había cerrado otro (un acierto, /gicancelar o el fin del tiempo)."""
+    with get_conn() as conn:
+        if ganador_id is None:
+            cur = conn.execute(
+                "UPDATE gi_rondas SET estado='terminada' WHERE id=? AND estado='activa'", (ronda_id,)
+            )
+        else:
+            cur = conn.execute(
+                "UPDATE gi_rondas SET estado='terminada', ganador_id=?, ganador_nombre=? "
+                "WHERE id=? AND estado='activa'",
+                (ganador_id, ganador_nombre, ronda_id)
+            )
+        if cur.rowcount:
+            _pool().al_confirmar(functools.partial(gi_ronda_cerrada, ronda_id))
+    return cur.rowcount > 0
+
+def gi_get_ids_participantes(ronda_id: int) -> list:
+    with get_conn_lectura() as conn:
+        return [uid for (uid,) in conn.execute(
+            "SELECT user_id FROM gi_participantes WHERE ronda_id=?", (ronda_id,)
+        )]
+
+def gi_get_participante(ronda_id: int, user_id: int):
+    with get_conn_lectura() as conn:
         return conn.execute(
             "SELECT * FROM gi_participantes WHERE ronda_id=? AND user_id=?",
             (ronda_id, user_id)
@@ -5487,11 +7301,24 @@ def gi_restar_vida(ronda_id: int, user_id: int) -> int:
         ).fetchone()
     return row[0] if row else 0
 
+def gi_reactivar_participante(ronda_id: int, user_id: int, username: str = None) -> int:
+    """Vuelve a activar a un participante que había salido y retorna sus vidas."""
+    with get_conn() as conn:
+        conn.execute(
+            "UPDATE gi_participantes SET activo=1, username=COALESCE(?, username) WHERE ronda_id=? AND user_id=?",
+            (username, ronda_id, user_id)
+        )
+        row = conn.execute(
+            "SELECT vidas FROM gi_participantes WHERE ronda_id=? AND user_id=?",
+            (ronda_id, user_id)
+        ).fetchone()
+    return row[0] if row else 0
+
 def gi_normalizar_chat_key(chat_key: str) -> str:
     """Convierte cualquier chat_key de topic (-ID_TOPIC) al chat_key raíz registrado en gi_grupos."""
     try:
         chat_id_num = int(chat_key.split("_")[0])
-        with get_conn() as conn:
+        with get_conn_lectura() as conn:
             row = conn.execute(
                 "SELECT chat_key FROM gi_grupos WHERE chat_id=?", (chat_id_num,)
             ).fetchone()
@@ -5502,34 +7329,202 @@ def gi_normalizar_chat_key(chat_key: str) -> str:
     return chat_key
 
 
-def gi_sumar_puntos(chat_key: str, user_id: int, username: str, puntos: int):
-    # Normalizar chat_key para evitar inconsistencias entre topics del mismo foro
-    chat_key = gi_normalizar_chat_key(chat_key)
+def gi_sumar_puntos(chat_key: str, user_id: int, username: str, puntos: int):
+    # Normalizar chat_key para evitar inconsistencias entre topics del mismo foro
+    chat_key = gi_normalizar_chat_key(chat_key)
+    with get_conn() as conn:
+        # INSERT con division correcta (solo aplica si no existe aún)
+        div_actual = gi_get_division(chat_key, user_id)
+        temp_actual = gi_get_temporada(chat_key)
+        conn.execute(
+            "INSERT OR IGNORE INTO gi_marcador (chat_key, user_id, username, puntos, victorias, division, temporada, victorias_temp) VALUES (?,?,?,0,0,?,?,0)",
+            (chat_key, user_id, username, div_actual, temp_actual)
+        )
+        conn.execute(
+            "UPDATE gi_marcador SET puntos=puntos+?, victorias=victorias+1, victorias_temp=victorias_temp+1, username=? WHERE chat_key=? AND user_id=?",
+            (puntos, username, chat_key, user_id)
+        )
+    tocar_version("gi_marcador", chat_key)
+
+def gi_get_marcador(chat_key: str) -> list:
+    with get_conn_lectura() as conn:
+        return conn.execute(
+            "SELECT user_id, username, puntos, victorias FROM gi_marcador WHERE chat_key=? ORDER BY puntos DESC, victorias DESC",
+            (chat_key,)
+        ).fetchall()
+
+def gi_get_marcador_division(chat_key: str, division: int) -> list:
+    with get_conn_lectura() as conn:
+        return conn.execute(
+            "SELECT username, puntos, victorias FROM gi_marcador "
+            "WHERE chat_key=? AND division=? ORDER BY puntos DESC, victorias DESC",
+            (chat_key, division)
+        ).fetchall()
+
+def gi_get_marcador_temporada(chat_key: str) -> list:
+    with get_conn_lectura() as conn:
+        return conn.execute(
+            "SELECT user_id, username, puntos, division, victorias_temp "
+            "FROM gi_marcador WHERE chat_key=? ORDER BY puntos DESC, victorias DESC",
+            (chat_key,)
+        ).fetchall()
+
+def gi_nueva_temporada(chat_key: str, numero: int, a_primera, a_segunda, quedan=()):
+    """Abre la temporada numero: mueve a_primera/a_segunda de división, y a
+    todos (también a los que quedan) les pone los puntos de temporada en cero."""
+    with get_conn() as conn:
+        for division, ids in ((1, a_primera), (2, a_segunda)):
+            conn.executemany(
+                "UPDATE gi_marcador SET division=?, puntos=0, victorias_temp=0, temporada=? WHERE chat_key=? AND user_id=?",
+                [(division, numero, chat_key, uid) for uid in ids]
+            )
+        conn.executemany(
+            "UPDATE gi_marcador SET puntos=0, victorias_temp=0, temporada=? WHERE chat_key=? AND user_id=?",
+            [(numero, chat_key, uid) for uid in quedan]
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO gi_temporada (chat_key, numero, estado) VALUES (?,?,'activa')",
+            (chat_key, numero)
+        )
+    tocar_version("gi_marcador", chat_key)
+
+def gi_borrar_marcador(chat_key: str):
+    with get_conn() as conn:
+        conn.execute("DELETE FROM gi_marcador WHERE chat_key=?", (chat_key,))
+    tocar_version("gi_marcador", chat_key)
+
+def gi_resetear_puntos(chat_key: str) -> int:
+    """Pone en cero puntos y victorias conservando divisiones; retorna cuántos jugadores tocó."""
+    with get_conn() as conn:
+        afectados = conn.execute(
+            "UPDATE gi_marcador SET puntos=0, victorias=0, victorias_temp=0 WHERE chat_key=?",
+            (chat_key,)
+        ).rowcount
+    tocar_version("gi_marcador", chat_key)
+    return afectados
+
+def gi_get_username(chat_key: str, user_id: int):
+    with get_conn_lectura() as conn:
+        row = conn.execute(
+            "SELECT username FROM gi_marcador WHERE chat_key=? AND user_id=?",
+            (chat_key, user_id)
+        ).fetchone()
+    return row[0] if row else None
+
+def gi_buscar_jugador(chat_key: str, busqueda: str):
+    """(user_id, username) por nombre parcial: primero en el marcador del grupo,
+    después en gi_participantes de cualquier chat (la ronda pudo ser en otro
+    contexto) y por último en jugadores del Impostor."""
+    patron = f"%{busqueda}%"
+    with get_conn_lectura() as conn:
+        return (
+            conn.execute(
+                "SELECT user_id, username FROM gi_marcador "
+                "WHERE chat_key=? AND LOWER(username) LIKE LOWER(?) LIMIT 1",
+                (chat_key, patron)
+            ).fetchone()
+            or conn.execute(
+                "SELECT user_id, username FROM gi_participantes "
+                "WHERE LOWER(username) LIKE LOWER(?) LIMIT 1",
+                (patron,)
+            ).fetchone()
+            or conn.execute(
+                "SELECT user_id, username FROM jugadores "
+                "WHERE LOWER(username) LIKE LOWER(?) LIMIT 1",
+                (patron,)
+            ).fetchone()
+        )
+
+def gi_sumar_manual(chat_key: str, user_id: int, username: str, puntos: int, victorias: int):
+    """Suma de /giaddpuntos. Retorna (puntos, victorias) totales del jugador."""
     with get_conn() as conn:
-        # INSERT con division correcta (solo aplica si no existe aún)
-        div_actual = gi_get_division(chat_key, user_id)
+        div_actual  = gi_get_division(chat_key, user_id)
         temp_actual = gi_get_temporada(chat_key)
         conn.execute(
             "INSERT OR IGNORE INTO gi_marcador (chat_key, user_id, username, puntos, victorias, division, temporada, victorias_temp) VALUES (?,?,?,0,0,?,?,0)",
             (chat_key, user_id, username, div_actual, temp_actual)
         )
         conn.execute(
-            "UPDATE gi_marcador SET puntos=puntos+?, victorias=victorias+1, victorias_temp=victorias_temp+1, username=? WHERE chat_key=? AND user_id=?",
-            (puntos, username, chat_key, user_id)
+            "UPDATE gi_marcador SET puntos=puntos+?, victorias=victorias+?, victorias_temp=victorias_temp+? WHERE chat_key=? AND user_id=?",
+            (puntos, victorias, victorias, chat_key, user_id)
         )
+        row = conn.execute(
+            "SELECT puntos, victorias FROM gi_marcador WHERE chat_key=? AND user_id=?",
+            (chat_key, user_id)
+        ).fetchone()
+    tocar_version("gi_marcador", chat_key)
+    return row
 
-def gi_get_marcador(chat_key: str) -> list:
-    with get_conn() as conn:
+def gi_get_titulo_grupo(chat_id: int):
+    with get_conn_lectura() as conn:
+        row = conn.execute("SELECT chat_title FROM gi_grupos WHERE chat_id=?", (chat_id,)).fetchone()
+    return row[0] if row else None
+
+# ── Programación GI ──
+# gi_programacion: id(0) idol_name(1) file_id(2) file_id_reveal(3) hint1(4) hint2(5) hint3(6)
+#                  inicio_ts(7) fin_ts(8) tz_offset(9) estado(10) division(11)
+
+def gi_get_programa(prog_id: int):
+    """Programación pendiente por id, o None si ya se publicó o se canceló."""
+    with get_conn_lectura() as conn:
         return conn.execute(
-            "SELECT user_id, username, puntos, victorias FROM gi_marcador WHERE chat_key=? ORDER BY puntos DESC, victorias DESC",
-            (chat_key,)
+            "SELECT * FROM gi_programacion WHERE id=? AND estado='pendiente'", (prog_id,)
+        ).fetchone()
+
+def gi_get_tz_programa(prog_id: int) -> int:
+    with get_conn_lectura() as conn:
+        row = conn.execute("SELECT tz_offset FROM gi_programacion WHERE id=?", (prog_id,)).fetchone()
+    return row[0] if row else 0
+
+def gi_get_programas_pendientes() -> list:
+    with get_conn_lectura() as conn:
+        return conn.execute("SELECT * FROM gi_programacion WHERE estado='pendiente'").fetchall()
+
+def gi_resumen_programas_pendientes() -> list:
+    """[(id, idol_name, inicio_ts, fin_ts, tz_offset)] por hora de inicio, para el menú del owner."""
+    with get_conn_lectura() as conn:
+        return conn.execute(
+            "SELECT id, idol_name, inicio_ts, fin_ts, tz_offset FROM gi_programacion WHERE estado='pendiente' ORDER BY inicio_ts"
         ).fetchall()
 
+def gi_set_estado_programa(prog_id: int, estado: str):
+    with get_conn() as conn:
+        conn.execute("UPDATE gi_programacion SET estado=? WHERE id=?", (estado, prog_id))
+
+def gi_guardar_programa(setup: dict, prog_id: int = None) -> int:
+    """Crea la programación del setup (o reescribe prog_id si se está editando) y retorna su id."""
+    campos = (setup["idol_name"], setup["file_id"], setup["file_id_reveal"], setup["hint1"],
+              setup["hint2"], setup["hint3"], setup["inicio_ts"], setup["fin_ts"],
+              setup.get("tz_offset", 0), setup.get("division", 1))
+    with get_conn() as conn:
+        if prog_id:
+            conn.execute(
+                "UPDATE gi_programacion SET idol_name=?,file_id=?,file_id_reveal=?,"
+                "hint1=?,hint2=?,hint3=?,inicio_ts=?,fin_ts=?,tz_offset=?,division=?,estado='pendiente' WHERE id=?",
+                campos + (prog_id,)
+            )
+            return prog_id
+        conn.execute(
+            "INSERT INTO gi_programacion (idol_name,file_id,file_id_reveal,hint1,hint2,hint3,inicio_ts,fin_ts,tz_offset,division,estado) "
+            "VALUES (?,?,?,?,?,?,?,?,?,?,'pendiente')",
+            campos
+        )
+        return conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+
 # ── Setup helpers GI ──────────────────────────────────────────
 
 def gi_t(lang: str, key: str) -> str:
     return GI_TEXTOS.get(lang, GI_TEXTOS["es"]).get(key, f"[{key}]")
 
+_GI_PLANTILLAS = _compilar_textos(GI_TEXTOS)
+
+def gi_tf(lang: str, key: str, **campos) -> str:
+    """Igual que gi_t(lang, key).format(**campos), con la plantilla ya compilada."""
+    plantilla = _GI_PLANTILLAS.get(lang, _GI_PLANTILLAS["es"]).get(key)
+    if plantilla is None:
+        return f"[{key}]"
+    return plantilla(**campos)
+
 def gi_build_setup_text(setup: dict, lang: str) -> str:
     no_conf = "❌ _No configurado_" if lang == "es" else "❌ _Not set_"
     tz = setup.get("tz_offset", 0)
@@ -5594,7 +7589,7 @@ def _gi_slots_disponibles() -> list:
     Cada elemento: (ini_h, fin_h, ini_ts, fin_ts, label)
     """
     # Obtener todos los inicio_ts de programaciones pendientes
-    with get_conn() as conn:
+    with get_conn_lectura() as conn:
         ocupados = set(
             row[0] for row in conn.execute(
                 "SELECT inicio_ts FROM gi_programacion WHERE estado='pendiente'"
@@ -5692,13 +7687,13 @@ def gi_build_ronda_caption(chat_key: str, fin_ts: int, puntos: int,
     else:
         lineas = []
         if pistas_dadas >= 1:
-            lineas.append(gi_t(lang, "gi_hint1_reveal").format(hint1=esc(hints["hint1"])))
+            lineas.append(gi_tf(lang, "gi_hint1_reveal", hint1=esc(hints["hint1"])))
         if pistas_dadas >= 2:
-            lineas.append(gi_t(lang, "gi_hint2_reveal").format(hint2=esc(hints["hint2"])))
+            lineas.append(gi_tf(lang, "gi_hint2_reveal", hint2=esc(hints["hint2"])))
         if pistas_dadas >= 3:
-            lineas.append(gi_t(lang, "gi_hint3_reveal").format(hint3=esc(hints["hint3"])))
+            lineas.append(gi_tf(lang, "gi_hint3_reveal", hint3=esc(hints["hint3"])))
         pistas_txt = "\n".join(lineas)
-    return gi_t(lang, "gi_ronda_caption").format(
+    return gi_tf(lang, "gi_ronda_caption",
         fin=esc(fin_str), puntos=puntos, pistas=pistas_txt
     )
 
@@ -5714,11 +7709,7 @@ async def _gi_limpiar_mensajes_ronda(ronda_id: int, chat_id: int, bot, bot_data:
     que el bot envió a los participantes de una ronda.
     Se llama cuando alguien adivina correctamente para limpiar el chat.
     """
-    with get_conn() as conn:
-        participantes = conn.execute(
-            "SELECT user_id FROM gi_participantes WHERE ronda_id=?", (ronda_id,)
-        ).fetchall()
-    for (uid,) in participantes:
+    for uid in await db(gi_get_ids_participantes, ronda_id):
         for key in [
             f"gi_confirm_msg_{uid}_{ronda_id}",
             f"gi_paused_msg_{uid}_{ronda_id}",
@@ -5733,14 +7724,237 @@ async def _gi_limpiar_mensajes_ronda(ronda_id: int, chat_id: int, bot, bot_data:
 
 
 
+# ── Limitador de salida ──
+# Todas las llamadas a la API pasan por acá (Application.rate_limiter). Los
+# envíos y ediciones a un chat esperan turno en una cola única con prioridad:
+# primero los mensajes de juego (turnos, votos, rondas), al final los
+# cosméticos. Un despachador los libera respetando un token bucket global
+# (~30/s de Telegram) y uno por chat (20/min en grupos, ~1/s en privados).
+# Ante un RetryAfter se pausa toda la salida lo que pida Telegram y se
+# reintenta. Las prioridades van en rate_limit_args de cada llamada.
+PRIORIDAD_JUEGO     = 0
+PRIORIDAD_NORMAL    = 1
+PRIORIDAD_COSMETICA = 2
+_NOMBRES_PRIORIDAD  = {PRIORIDAD_JUEGO: "juego", PRIORIDAD_NORMAL: "normal", PRIORIDAD_COSMETICA: "cosmética"}
+
+async def responder(message, texto: str, prioridad: int, do_quote: bool = None, **kwargs):
+    """message.reply_text con prioridad de salida: los atajos de Message no
+    aceptan rate_limit_args, así que se va directo a send_message del bot.
+    Cita el mensaje como reply_text: por defecto en grupos y no en privado
+    (do_quote lo fuerza; un reply_parameters explícito manda sobre ambos)."""
+    if do_quote is None:
+        do_quote = message.chat.type != "private"
+    if do_quote:
+        kwargs.setdefault("reply_parameters", ReplyParameters(message.message_id))
+    return await message.get_bot().send_message(
+        message.chat_id, texto,
+        message_thread_id=message.message_thread_id if message.is_topic_message else None,
+        rate_limit_args=prioridad, **kwargs
+    )
+
+SALIDA_GLOBAL_POR_SEGUNDO = float(os.environ.get("SALIDA_GLOBAL_POR_SEGUNDO", "28"))
+SALIDA_GRUPO   = (20 / 60, 20)   # (por segundo, ráfaga máxima)
+SALIDA_PRIVADO = (1.0, 3)
+SALIDA_REINTENTOS = 3
+# Métodos que cuentan para los límites por chat; el resto (answerCallbackQuery,
+# getChat, deleteMessage…) sale directo.
+_ENDPOINTS_LIMITADOS = ("send", "edit", "copy", "forward")
+# Límites superiores (s) de los tramos del histograma de espera en cola
+_TRAMOS_ESPERA = (0.05, 0.25, 1, 5, 30)
+
+
+class _TokenBucket:
+    """Token bucket: hasta `capacidad` de golpe, se repone a `por_segundo`."""
+
+    def __init__(self, por_segundo: float, capacidad: float = None):
+        self.por_segundo = por_segundo
+        self.capacidad   = capacidad or por_segundo
+        self._tokens     = float(self.capacidad)
+        self._ultimo     = time.monotonic()
+
+    def _reponer(self, ahora: float):
+        self._tokens = min(self.capacidad, self._tokens + (ahora - self._ultimo) * self.por_segundo)
+        self._ultimo = ahora
+
+    def espera(self, ahora: float) -> float:
+        """Segundos hasta que haya un token (0 si ya hay)."""
+        self._reponer(ahora)
+        return 0.0 if self._tokens >= 1 else (1 - self._tokens) / self.por_segundo
+
+    def consumir(self):
+        self._tokens -= 1
+
+    def lleno(self, ahora: float) -> bool:
+        self._reponer(ahora)
+        return self._tokens >= self.capacidad
+
+
+class LimitadorSalida(BaseRateLimiter):
+    """Cola de salida con prioridades y token buckets global y por chat."""
+
+    def __init__(self):
+        self._global = _TokenBucket(SALIDA_GLOBAL_POR_SEGUNDO)
+        self._chats: dict = {}          # chat_id → _TokenBucket
+        self._cola: list = []           # (prioridad, seq, chat_id, future)
+        self._seq = itertools.count()
+        self._pausa_hasta = 0.0
+        self._hay_trabajo = None
+        self._despachador = None
+        self.stats = {
+            "max_cola": 0,
+            "retry_after": 0,
+            "espera": {p: [0] * (len(_TRAMOS_ESPERA) + 1) for p in _NOMBRES_PRIORIDAD},
+        }
+
+    async def initialize(self) -> None:
+        self._hay_trabajo = asyncio.Event()
+        self._despachador = asyncio.create_task(self._despachar())
+
+    async def shutdown(self) -> None:
+        if self._despachador:
+            self._despachador.cancel()
+            await asyncio.gather(self._despachador, return_exceptions=True)
+        for *_, fut in self._cola:
+            fut.cancel()
+        self._cola.clear()
+
+    def en_cola(self) -> int:
+        return len(self._cola)
+
+    def _bucket_chat(self, chat_id) -> _TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            grupo = isinstance(chat_id, str) or chat_id < 0
+            bucket = self._chats[chat_id] = _TokenBucket(*(SALIDA_GRUPO if grupo else SALIDA_PRIVADO))
+        return bucket
+
+    def _purgar_chats(self, ahora: float):
+        """Los buckets llenos no aportan nada: se descartan para no crecer sin fin."""
+        for chat_id in [c for c, b in self._chats.items() if b.lleno(ahora)]:
+            del self._chats[chat_id]
+
+    async def _despachar(self):
+        while True:
+            self._cola = [item for item in self._cola if not item[3].done()]
+            if not self._cola:
+                self._hay_trabajo.clear()
+                if len(self._chats) > 5000:
+                    self._purgar_chats(time.monotonic())
+                await self._hay_trabajo.wait()
+                continue
+            ahora  = time.monotonic()
+            espera = max(self._pausa_hasta - ahora, self._global.espera(ahora))
+            if espera > 0:
+                await asyncio.sleep(espera)
+                continue
+            # El primero (por prioridad y llegada) cuyo chat tenga token
+            elegido, espera_chat = None, 60.0
+            for item in sorted(self._cola):
+                e = self._bucket_chat(item[2]).espera(ahora)
+                if e <= 0:
+                    elegido = item
+                    break
+                espera_chat = min(espera_chat, e)
+            if elegido is None:
+                # Todos esperan a su chat; despertar antes si entra algo nuevo
+                self._hay_trabajo.clear()
+                try:
+                    await asyncio.wait_for(self._hay_trabajo.wait(), espera_chat)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self._cola.remove(elegido)
+            self._global.consumir()
+            self._bucket_chat(elegido[2]).consumir()
+            elegido[3].set_result(None)
+
+    async def _turno(self, chat_id, prioridad: int):
+        fut = asyncio.get_running_loop().create_future()
+        self._cola.append((prioridad, next(self._seq), chat_id, fut))
+        self.stats["max_cola"] = max(self.stats["max_cola"], len(self._cola))
+        self._hay_trabajo.set()
+        inicio = time.monotonic()
+        await fut
+        espera = time.monotonic() - inicio
+        tramo = next((i for i, lim in enumerate(_TRAMOS_ESPERA) if espera <= lim), len(_TRAMOS_ESPERA))
+        self.stats["espera"][prioridad][tramo] += 1
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat_id = data.get("chat_id")
+        if chat_id is None or not endpoint.startswith(_ENDPOINTS_LIMITADOS):
+            return await callback(*args, **kwargs)
+        try:
+            chat_id = int(chat_id)
+        except (TypeError, ValueError):
+            pass   # @canal
+        prioridad = rate_limit_args if rate_limit_args in _NOMBRES_PRIORIDAD else PRIORIDAD_NORMAL
+        for intento in range(SALIDA_REINTENTOS + 1):
+            await self._turno(chat_id, prioridad)
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                self.stats["retry_after"] += 1
+                if intento == SALIDA_REINTENTOS:
+                    raise
+                logger.warning(f"[SALIDA] RetryAfter {e.retry_after}s en {endpoint} chat={chat_id}")
+                self._pausa_hasta = max(self._pausa_hasta, time.monotonic() + float(e.retry_after) + 0.1)
+
+
+_limitador_salida = LimitadorSalida()
+
+
+# ── Broadcast de rondas GI ──
+# El envío a todos los grupos va en paralelo (hasta GI_BROADCAST_CONCURRENCIA
+# a la vez); el ritmo lo pone el limitador de salida.
+GI_BROADCAST_CONCURRENCIA = int(os.environ.get("GI_BROADCAST_CONCURRENCIA", "16"))
+GI_BROADCAST_STATS = {"broadcasts": 0, "ultimo": None}   # ultimo: (grupos, ok, fallos, segundos)
+
+
+async def _gi_broadcast(destinos: list, enviar) -> tuple:
+    """Llama `await enviar(chat_id, chat_key)` para cada (chat_id, chat_key).
+    Retorna (ok, fallos): ok = [(chat_id, chat_key, resultado)],
+    fallos = [(chat_id, chat_key, error)]. Un grupo que falla no frena al resto."""
+    semaforo = asyncio.Semaphore(GI_BROADCAST_CONCURRENCIA)
+    ok, fallos = [], []
+
+    async def _uno(chat_id, chat_key):
+        async with semaforo:
+            try:
+                ok.append((chat_id, chat_key, await enviar(chat_id, chat_key)))
+            except Exception as e:
+                fallos.append((chat_id, chat_key, f"{type(e).__name__}: {e}"))
+
+    inicio = time.monotonic()
+    await asyncio.gather(*(_uno(chat_id, chat_key) for chat_id, chat_key in destinos))
+    duracion = time.monotonic() - inicio
+    GI_BROADCAST_STATS["broadcasts"] += 1
+    GI_BROADCAST_STATS["ultimo"] = (len(destinos), len(ok), len(fallos), duracion)
+    logger.info(f"[IDOL] Broadcast: {len(ok)}/{len(destinos)} grupos en {duracion:.1f}s")
+    for chat_id, chat_key, error in fallos:
+        logger.error(f"[IDOL] Error publicando en {chat_key}: {error}")
+    return ok, fallos
+
+
+def gi_insertar_ronda(prog, chat_id: int, chat_key: str, mensaje_id: int) -> int:
+    """Inserta la ronda de un grupo recién publicado y retorna su id. Se llama
+    apenas sale el envío a ese grupo: si el proceso cae a mitad del broadcast,
+    las rondas ya publicadas quedan en gi_rondas y _post_init las retoma."""
+    division = prog[11] if len(prog) > 11 and prog[11] is not None else 1
+    with transaccion() as conn:
+        cur = conn.execute(
+            "INSERT INTO gi_rondas (prog_id,chat_key,chat_id,idol_name,file_id,file_id_reveal,hint1,hint2,hint3,"
+            "inicio_ts,fin_ts,estado,pistas_dadas,puntos_actuales,mensaje_id,division) VALUES (?,?,?,?,?,?,?,?,?,?,?,'activa',0,5,?,?)",
+            (prog[0], chat_key, chat_id, prog[1], prog[2], prog[3], prog[4], prog[5],
+             prog[6], prog[7], prog[8], mensaje_id, division)
+        )
+        _pool().al_confirmar(functools.partial(gi_ronda_abierta, cur.lastrowid, chat_key, chat_id))
+    return cur.lastrowid
+
+
 async def _gi_countdown(prog_id: int, bot, bot_data: dict):
     """Espera hasta inicio_ts y publica la ronda en todos los grupos."""
     try:
-        with get_conn() as conn:
-            prog = conn.execute(
-                "SELECT * FROM gi_programacion WHERE id=? AND estado='pendiente'",
-                (prog_id,)
-            ).fetchone()
+        prog = await db(gi_get_programa, prog_id)
         if not prog:
             return
         # prog: id(0) idol_name(1) file_id(2) file_id_reveal(3) hint1(4) hint2(5) hint3(6) inicio_ts(7) fin_ts(8) tz_offset(9) estado(10)
@@ -5748,52 +7962,42 @@ async def _gi_countdown(prog_id: int, bot, bot_data: dict):
         if wait > 0:
             await asyncio.sleep(wait)
 
-        with get_conn() as conn:
-            prog = conn.execute(
-                "SELECT * FROM gi_programacion WHERE id=? AND estado='pendiente'",
-                (prog_id,)
-            ).fetchone()
+        prog = await db(gi_get_programa, prog_id)
         if not prog:
             return
 
-        with get_conn() as conn:
-            conn.execute("UPDATE gi_programacion SET estado='activa' WHERE id=?", (prog_id,))
-
-        grupos = gi_get_grupos()
-        hints = {"hint1": prog[4], "hint2": prog[5], "hint3": prog[6]}
+        await db(gi_set_estado_programa, prog_id, "activa")
 
-        for grp in grupos:
-            chat_id  = grp[0]
-            chat_key = grp[2]
-            if not gi_grupo_activo(chat_id):
+        grupos  = await db(gi_get_grupos)
+        activos = await db(gi_grupos_activos)
+        hints   = {"hint1": prog[4], "hint2": prog[5], "hint3": prog[6]}
+        destinos = []
+        for chat_id, _titulo, chat_key in grupos:
+            if chat_id in activos:
+                destinos.append((chat_id, chat_key))
+            else:
                 logger.info(f"[IDOL] Grupo {chat_key} con GI desactivado, saltando")
-                continue
-            lang = get_idioma(chat_key)
-            try:
-                caption  = gi_build_ronda_caption(chat_key, prog[8], 5, 0, hints, prog[9])
-                keyboard = gi_build_ronda_keyboard(lang)
-                msg = await bot.send_photo(
-                    chat_id,
-                    photo=prog[2],
-                    caption=caption,
-                    parse_mode="MarkdownV2",
-                    reply_markup=InlineKeyboardMarkup(keyboard)
-                )
-                with get_conn() as conn:
-                    conn.execute(
-                        "INSERT INTO gi_rondas (prog_id,chat_key,chat_id,idol_name,file_id,file_id_reveal,hint1,hint2,hint3,"
-                        "inicio_ts,fin_ts,estado,pistas_dadas,puntos_actuales,mensaje_id,division) VALUES (?,?,?,?,?,?,?,?,?,?,?,'activa',0,5,?,?)",
-                        (prog_id, chat_key, chat_id, prog[1], prog[2], prog[3], prog[4], prog[5],
-                         prog[6], prog[7], prog[8], msg.message_id,
-                         prog[11] if len(prog) > 11 and prog[11] is not None else 1)
-                    )
-                    ronda_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
 
-                tarea = asyncio.create_task(_gi_ronda_task(chat_key, ronda_id, bot, bot_data))
-                bot_data[f"gi_ronda_{chat_key}"] = tarea
-                logger.info(f"[IDOL] Ronda iniciada en {chat_key}")
-            except Exception as e:
-                logger.error(f"[IDOL] Error publicando en {chat_key}: {e}")
+        async def _publicar(chat_id, chat_key):
+            caption  = gi_build_ronda_caption(chat_key, prog[8], 5, 0, hints, prog[9])
+            keyboard = gi_build_ronda_keyboard(get_idioma(chat_key))
+            msg = await bot.send_photo(
+                chat_id,
+                photo=prog[2],
+                caption=caption,
+                parse_mode="MarkdownV2",
+                reply_markup=InlineKeyboardMarkup(keyboard),
+                rate_limit_args=PRIORIDAD_JUEGO
+            )
+            # Ronda activa y su tarea en cuanto el grupo ve la foto, sin
+            # esperar al resto del broadcast
+            ronda_id = await db(gi_insertar_ronda, prog, chat_id, chat_key, msg.message_id)
+            bot_data[f"gi_ronda_{chat_key}"] = asyncio.create_task(
+                _gi_ronda_task(chat_key, ronda_id, bot, bot_data))
+            return ronda_id
+
+        ok, _fallos = await _gi_broadcast(destinos, _publicar)
+        logger.info(f"[IDOL] Ronda iniciada en {len(ok)} grupos")
 
         bot_data.pop(f"gi_countdown_{prog_id}", None)
 
@@ -5806,8 +8010,7 @@ async def _gi_countdown(prog_id: int, bot, bot_data: dict):
 async def _gi_ronda_task(chat_key: str, ronda_id: int, bot, bot_data: dict):
     """Maneja los intervalos de pistas y el fin de la ronda."""
     try:
-        with get_conn() as conn:
-            ronda_init = conn.execute("SELECT * FROM gi_rondas WHERE id=?", (ronda_id,)).fetchone()
+        ronda_init = await db(gi_get_ronda, ronda_id)
         if not ronda_init:
             return
 
@@ -5823,9 +8026,7 @@ async def _gi_ronda_task(chat_key: str, ronda_id: int, bot, bot_data: dict):
         hints          = {"hint1": ronda_init[7], "hint2": ronda_init[8], "hint3": ronda_init[9]}
         idol_name      = ronda_init[4]
 
-        with get_conn() as conn:
-            prog = conn.execute("SELECT tz_offset FROM gi_programacion WHERE id=?", (ronda_init[1],)).fetchone()
-        tz_offset = prog[0] if prog else 0
+        tz_offset = await db(gi_get_tz_programa, ronda_init[1]) or 0
 
         duracion = fin_ts - inicio_ts
         # 3 pistas en 25%, 50%, 75% del tiempo
@@ -5846,19 +8047,11 @@ async def _gi_ronda_task(chat_key: str, ronda_id: int, bot, bot_data: dict):
             if wait > 0:
                 await asyncio.sleep(wait)
 
-            with get_conn() as conn:
-                ronda_check = conn.execute(
-                    "SELECT estado FROM gi_rondas WHERE id=?", (ronda_id,)
-                ).fetchone()
-            if not ronda_check or ronda_check[0] != 'activa':
+            if not await db(gi_ronda_sigue_activa, ronda_id):
                 return
 
             pistas_dadas = idx + 1
-            with get_conn() as conn:
-                conn.execute(
-                    "UPDATE gi_rondas SET pistas_dadas=?, puntos_actuales=? WHERE id=?",
-                    (pistas_dadas, nuevos_puntos, ronda_id)
-                )
+            await db(gi_set_pista, ronda_id, pistas_dadas, nuevos_puntos)
 
             lang = get_idioma(chat_key)
             caption  = gi_build_ronda_caption(chat_key, fin_ts, nuevos_puntos, pistas_dadas, hints, tz_offset)
@@ -5877,14 +8070,11 @@ async def _gi_ronda_task(chat_key: str, ronda_id: int, bot, bot_data: dict):
                     photo=file_id,
                     caption=caption,
                     parse_mode="MarkdownV2",
-                    reply_markup=InlineKeyboardMarkup(keyboard)
+                    reply_markup=InlineKeyboardMarkup(keyboard),
+                    rate_limit_args=PRIORIDAD_JUEGO
                 )
                 msg_id = nuevo_msg.message_id
-                with get_conn() as conn:
-                    conn.execute(
-                        "UPDATE gi_rondas SET mensaje_id=? WHERE id=?",
-                        (msg_id, ronda_id)
-                    )
+                await db(gi_set_mensaje_ronda, ronda_id, msg_id)
             except Exception as e:
                 logger.error(f"[IDOL] Error publicando pista con imagen {chat_key}: {e}")
 
@@ -5893,18 +8083,11 @@ async def _gi_ronda_task(chat_key: str, ronda_id: int, bot, bot_data: dict):
         if wait_fin > 0:
             await asyncio.sleep(wait_fin)
 
-        with get_conn() as conn:
-            ronda_fin = conn.execute(
-                "SELECT estado FROM gi_rondas WHERE id=?", (ronda_id,)
-            ).fetchone()
-        if not ronda_fin or ronda_fin[0] != 'activa':
+        if not await db(gi_terminar_ronda, ronda_id):
             return  # Alguien ganó mientras esperábamos
 
-        with get_conn() as conn:
-            conn.execute("UPDATE gi_rondas SET estado='terminada' WHERE id=?", (ronda_id,))
-
         lang     = get_idioma(chat_key)
-        txt_fin  = gi_t(lang, "gi_ronda_sin_ganador").format(idol=esc(idol_name))
+        txt_fin  = gi_tf(lang, "gi_ronda_sin_ganador", idol=esc(idol_name))
         # Editar caption de imagen misterio
         try:
             await bot.edit_message_caption(
@@ -5942,7 +8125,97 @@ async def _gi_ronda_task(chat_key: str, ronda_id: int, bot, bot_data: dict):
 
 # ── Comandos GI ───────────────────────────────────────────────
 
+# ── Salud de grupos (/grupos) ──
+# Sondear cada grupo son hasta tres llamadas a la API; se hacen en paralelo
+# con un tope de GI_SONDEO_CONCURRENCIA, respetando RetryAfter, y el
+# resultado se guarda en gi_grupos_health para no repetirlo durante el TTL.
+GI_SONDEO_CONCURRENCIA = 8
+GI_SONDEO_REINTENTOS   = 3
+GI_SALUD_TTL_SEGUNDOS  = 15 * 60
+GI_SONDEO_EDITAR_CADA  = 2.0    # segundos entre ediciones del mensaje de progreso
+GI_SONDEO_MOSTRAR      = 25     # grupos confirmados que lista el progreso (los últimos)
+
+def gi_get_salud(ttl: float = GI_SALUD_TTL_SEGUNDOS) -> dict:
+    """chat_id → (vivo, título, link, puede_escribir) de los sondeos vigentes."""
+    with get_conn_lectura() as conn:
+        filas = conn.execute(
+            "SELECT chat_id, vivo, titulo, link, puede_escribir FROM gi_grupos_health WHERE fecha >= ?",
+            (time.time() - ttl,)
+        ).fetchall()
+    return {f[0]: (bool(f[1]), f[2], f[3], bool(f[4])) for f in filas}
+
+def gi_set_salud(resultados: list):
+    """Guarda los sondeos [(chat_id, vivo, título, link, puede_escribir)] y
+    actualiza los títulos que cambiaron en gi_grupos."""
+    ahora = time.time()
+    with transaccion() as conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO gi_grupos_health (chat_id, vivo, titulo, link, puede_escribir, fecha) "
+            "VALUES (?,?,?,?,?,?)",
+            [(chat_id, int(vivo), titulo, link, int(puede), ahora)
+             for chat_id, vivo, titulo, link, puede in resultados]
+        )
+        conn.executemany(
+            "UPDATE gi_grupos SET chat_title=? WHERE chat_id=? AND chat_title IS NOT ?",
+            [(titulo, chat_id, titulo) for chat_id, vivo, titulo, _, _ in resultados if vivo]
+        )
+
+async def _gi_con_reintentos(llamada):
+    """Ejecuta la llamada a la API; ante RetryAfter espera lo pedido y reintenta."""
+    for intento in range(GI_SONDEO_REINTENTOS):
+        try:
+            return await llamada()
+        except RetryAfter as e:
+            if intento == GI_SONDEO_REINTENTOS - 1:
+                raise
+            logger.warning(f"[IDOL] RetryAfter {e.retry_after}s sondeando grupos")
+            await asyncio.sleep(float(e.retry_after) + 0.1)
+
+def _gi_sin_el_bot(error: Exception) -> bool:
+    """True si el error de get_chat dice con certeza que el bot ya no está en
+    el grupo. Timeouts, errores de red o RetryAfter agotados no lo dicen."""
+    if isinstance(error, Forbidden):
+        return True
+    return isinstance(error, BadRequest) and "chat not found" in str(error).lower()
+
+async def _gi_sondear_grupo(bot, chat_id: int, title: str, sem: asyncio.Semaphore) -> tuple:
+    """(chat_id, vivo, título, link, puede_escribir) de un grupo. vivo es None
+    si no se pudo saber (error transitorio): ese resultado no se guarda."""
+    async with sem:
+        try:
+            chat_obj = await _gi_con_reintentos(lambda: bot.get_chat(chat_id))
+        except Exception as e:
+            if _gi_sin_el_bot(e):
+                return chat_id, False, title, None, False
+            logger.warning(f"[IDOL] no se pudo sondear el grupo {chat_id}: {type(e).__name__}: {e}")
+            return chat_id, None, title, None, False
+        # Bot sigue siendo miembro — obtener link
+        link = None
+        if getattr(chat_obj, "username", None):
+            link = f"https://t.me/{chat_obj.username}"
+        else:
+            try:
+                link = await _gi_con_reintentos(lambda: bot.export_chat_invite_link(chat_id))
+            except Exception:
+                pass
+        # Verificar si el bot puede enviar mensajes
+        puede_escribir = False
+        try:
+            bot_member = await _gi_con_reintentos(lambda: bot.get_chat_member(chat_id, bot.id))
+            if bot_member.status == "administrator":
+                puede_escribir = True
+            elif bot_member.status == "member":
+                perms = getattr(chat_obj, "permissions", None)
+                puede_escribir = perms is None or getattr(perms, "can_send_messages", True)
+        except Exception:
+            puede_escribir = False
+        # Usar el título actualizado de Telegram
+        return chat_id, True, chat_obj.title or title, link, puede_escribir
+
+
 async def gi_cmd_grupos(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    """/grupos [refresh] → grupos donde está el bot. Usa los sondeos guardados
+    de menos de GI_SALUD_TTL_SEGUNDOS salvo con refresh."""
     user = update.effective_user
     if user.id != BOT_OWNER_ID:
         await update.message.reply_text("⚠️ Solo el creador del bot puede usar este comando.")
@@ -5951,59 +8224,59 @@ async def gi_cmd_grupos(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("⚠️ Usa este comando en chat privado con el bot.")
         return
 
-    with get_conn() as conn:
-        gi_rows = conn.execute(
-            "SELECT chat_id, chat_title FROM gi_grupos ORDER BY ultimo_msg DESC"
-        ).fetchall()
-
     seen = {}
-    for chat_id, title in gi_rows:
+    for chat_id, title, _chat_key in await db(gi_get_grupos):
         seen[chat_id] = title or str(chat_id)
 
     if not seen:
         await update.message.reply_text("📭 El bot no ha registrado ningún grupo aún.")
         return
 
-    aviso = await update.message.reply_text("🔍 Verificando grupos...", parse_mode=None)
+    forzar = bool(ctx.args) and ctx.args[0].lower() in ("refresh", "forzar")
+    cache = {} if forzar else await db(gi_get_salud)
+    resultados = [(chat_id,) + cache[chat_id] for chat_id in seen if chat_id in cache]
+    pendientes = [(chat_id, title) for chat_id, title in seen.items() if chat_id not in cache]
 
-    grupos_activos = []
-    grupos_inactivos = []
+    aviso = await update.message.reply_text("🔍 Verificando grupos...", parse_mode=None)
 
-    for chat_id, title in seen.items():
-        try:
-            chat_obj = await ctx.bot.get_chat(chat_id)
-            # Bot sigue siendo miembro — obtener link
-            link = None
-            if getattr(chat_obj, "username", None):
-                link = f"https://t.me/{chat_obj.username}"
-            else:
+    if pendientes:
+        sem = asyncio.Semaphore(GI_SONDEO_CONCURRENCIA)
+        tareas = [asyncio.create_task(_gi_sondear_grupo(ctx.bot, chat_id, title, sem))
+                  for chat_id, title in pendientes]
+        nuevos = []
+        ultima_edicion = time.monotonic()
+        for tarea in asyncio.as_completed(tareas):
+            nuevos.append(await tarea)
+            if time.monotonic() - ultima_edicion >= GI_SONDEO_EDITAR_CADA and len(nuevos) < len(tareas):
+                ultima_edicion = time.monotonic()
+                vivos = [r[2] for r in resultados + nuevos if r[1]]
+                progreso = (f"🔍 Verificando grupos... {len(resultados) + len(nuevos)}/{len(seen)} "
+                            f"({len(vivos)} con el bot)")
+                if vivos:
+                    # Sin parse_mode: los títulos van tal cual
+                    ocultos = len(vivos) - GI_SONDEO_MOSTRAR
+                    progreso += "\n\n" + "\n".join(f"✅ {titulo}" for titulo in vivos[-GI_SONDEO_MOSTRAR:])
+                    if ocultos > 0:
+                        progreso += f"\n… y {ocultos} más"
                 try:
-                    link = await ctx.bot.export_chat_invite_link(chat_id)
+                    await ctx.bot.edit_message_text(
+                        progreso,
+                        chat_id=aviso.chat_id, message_id=aviso.message_id,
+                        rate_limit_args=PRIORIDAD_COSMETICA
+                    )
                 except Exception:
                     pass
-            # Verificar si el bot puede enviar mensajes
-            puede_escribir = False
-            try:
-                bot_member = await ctx.bot.get_chat_member(chat_id, ctx.bot.id)
-                if bot_member.status == "administrator":
-                    puede_escribir = True
-                elif bot_member.status == "member":
-                    perms = getattr(chat_obj, "permissions", None)
-                    puede_escribir = perms is None or getattr(perms, "can_send_messages", True)
-            except Exception:
-                puede_escribir = False
-            # Usar el título actualizado de Telegram
-            title_real = chat_obj.title or title
-            grupos_activos.append((chat_id, title_real, link, puede_escribir))
-            # Actualizar título en DB si cambió
-            if title_real != title:
-                with get_conn() as conn:
-                    conn.execute(
-                        "UPDATE gi_grupos SET chat_title=? WHERE chat_id=?",
-                        (title_real, chat_id)
-                    )
-        except Exception:
-            grupos_inactivos.append((chat_id, title))
+        try:
+            await db(gi_set_salud, [r for r in nuevos if r[1] is not None])
+        except Exception as e:
+            logger.warning(f"[IDOL] no se pudo guardar la salud de grupos: {e}")
+        resultados += nuevos
+        orden = {chat_id: i for i, chat_id in enumerate(seen)}
+        resultados.sort(key=lambda r: orden[r[0]])
+
+    grupos_activos   = [(chat_id, titulo, link, puede) for chat_id, vivo, titulo, link, puede in resultados if vivo]
+    grupos_inactivos = [(chat_id, titulo) for chat_id, vivo, titulo, _, _ in resultados if vivo is False]
+    sin_verificar    = sum(1 for r in resultados if r[1] is None)
 
     try:
         await aviso.delete()
@@ -6011,25 +8284,32 @@ async def gi_cmd_grupos(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         pass
 
     if not grupos_activos:
-        await update.message.reply_text("📭 El bot no está en ningún grupo actualmente.")
+        if sin_verificar:
+            await update.message.reply_text(
+                f"⚠️ No se pudieron verificar {sin_verificar} grupo(s). Intenta /grupos en un momento.")
+        else:
+            await update.message.reply_text("📭 El bot no está en ningún grupo actualmente.")
         return
 
     grupos_activos.sort(key=lambda x: x[1])
 
     # Un solo mensaje con lista + botones por grupo
+    con_gi = await db(gi_grupos_activos)
     lineas = []
     for i, (chat_id, title, link, puede_escribir) in enumerate(grupos_activos, 1):
-        gi_on = gi_grupo_activo(chat_id)
+        gi_on = chat_id in con_gi
         estado_icon = "🎤" if gi_on else "🔇"
         lineas.append(f"  {i}\\. {estado_icon} *{esc(title)}*")
 
     suffix = f"\n_{len(grupos_inactivos)} ya no lo tienen_" if grupos_inactivos else ""
+    if sin_verificar:
+        suffix += f"\n_{sin_verificar} sin verificar, se reintentan en el próximo /grupos_"
     texto = "📋 *El bot está en " + str(len(grupos_activos)) + " grupo\\(s\\):*\n\n" + "\n".join(lineas) + suffix
 
     # Botones: una fila por grupo con sus acciones
     keyboard = []
     for chat_id, title, link, puede_escribir in grupos_activos:
-        gi_on = gi_grupo_activo(chat_id)
+        gi_on = chat_id in con_gi
         toggle_lbl = "🔇" if gi_on else "🎤"
         title_short = title[:20] + "…" if len(title) > 20 else title
         row = []
@@ -6082,22 +8362,17 @@ async def gi_cmd_fintemporada(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("⚠️ Solo el creador del bot puede usar este comando.")
         return
 
-    chat_key = gi_normalizar_chat_key(get_chat_key(update))
+    chat_key = await db(gi_normalizar_chat_key, get_chat_key(update))
     lang     = get_idioma(chat_key)
 
-    with get_conn() as conn:
-        todos = conn.execute(
-            "SELECT user_id, username, puntos, division, victorias_temp "
-            "FROM gi_marcador WHERE chat_key=? ORDER BY puntos DESC, victorias DESC",
-            (chat_key,)
-        ).fetchall()
+    todos = await db(gi_get_marcador_temporada, chat_key)
 
     if not todos:
         await update.message.reply_text("❌ No hay jugadores registrados en este grupo.")
         return
 
-    temporada_actual = gi_get_temporada(chat_key)
-    segunda_existe   = gi_segunda_existe(chat_key)
+    temporada_actual = await db(gi_get_temporada, chat_key)
+    segunda_existe   = await db(gi_segunda_existe, chat_key)
 
     div1 = [(r[0], r[1], r[2], r[4]) for r in todos if r[3] == 1]
     div2 = [(r[0], r[1], r[2], r[4]) for r in todos if r[3] == 2]
@@ -6108,21 +8383,7 @@ async def gi_cmd_fintemporada(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         corte = (n + 1) // 2  # impar → el del medio va a primera
         primera = [r[0] for r in todos[:corte]]
         segunda = [r[0] for r in todos[corte:]]
-        with get_conn() as conn:
-            for uid in primera:
-                conn.execute(
-                    "UPDATE gi_marcador SET division=1, puntos=0, victorias_temp=0, temporada=? WHERE chat_key=? AND user_id=?",
-                    (temporada_actual + 1, chat_key, uid)
-                )
-            for uid in segunda:
-                conn.execute(
-                    "UPDATE gi_marcador SET division=2, puntos=0, victorias_temp=0, temporada=? WHERE chat_key=? AND user_id=?",
-                    (temporada_actual + 1, chat_key, uid)
-                )
-            conn.execute(
-                "INSERT OR REPLACE INTO gi_temporada (chat_key, numero, estado) VALUES (?,?,'activa')",
-                (chat_key, temporada_actual + 1)
-            )
+        await db(gi_nueva_temporada, chat_key, temporada_actual + 1, primera, segunda)
         nombres_primera = ", ".join(r[1] for r in todos[:corte])
         nombres_segunda = ", ".join(r[1] for r in todos[corte:])
         texto = (
@@ -6155,30 +8416,11 @@ async def gi_cmd_fintemporada(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     div2_sorted = sorted(div2, key=lambda r: r[2], reverse=True)
     suben       = [r[0] for r in div2_sorted[:suben_n]]
 
-    with get_conn() as conn:
-        for uid in bajan:
-            conn.execute(
-                "UPDATE gi_marcador SET division=2, puntos=0, victorias_temp=0, temporada=? WHERE chat_key=? AND user_id=?",
-                (temporada_actual + 1, chat_key, uid)
-            )
-        for uid in suben:
-            conn.execute(
-                "UPDATE gi_marcador SET division=1, puntos=0, victorias_temp=0, temporada=? WHERE chat_key=? AND user_id=?",
-                (temporada_actual + 1, chat_key, uid)
-            )
-        # Los que se quedan: solo resetear puntos
-        todos_ids = set(r[0] for r in todos)
-        movidos   = set(bajan + suben)
-        quedan    = todos_ids - movidos
-        for uid in quedan:
-            conn.execute(
-                "UPDATE gi_marcador SET puntos=0, victorias_temp=0, temporada=? WHERE chat_key=? AND user_id=?",
-                (temporada_actual + 1, chat_key, uid)
-            )
-        conn.execute(
-            "INSERT OR REPLACE INTO gi_temporada (chat_key, numero, estado) VALUES (?,?,'activa')",
-            (chat_key, temporada_actual + 1)
-        )
+    # Los que se quedan: solo resetear puntos
+    todos_ids = set(r[0] for r in todos)
+    movidos   = set(bajan + suben)
+    quedan    = todos_ids - movidos
+    await db(gi_nueva_temporada, chat_key, temporada_actual + 1, suben, bajan, quedan)
 
     def nombres(ids):
         mapping = {r[0]: r[1] for r in todos}
@@ -6243,33 +8485,37 @@ def _calcular_zonas_giscore(rows_div1: list, rows_div2: list) -> tuple:
     return ids_descenso, ids_ascenso
 
 
-def generar_imagen_giscore(chat_key: str, division: int):
-    """Genera imagen PNG del marcador de Adivina la Idol para una división."""
-    try:
-        with get_conn() as conn:
-            # Traer victorias_temp para calcular zonas
-            rows = conn.execute(
-                "SELECT user_id, username, puntos, victorias, COALESCE(victorias_temp,0) FROM gi_marcador "
-                "WHERE chat_key=? AND COALESCE(division,1)=? ORDER BY puntos DESC, victorias DESC",
-                (chat_key, division)
-            ).fetchall()
-            # Para calcular zonas necesitamos ambas divisiones
-            rows_div1 = conn.execute(
-                "SELECT user_id, username, puntos, victorias, COALESCE(victorias_temp,0) FROM gi_marcador "
-                "WHERE chat_key=? AND COALESCE(division,1)=1 ORDER BY puntos DESC, victorias DESC",
-                (chat_key,)
-            ).fetchall()
-            rows_div2 = conn.execute(
-                "SELECT user_id, username, puntos, victorias, COALESCE(victorias_temp,0) FROM gi_marcador "
-                "WHERE chat_key=? AND division=2 ORDER BY puntos DESC, victorias DESC",
-                (chat_key,)
-            ).fetchall()
+def _datos_giscore(chat_key: str, division: int):
+    """Filas de la división y zonas de descenso/ascenso; None si está vacía."""
+    with get_conn_lectura() as conn:
+        # Traer victorias_temp para calcular zonas
+        rows = conn.execute(
+            "SELECT user_id, username, puntos, victorias, COALESCE(victorias_temp,0) FROM gi_marcador "
+            "WHERE chat_key=? AND division=? ORDER BY puntos DESC, victorias DESC",
+            (chat_key, division)
+        ).fetchall()
+        # Para calcular zonas necesitamos ambas divisiones
+        rows_div1 = conn.execute(
+            "SELECT user_id, username, puntos, victorias, COALESCE(victorias_temp,0) FROM gi_marcador "
+            "WHERE chat_key=? AND division=1 ORDER BY puntos DESC, victorias DESC",
+            (chat_key,)
+        ).fetchall()
+        rows_div2 = conn.execute(
+            "SELECT user_id, username, puntos, victorias, COALESCE(victorias_temp,0) FROM gi_marcador "
+            "WHERE chat_key=? AND division=2 ORDER BY puntos DESC, victorias DESC",
+            (chat_key,)
+        ).fetchall()
 
-        if not rows:
-            return None
+    if not rows:
+        return None
+    ids_descenso, ids_ascenso = _calcular_zonas_giscore(rows_div1, rows_div2)
+    return rows, ids_descenso, ids_ascenso
 
-        ids_descenso, ids_ascenso = _calcular_zonas_giscore(rows_div1, rows_div2)
 
+def _dibujar_giscore(lang, division, rows, ids_descenso, ids_ascenso):
+    """Dibuja el marcador de Adivina la Idol de una división y devuelve los
+    bytes PNG (o None). No toca la DB: corre dentro de los workers de render."""
+    try:
         FONT_SIZE  = 22
         font       = _get_font(FONT_SIZE)
         font_bold  = _get_font(FONT_SIZE, bold=True)
@@ -6295,7 +8541,6 @@ def generar_imagen_giscore(chat_key: str, division: int):
         ASCENSO_C   = (100, 220, 130)  # texto verde — ascenso
         div_color   = DIV1_C if division == 1 else DIV2_C
 
-        lang = get_idioma(chat_key)
         div_label = ("1a Division" if division == 1 else "2a Division") if lang == "es"                     else ("1st Division" if division == 1 else "2nd Division")
         col_pts = "Pts"
         col_vic = "Vic" if lang == "es" else "W"
@@ -6363,10 +8608,9 @@ def generar_imagen_giscore(chat_key: str, division: int):
 
         buf = io.BytesIO()
         img.save(buf, format="PNG")
-        buf.seek(0)
-        return buf
+        return buf.getvalue()
     except Exception as e:
-        logger.error(f"[generar_imagen_giscore] error: {e}")
+        logger.error(f"[_dibujar_giscore] error: {e}")
         return None
 
 
@@ -6378,16 +8622,12 @@ async def gi_cmd_score(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     segunda  = gi_segunda_existe(chat_key)
 
     async def _enviar_division(div: int):
-        buf = generar_imagen_giscore(chat_key, div)
-        if buf:
-            await update.message.reply_photo(photo=buf)
-        else:
-            with get_conn() as conn:
-                rows = conn.execute(
-                    "SELECT username, puntos, victorias FROM gi_marcador "
-                    "WHERE chat_key=? AND COALESCE(division,1)=? ORDER BY puntos DESC, victorias DESC",
-                    (chat_key, div)
-                ).fetchall()
+        enviada = await enviar_imagen_cacheada(
+            update.message.reply_photo, clave_imagen("giscore", chat_key, div),
+            lambda: render_giscore(chat_key, div)
+        )
+        if not enviada:
+            rows = await db(gi_get_marcador_division, chat_key, div)
             if not rows:
                 div_lbl = ("Primera División" if div == 1 else "Segunda División") if lang == "es" \
                           else ("First Division" if div == 1 else "Second Division")
@@ -6419,10 +8659,9 @@ async def gi_cmd_reset(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     if user.id != BOT_OWNER_ID:
         await update.message.reply_text("⚠️ Solo el creador del bot puede resetear el marcador.")
         return
-    chat_key = gi_normalizar_chat_key(get_chat_key(update))
+    chat_key = await db(gi_normalizar_chat_key, get_chat_key(update))
     lang = get_idioma(chat_key)
-    with get_conn() as conn:
-        conn.execute("DELETE FROM gi_marcador WHERE chat_key=?", (chat_key,))
+    await db(gi_borrar_marcador, chat_key)
     await update.message.reply_text(gi_t(lang, "gi_reset_ok"), parse_mode="MarkdownV2")
 
 
@@ -6433,13 +8672,9 @@ async def gi_cmd_reset_puntos(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     if user.id != BOT_OWNER_ID:
         await update.message.reply_text("⚠️ Solo el creador del bot puede usar este comando.")
         return
-    chat_key = gi_normalizar_chat_key(get_chat_key(update))
+    chat_key = await db(gi_normalizar_chat_key, get_chat_key(update))
     lang = get_idioma(chat_key)
-    with get_conn() as conn:
-        affected = conn.execute(
-            "UPDATE gi_marcador SET puntos=0, victorias=0, victorias_temp=0 WHERE chat_key=?",
-            (chat_key,)
-        ).rowcount
+    affected = await db(gi_resetear_puntos, chat_key)
     if lang == "es":
         msg = f"🔄 *Puntos reseteados\\.*\n\n_{affected} jugador\\(es\\) afectado\\(s\\)\\. Divisiones conservadas\\._"
     else:
@@ -6456,7 +8691,7 @@ async def gi_cmd_addpuntos(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("\u26a0\ufe0f Solo el creador del bot puede usar este comando.")
         return
 
-    chat_key = gi_normalizar_chat_key(get_chat_key(update))
+    chat_key = await db(gi_normalizar_chat_key, get_chat_key(update))
     args = ctx.args or []
 
     if len(args) < 3:
@@ -6488,43 +8723,11 @@ async def gi_cmd_addpuntos(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         busqueda = args[0].lstrip("@")
         if busqueda.isdigit():
             target_id = int(busqueda)
-            with get_conn() as conn:
-                row = conn.execute(
-                    "SELECT username FROM gi_marcador WHERE chat_key=? AND user_id=?",
-                    (chat_key, target_id)
-                ).fetchone()
-            target_name = row[0] if row else str(target_id)
+            target_name = await db(gi_get_username, chat_key, target_id) or str(target_id)
         else:
-            with get_conn() as conn:
-                # Buscar primero en gi_marcador
-                row = conn.execute(
-                    "SELECT user_id, username FROM gi_marcador "
-                    "WHERE chat_key=? AND LOWER(username) LIKE LOWER(?) LIMIT 1",
-                    (chat_key, f"%{busqueda}%")
-                ).fetchone()
+            row = await db(gi_buscar_jugador, chat_key, busqueda)
             if row:
                 target_id, target_name = row[0], row[1]
-            else:
-                # Fallback: buscar en gi_participantes sin filtrar por chat_key
-                # (el chat_key puede no coincidir si la ronda fue en otro contexto)
-                with get_conn() as conn:
-                    row = conn.execute(
-                        "SELECT user_id, username FROM gi_participantes "
-                        "WHERE LOWER(username) LIKE LOWER(?) LIMIT 1",
-                        (f"%{busqueda}%",)
-                    ).fetchone()
-                if row:
-                    target_id, target_name = row[0], row[1]
-                else:
-                    # Último recurso: buscar en jugadores del Impostor
-                    with get_conn() as conn:
-                        row = conn.execute(
-                            "SELECT user_id, username FROM jugadores "
-                            "WHERE LOWER(username) LIKE LOWER(?) LIMIT 1",
-                            (f"%{busqueda}%",)
-                        ).fetchone()
-                    if row:
-                        target_id, target_name = row[0], row[1]
 
     if target_id is None:
         await update.message.reply_text(
@@ -6533,21 +8736,7 @@ async def gi_cmd_addpuntos(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         )
         return
 
-    div_actual  = gi_get_division(chat_key, target_id)
-    temp_actual = gi_get_temporada(chat_key)
-    with get_conn() as conn:
-        conn.execute(
-            "INSERT OR IGNORE INTO gi_marcador (chat_key, user_id, username, puntos, victorias, division, temporada, victorias_temp) VALUES (?,?,?,0,0,?,?,0)",
-            (chat_key, target_id, target_name, div_actual, temp_actual)
-        )
-        conn.execute(
-            "UPDATE gi_marcador SET puntos=puntos+?, victorias=victorias+?, victorias_temp=victorias_temp+? WHERE chat_key=? AND user_id=?",
-            (puntos_add, victorias_add, victorias_add, chat_key, target_id)
-        )
-        row = conn.execute(
-            "SELECT puntos, victorias FROM gi_marcador WHERE chat_key=? AND user_id=?",
-            (chat_key, target_id)
-        ).fetchone()
+    row = await db(gi_sumar_manual, chat_key, target_id, target_name, puntos_add, victorias_add)
 
     total_pts = row[0] if row else "?"
     total_vic = row[1] if row else "?"
@@ -6562,14 +8751,13 @@ async def gi_cmd_cancelar(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     if user.id != BOT_OWNER_ID:
         await update.message.reply_text("⚠️ Solo el creador del bot puede cancelar una ronda.")
         return
-    chat_key = gi_normalizar_chat_key(get_chat_key(update))
+    chat_key = await db(gi_normalizar_chat_key, get_chat_key(update))
     lang  = get_idioma(chat_key)
-    ronda = gi_get_ronda_activa(chat_key)
+    ronda = await db(gi_get_ronda_activa, chat_key)
     if not ronda:
         await update.message.reply_text(gi_t(lang, "gi_no_ronda"), parse_mode="MarkdownV2")
         return
-    with get_conn() as conn:
-        conn.execute("UPDATE gi_rondas SET estado='terminada' WHERE id=?", (ronda[0],))
+    await db(gi_terminar_ronda, ronda[0])
     tarea = ctx.bot_data.pop(f"gi_ronda_{chat_key}", None)
     if tarea:
         tarea.cancel()
@@ -6588,12 +8776,9 @@ async def gi_btn_cancelar_prog(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 
     prog_id = int(query.data.split(":")[2])
 
-    with get_conn() as conn:
-        prog = conn.execute(
-            "SELECT idol_name, estado FROM gi_programacion WHERE id=?", (prog_id,)
-        ).fetchone()
+    prog = await db(gi_get_programa, prog_id)
 
-    if not prog or prog[1] != 'pendiente':
+    if not prog:
         await query.answer("Esta programación ya no está pendiente.", show_alert=True)
         try:
             await query.message.delete()
@@ -6606,16 +8791,12 @@ async def gi_btn_cancelar_prog(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     if tarea:
         tarea.cancel()
 
-    with get_conn() as conn:
-        conn.execute("UPDATE gi_programacion SET estado='cancelada' WHERE id=?", (prog_id,))
+    await db(gi_set_estado_programa, prog_id, "cancelada")
 
-    await query.answer(f"✅ Cancelado: {prog[0]}", show_alert=True)
+    await query.answer(f"✅ Cancelado: {prog[1]}", show_alert=True)
 
     # Actualizar el mensaje: quitar el botón de la programación cancelada
-    with get_conn() as conn:
-        pendientes = conn.execute(
-            "SELECT id, idol_name, inicio_ts, fin_ts, tz_offset FROM gi_programacion WHERE estado='pendiente' ORDER BY inicio_ts"
-        ).fetchall()
+    pendientes = await db(gi_resumen_programas_pendientes)
 
     if not pendientes:
         try:
@@ -6656,11 +8837,7 @@ async def owner_btn_msg_grupo(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     chat_id_dest = int(query.data.split(":")[2])
     ctx.bot_data[f"owner_msg_destino_{user.id}"] = chat_id_dest
 
-    with get_conn() as conn:
-        row = conn.execute(
-            "SELECT chat_title FROM gi_grupos WHERE chat_id=?", (chat_id_dest,)
-        ).fetchone()
-    nombre_grupo = row[0] if row else str(chat_id_dest)
+    nombre_grupo = await db(gi_get_titulo_grupo, chat_id_dest) or str(chat_id_dest)
 
     await query.answer()
     linea1 = "\U0001f4dd Escribe el mensaje para *" + esc(nombre_grupo) + "*\\.\\n\\n"
@@ -6721,10 +8898,7 @@ async def gi_btn_editprog(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 
     prog_id = int(query.data.split(":")[2])
 
-    with get_conn() as conn:
-        prog = conn.execute(
-            "SELECT * FROM gi_programacion WHERE id=? AND estado='pendiente'", (prog_id,)
-        ).fetchone()
+    prog = await db(gi_get_programa, prog_id)
 
     if not prog:
         await query.answer("Esta programación ya no está pendiente.", show_alert=True)
@@ -6819,11 +8993,7 @@ async def gi_btn_reanudar(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     chat_key = get_chat_key(update)
 
     # Verificar que la ronda sigue activa
-    with get_conn() as conn:
-        ronda = conn.execute(
-            "SELECT estado FROM gi_rondas WHERE id=?", (ronda_id,)
-        ).fetchone()
-    if not ronda or ronda[0] != 'activa':
+    if not await db(gi_ronda_sigue_activa, ronda_id):
         await query.answer("La ronda ya terminó.", show_alert=True)
         try:
             await query.message.delete()
@@ -6832,16 +9002,7 @@ async def gi_btn_reanudar(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         return
 
     # Reactivar participante en DB
-    with get_conn() as conn:
-        conn.execute(
-            "UPDATE gi_participantes SET activo=1 WHERE ronda_id=? AND user_id=?",
-            (ronda_id, user.id)
-        )
-        part = conn.execute(
-            "SELECT vidas FROM gi_participantes WHERE ronda_id=? AND user_id=?",
-            (ronda_id, user.id)
-        ).fetchone()
-    vidas = part[0] if part else 0
+    vidas = await db(gi_reactivar_participante, ronda_id, user.id)
 
     # Limpiar tracking del mensaje pausado
     ctx.bot_data.pop(f"gi_paused_msg_{user.id}_{ronda_id}", None)
@@ -6854,7 +9015,7 @@ async def gi_btn_reanudar(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 
     # Popup con vidas restantes — igual que el rejoin desde la foto principal
     lang = get_idioma(chat_key)
-    msg_rejoin = gi_t(lang, "gi_rejoin").format(vidas=vidas)
+    msg_rejoin = gi_tf(lang, "gi_rejoin", vidas=vidas)
     await query.answer(msg_rejoin, show_alert=True)
 
 
@@ -6977,7 +9138,7 @@ async def gi_btn_setup(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         }
         lang_preview = lang
         fin_str = _formato_hora_local(fin_ts, tz)
-        cap = gi_t(lang_preview, "gi_ronda_caption").format(
+        cap = gi_tf(lang_preview, "gi_ronda_caption",
             fin=esc(fin_str), puntos=5, pistas=gi_t(lang_preview, "gi_sin_pistas")
         )
         try:
@@ -6998,7 +9159,7 @@ async def gi_btn_setup(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
             return
         idol   = setup.get("idol_name") or "???"
         puntos = 5
-        txt_rev = gi_t(lang, "gi_ganador").format(
+        txt_rev = gi_tf(lang, "gi_ganador",
             nombre=esc("Tú"),
             idol=esc(idol),
             puntos=puntos
@@ -7031,36 +9192,18 @@ async def gi_btn_setup(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
             msg = "⚠️ La hora de fin debe ser después del inicio." if lang == "es" else "⚠️ End time must be after start time."
             await query.answer(msg, show_alert=True)
             return
-        grupos = gi_get_grupos()
+        grupos = await db(gi_get_grupos)
         if not grupos:
             msg = "⚠️ No hay grupos registrados." if lang == "es" else "⚠️ No registered groups."
             await query.answer(msg, show_alert=True)
             return
 
         editing_id = setup.get("editing_prog_id")
-        div_prog = setup.get("division", 1)
-        with get_conn() as conn:
-            if editing_id:
-                conn.execute(
-                    "UPDATE gi_programacion SET idol_name=?,file_id=?,file_id_reveal=?,"
-                    "hint1=?,hint2=?,hint3=?,inicio_ts=?,fin_ts=?,tz_offset=?,division=?,estado='pendiente' WHERE id=?",
-                    (setup["idol_name"], setup["file_id"], setup["file_id_reveal"], setup["hint1"],
-                     setup["hint2"], setup["hint3"], setup["inicio_ts"], setup["fin_ts"],
-                     setup.get("tz_offset", 0), div_prog, editing_id)
-                )
-                prog_id = editing_id
-                old_task = ctx.bot_data.pop(f"gi_countdown_{prog_id}", None)
-                if old_task:
-                    old_task.cancel()
-            else:
-                conn.execute(
-                    "INSERT INTO gi_programacion (idol_name,file_id,file_id_reveal,hint1,hint2,hint3,inicio_ts,fin_ts,tz_offset,division,estado) "
-                    "VALUES (?,?,?,?,?,?,?,?,?,?,'pendiente')",
-                    (setup["idol_name"], setup["file_id"], setup["file_id_reveal"], setup["hint1"],
-                     setup["hint2"], setup["hint3"], setup["inicio_ts"], setup["fin_ts"],
-                     setup.get("tz_offset", 0), div_prog)
-                )
-                prog_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+        if editing_id:
+            old_task = ctx.bot_data.pop(f"gi_countdown_{editing_id}", None)
+            if old_task:
+                old_task.cancel()
+        prog_id = await db(gi_guardar_programa, setup, editing_id)
 
         await query.answer()
         try:
@@ -7114,7 +9257,7 @@ async def gi_btn_participar(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     action   = query.data   # "gi:participar" or "gi:salir"
 
     chat_id_gi = update.effective_chat.id if update.effective_chat else None
-    ronda = gi_get_ronda_activa(chat_key, chat_id_gi)
+    ronda = await db(gi_get_ronda_activa, chat_key, chat_id_gi)
     if not ronda:
         await query.answer(gi_t(lang, "gi_no_ronda").replace("\\.", ".").replace("\\", ""), show_alert=True)
         return
@@ -7124,12 +9267,12 @@ async def gi_btn_participar(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 
     # Verificar división del jugador vs división de la ronda
     div_ronda = ronda[18] if len(ronda) > 18 and ronda[18] else 1
-    if action == "gi:participar" and gi_segunda_existe(chat_key):
-        div_jugador = gi_get_division(chat_key, user.id)
+    if action == "gi:participar" and await db(gi_segunda_existe, chat_key):
+        div_jugador = await db(gi_get_division, chat_key, user.id)
         if div_jugador != div_ronda:
             nombre_div = ("Primera División" if div_ronda == 1 else "Segunda División") if lang == "es" \
                          else ("First Division" if div_ronda == 1 else "Second Division")
-            msg_div = gi_t(lang, "gi_div_incorrecta").format(div=nombre_div)
+            msg_div = gi_tf(lang, "gi_div_incorrecta", div=nombre_div)
             # Quitar escapes de MarkdownV2 para show_alert (Telegram no acepta MD aquí)
             msg_div_plain = msg_div.replace("\\.", ".").replace("\\", "")
             await query.answer(msg_div_plain, show_alert=True)
@@ -7145,17 +9288,13 @@ async def gi_btn_participar(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         action = "gi:salir"  # Normalizar para el resto del handler
 
     if action == "gi:participar":
-        participante = gi_get_participante(ronda_id, user.id)
+        participante = await db(gi_get_participante, ronda_id, user.id)
         if participante:
             if participante[6]:  # ya activo
                 await query.answer(gi_t(lang, "gi_ya_participa"), show_alert=True)
                 return
             # Existía pero salió → reactivar conservando las vidas que tenía
-            with get_conn() as conn:
-                conn.execute(
-                    "UPDATE gi_participantes SET activo=1, username=? WHERE ronda_id=? AND user_id=?",
-                    (nombre(user), ronda_id, user.id)
-                )
+            await db(gi_reactivar_participante, ronda_id, user.id, nombre(user))
             # Borrar el mensaje pausado del chat ahora que el usuario vuelve a participar
             chat_id_rej = update.effective_chat.id if update.effective_chat else None
             paused_msg = ctx.bot_data.pop(f"gi_paused_msg_{user.id}_{ronda_id}", None)
@@ -7165,18 +9304,18 @@ async def gi_btn_participar(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
                 except Exception:
                     pass  # Ya borrado o expirado — ignorar
             vidas_restantes = participante[5]  # vidas actuales del participante
-            msg_rejoin = gi_t(lang, "gi_rejoin").format(vidas=vidas_restantes)
+            msg_rejoin = gi_tf(lang, "gi_rejoin", vidas=vidas_restantes)
             await query.answer(msg_rejoin, show_alert=True)
             return
-        gi_upsert_participante(ronda_id, chat_key, user.id, nombre(user))
+        await db(gi_upsert_participante, ronda_id, chat_key, user.id, nombre(user))
         await query.answer(gi_t(lang, "gi_unido"), show_alert=True)
 
     elif action == "gi:salir":
-        participante = gi_get_participante(ronda_id, user.id)
+        participante = await db(gi_get_participante, ronda_id, user.id)
         if not participante or not participante[6]:
             await query.answer(gi_t(lang, "gi_no_participa"), show_alert=True)
             return
-        gi_desactivar_participante(ronda_id, user.id)
+        await db(gi_desactivar_participante, ronda_id, user.id)
         # Editar los botones del mensaje de confirmación a estado "pausado"
         # El callback incluye user_id y ronda_id para verificar ownership y poder reanudar
         try:
@@ -7221,10 +9360,7 @@ async def gi_btn_confirmar(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         await query.answer()
         return
 
-    with get_conn() as conn:
-        ronda = conn.execute(
-            "SELECT * FROM gi_rondas WHERE id=? AND estado='activa'", (ronda_id,)
-        ).fetchone()
+    ronda = await db(gi_get_ronda, ronda_id, solo_activa=True)
 
     if not ronda:
         await query.answer("La ronda ya terminó.", show_alert=True)
@@ -7248,19 +9384,16 @@ async def gi_btn_confirmar(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 
     if normalizar(respuesta) == normalizar(idol_name):
         # ¡CORRECTO! — limpiar todos los mensajes de la ronda antes de anunciar
-        with get_conn() as conn:
-            conn.execute(
-                "UPDATE gi_rondas SET estado='terminada', ganador_id=?, ganador_nombre=? WHERE id=?",
-                (user.id, nombre(user), ronda_id)
-            )
+        if not await db(gi_terminar_ronda, ronda_id, user.id, nombre(user)):
+            return  # otro acierto o el fin del tiempo la cerró mientras tanto
         tarea = ctx.bot_data.pop(f"gi_ronda_{chat_key}", None)
         if tarea:
             tarea.cancel()
         # Limpiar mensajes de confirmación y vidas de todos los participantes
         await _gi_limpiar_mensajes_ronda(ronda_id, chat_id, ctx.bot, ctx.bot_data)
-        gi_sumar_puntos(chat_key, user.id, nombre(user), puntos_actuales)
+        await db(gi_sumar_puntos, chat_key, user.id, nombre(user), puntos_actuales)
 
-        txt_ganador = gi_t(lang, "gi_ganador").format(
+        txt_ganador = gi_tf(lang, "gi_ganador",
             nombre=esc(nombre(user)), idol=esc(idol_name), puntos=puntos_actuales
         )
         try:
@@ -7296,12 +9429,12 @@ async def gi_btn_confirmar(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         vidas = gi_restar_vida(ronda_id, user.id)
         if vidas <= 0:
             gi_desactivar_participante(ronda_id, user.id)
-            txt_elim = gi_t(lang, "gi_eliminado").format(nombre=esc(nombre(user)))
+            txt_elim = gi_tf(lang, "gi_eliminado", nombre=esc(nombre(user)))
             msg_lives = await ctx.bot.send_message(chat_id, txt_elim, parse_mode="MarkdownV2")
             # El mensaje de eliminación queda permanente hasta que alguien adivine
             ctx.bot_data[f"gi_lives_msg_{user.id}_{ronda_id}"] = msg_lives.message_id
         else:
-            txt_mal = gi_t(lang, "gi_incorrecto").format(vidas=vidas)
+            txt_mal = gi_tf(lang, "gi_incorrecto", vidas=vidas)
             msg_lives = await ctx.bot.send_message(chat_id, txt_mal, parse_mode="MarkdownV2")
             ctx.bot_data[f"gi_lives_msg_{user.id}_{ronda_id}"] = msg_lives.message_id
 
@@ -7378,10 +9511,7 @@ async def gi_cmd_cancelar_prog(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("⚠️ Usa este comando en chat privado con el bot.")
         return
 
-    with get_conn() as conn:
-        pendientes = conn.execute(
-            "SELECT id, idol_name, inicio_ts, fin_ts, tz_offset FROM gi_programacion WHERE estado='pendiente' ORDER BY inicio_ts"
-        ).fetchall()
+    pendientes = await db(gi_resumen_programas_pendientes)
 
     if not pendientes:
         await update.message.reply_text("📭 No hay programaciones pendientes\\.", parse_mode="MarkdownV2")
@@ -7417,18 +9547,14 @@ async def gi_btn_preguntar_cancelar_prog(update: Update, ctx: ContextTypes.DEFAU
 
     prog_id = int(query.data.split(":")[2])
 
-    with get_conn() as conn:
-        prog = conn.execute(
-            "SELECT idol_name, inicio_ts, tz_offset FROM gi_programacion WHERE id=? AND estado='pendiente'",
-            (prog_id,)
-        ).fetchone()
+    prog = await db(gi_get_programa, prog_id)
 
     if not prog:
         await query.answer("Esta programación ya no está pendiente.", show_alert=True)
         return
 
-    idol_name = prog[0]
-    ini_str   = _formato_fecha_hora_local(prog[1], prog[2] or 0)
+    idol_name = prog[1]
+    ini_str   = _formato_fecha_hora_local(prog[7], prog[9] or 0)
 
     await query.answer()
 
@@ -7476,18 +9602,14 @@ async def gi_btn_volver_prog(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 
     prog_id = int(query.data.split(":")[2])
 
-    with get_conn() as conn:
-        prog = conn.execute(
-            "SELECT idol_name FROM gi_programacion WHERE id=? AND estado='pendiente'",
-            (prog_id,)
-        ).fetchone()
+    prog = await db(gi_get_programa, prog_id)
 
     await query.answer()
 
     if not prog:
         return
 
-    idol_name = prog[0]
+    idol_name = prog[1]
     markup = query.message.reply_markup
     if not markup:
         return
@@ -7524,14 +9646,52 @@ async def _shutdown(app):
     if tasks:
         await asyncio.gather(*tasks, return_exceptions=True)
     logger.info(f"[SHUTDOWN] {len(tasks)} tareas canceladas")
+    # Cada paso por separado: un error de DB en uno no debe saltarse el cierre
+    for paso in (TIMERS.guardar_pendientes,
+                 lambda: guardar_partidas_sucias(*snapshots_cambiados()),
+                 gi_flush_grupos):
+        try:
+            paso()
+        except Exception as e:
+            logger.error(f"[SHUTDOWN] error guardando pendientes: {e}", exc_info=True)
+    cerrar_render()
+    _DB_EXECUTOR.shutdown(wait=True)
+    cerrar_db()
+
+
+async def _marcar_primer_update(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    """Mide el tiempo desde main() hasta el primer update atendido."""
+    if ARRANQUE_STATS["primer_update_ms"] is None:
+        ARRANQUE_STATS["primer_update_ms"] = (time.monotonic() - ARRANQUE_STATS["inicio"]) * 1000
+        logger.info(f"[ARRANQUE] primer update a los {ARRANQUE_STATS['primer_update_ms']:.0f} ms "
+                    f"(fuentes {'listas' if _fuentes_listas else 'cargando'})")
+
+
+async def _precargar_partida(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    """Antes de comandos y botones, carga en un hilo de db() el EstadoPartida
+    del chat si no está en memoria, para que juego() en los handlers no haga
+    SQL en el event loop. Los textos libres no lo necesitan: solo importan
+    con partida activa, y esas nunca se desalojan."""
+    if update.effective_chat is None:
+        return
+    mensaje = update.message
+    if not (update.callback_query or (mensaje and mensaje.text and mensaje.text.startswith("/"))):
+        return
+    chat_key = get_chat_key(update)
+    if chat_key not in _partidas:
+        await db(juego, chat_key)
 
 
 def main():
+    ARRANQUE_STATS["inicio"] = time.monotonic()
     init_db()
-    _init_fonts()
+    auditar_consultas()
 
-    app = Application.builder().token(TOKEN).post_init(_limpiar_partidas_zombies).post_stop(_shutdown).build()
+    app = (Application.builder().token(TOKEN).rate_limiter(_limitador_salida)
+           .post_init(_post_init).post_stop(_shutdown).build())
 
+    app.add_handler(TypeHandler(Update, _marcar_primer_update), group=-2)
+    app.add_handler(TypeHandler(Update, _precargar_partida), group=-1)
     app.add_handler(CommandHandler("start",         cmd_start))
     app.add_handler(CommandHandler("playimpostor", cmd_nueva))
     app.add_handler(CommandHandler("join",        cmd_unirse))
@@ -7545,11 +9705,14 @@ def main():
     app.add_handler(CommandHandler("language",        cmd_idioma))
     app.add_handler(CommandHandler("program",             cmd_program))
     app.add_handler(CommandHandler("rivalidad",          cmd_rivalidad))
+    app.add_handler(CommandHandler("rivales",            cmd_rivales))
     app.add_handler(CommandHandler("all",               cmd_all))
     app.add_handler(CommandHandler("roles",             cmd_roles))
     app.add_handler(CommandHandler("addword",           cmd_addword))
     app.add_handler(CommandHandler("removeword",        cmd_removeword))
     app.add_handler(CommandHandler("words",             cmd_words))
+    app.add_handler(CommandHandler("pistas",            cmd_pistas))
+    app.add_handler(CommandHandler("stats",             cmd_stats))
     app.add_handler(CommandHandler("grupos",            gi_cmd_grupos))
     app.add_handler(CommandHandler("idol",              gi_cmd_idol))
     app.add_handler(CommandHandler("giscore",           gi_cmd_score))
@@ -0,0 +1,84 @@
+"""
+Puntaje de fin de partida: registrar_fin_partida suma todo o nada y una
+sola vez aunque lleguen varias llamadas a la vez.
+
+Como bench.py, trabaja sobre una base temporal y llama a los helpers de
+bot.py directamente, sin Telegram.
+"""
+
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("ANTHROPIC_API_KEY", "")
+
+import bot
+
+CHAT_KEY    = "-1001"
+IMPOSTOR    = 3
+INCREMENTOS = {
+    1: {"victorias": 1, "victorias_inocente": 1},
+    2: {"victorias": 1, "victorias_inocente": 1},
+    IMPOSTOR: {"derrotas": 1},
+}
+
+
+@pytest.fixture(autouse=True)
+def partida_en_juego(tmp_path):
+    bot.DB_PATH = str(tmp_path / "impostor.db")
+    bot._partidas.clear()
+    bot._partidas_sucias.clear()
+    bot._partidas_activas.clear()
+    bot._roles_nuevos.clear()
+    bot._roles_sucios.clear()
+    bot.init_db()
+    with bot.get_conn() as conn:
+        conn.executemany(
+            "INSERT INTO jugadores (chat_key, user_id, username) VALUES (?,?,?)",
+            [(CHAT_KEY, uid, f"J{uid}") for uid in INCREMENTOS]
+        )
+    bot.crear_partida(CHAT_KEY, -1001, 1)
+    bot.set_partida_jugando(CHAT_KEY, "🐾 Animales", "León", [IMPOSTOR], list(INCREMENTOS))
+    bot.guardar_partidas_sucias()
+    yield
+    bot.cerrar_db()
+
+
+def _contadores():
+    with bot.get_conn_lectura() as conn:
+        jugadores = conn.execute(
+            "SELECT user_id, victorias, derrotas, balance, victorias_inocente FROM jugadores "
+            "WHERE chat_key=? ORDER BY user_id", (CHAT_KEY,)
+        ).fetchall()
+        historial = conn.execute("SELECT COUNT(*) FROM historial WHERE chat_key=?", (CHAT_KEY,)).fetchone()[0]
+    return jugadores, historial
+
+
+def test_transaccion_fallida_no_suma_nada():
+    antes = _contadores()
+    with bot.get_conn() as conn:
+        conn.execute("ALTER TABLE historial RENAME TO historial_fuera")
+    with pytest.raises(Exception):
+        bot.registrar_fin_partida(CHAT_KEY, "grupo", "León", "🐾 Animales", INCREMENTOS)
+    with bot.get_conn() as conn:
+        conn.execute("ALTER TABLE historial_fuera RENAME TO historial")
+
+    assert _contadores() == antes
+    assert bot.juego(CHAT_KEY).estado == "jugando"
+
+
+def test_llamadas_concurrentes_suman_una_vez():
+    with ThreadPoolExecutor(max_workers=8) as ex:
+        filas = list(ex.map(
+            lambda _: bot.registrar_fin_partida(CHAT_KEY, "grupo", "León", "🐾 Animales", INCREMENTOS),
+            range(8)
+        ))
+
+    assert sum(fila is not None for fila in filas) == 1
+    jugadores, historial = _contadores()
+    assert jugadores == [(1, 1, 0, 1, 1), (2, 1, 0, 1, 1), (IMPOSTOR, 0, 1, -1, 0)]
+    assert historial == 1
+    assert bot.juego(CHAT_KEY).estado == "terminada"